@@ -3,20 +3,20 @@ import datetime
 from h5py._hl import attrs
 import numpy as np
 import pickle as pickle
-import matplotlib.pyplot as plt
-import pandas as pd
 import DMCpy
 import os.path
-from DMCpy import InteractiveViewer
 
 import warnings
 
-import copy
+import copy, hashlib
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from DMCpy import _tools
 from DMCpy._tools import KwargChecker, MPLKwargs, roundPower
 from DMCpy import Sample
 from DMCpy.FileStructure import HDFCounts, HDFCountsBG, HDFTranslation, HDFTranslationAlternatives, HDFTranslationDefault, HDFTranslationFunctions
 from DMCpy.FileStructure import HDFInstrumentTranslation, HDFInstrumentTranslationFunctions, extraAttributes, possibleAttributes 
-from DMCpy.FileStructure import HDFTypes, HDFUnits, shallowRead
+from DMCpy.FileStructure import HDFTypes, HDFUnits, shallowRead, readMetadata
 
 
 scanTypes = ['Old Data','Powder','A3']
@@ -46,6 +46,113 @@ def maskFunction(phi,maxAngle=10.0):
     """
     return np.abs(phi)>maxAngle
 
+class CalibrationStore(object):
+    """Detector calibrations kept as memory-mapped arrays indexed by (year, calibration name).
+
+    On first use the pickled calibration tables are converted into one .npy file per calibration,
+    which is then mapped read-only. All data files using the same calibration share the same array.
+    The conversion is redone whenever the calibration tables change. If the folder is not writable
+    the calibrations are kept in memory instead, still shared between data files.
+
+    Kwargs:
+
+        - folder (str): Folder holding the converted calibrations (default None, DMCpy.cacheFolder/calibration)
+
+    """
+    def __init__(self,folder=None):
+        self.folder = folder
+        self._index = None
+        self._arrays = {}
+
+    @property
+    def location(self):
+        if self.folder is None:
+            return os.path.join(DMCpy.cacheFolder,'calibration')
+        return self.folder
+
+    def _fileName(self,year,name):
+        return os.path.join(self.location,'{}_{}.npy'.format(year,str(name).replace(os.sep,'_')))
+
+    def _loadIndex(self):
+        sourceFile = DMCpy.findCalibrationFile()
+        stat = os.stat(sourceFile)
+        source = (os.path.abspath(sourceFile),stat.st_size,stat.st_mtime)
+
+        indexFile = os.path.join(self.location,'index.pickle')
+        try:
+            with open(indexFile,'rb') as f:
+                index = pickle.load(f)
+            if index['source'] == source:
+                return index
+        except (OSError,EOFError,KeyError,pickle.UnpicklingError):
+            pass
+
+        # Convert pickled tables into one file per calibration
+        with open(sourceFile,'rb') as f:
+            calibrationDict = pickle.load(f)
+
+        index = {'source':source,'years':{},'values':{}}
+        try:
+            os.makedirs(self.location,exist_ok=True)
+            writable = True
+        except OSError:
+            writable = False
+
+        for year,yearCalib in calibrationDict.items():
+            index['years'][year] = {'limits':np.asarray(yearCalib['limits']),'names':list(yearCalib['names'])}
+            for name in yearCalib['names']:
+                value = yearCalib[name]
+                if not isinstance(value,np.ndarray): # e.g. no calibration for given period
+                    index['values'][(year,name)] = value
+                    continue
+                if writable:
+                    try: # Write to temporary file and rename to allow simultaneous conversions
+                        fileName = self._fileName(year,name)
+                        tempFile = fileName+'.{}.tmp'.format(os.getpid())
+                        with open(tempFile,'wb') as f:
+                            np.save(f,value)
+                        os.replace(tempFile,fileName)
+                        continue
+                    except OSError:
+                        writable = False
+                value.flags.writeable = False
+                self._arrays[(year,name)] = value
+
+        if writable:
+            try:
+                tempFile = indexFile+'.{}.tmp'.format(os.getpid())
+                with open(tempFile,'wb') as f:
+                    pickle.dump(index,f)
+                os.replace(tempFile,indexFile)
+            except OSError:
+                pass
+        return index
+
+    def limits(self,year):
+        """Return dictionary with 'limits' and 'names' of calibrations for year, or None if year is not covered"""
+        if self._index is None:
+            self._index = self._loadIndex()
+        return self._index['years'].get(year)
+
+    def calibration(self,year,name):
+        """Return read-only calibration array of given year and name"""
+        if self._index is None:
+            self._index = self._loadIndex()
+        key = (year,name)
+        if key in self._index['values']:
+            return self._index['values'][key]
+        if not key in self._arrays:
+            self._arrays[key] = np.load(self._fileName(year,name),mmap_mode='r')
+        return self._arrays[key]
+
+    def clear(self):
+        """Forget index and mapped arrays, e.g. after the calibration tables have been updated"""
+        self._index = None
+        self._arrays = {}
+
+
+calibrationStore = CalibrationStore()
+
 @KwargChecker()
 def findCalibration(fileName):
     """Find detector calibration for specified file
@@ -72,10 +179,10 @@ def findCalibration(fileName):
     # Split name in 'dmcyyyynxxxxxx.hdf'
     year,fileNo = [int(x) for x in fileName[3:].replace('.hdf','').split('n')]
 
-    calibrationDict = DMCpy.calibrationDict
+    yearCalib = calibrationStore.limits(year)
 
     # Calibration files do not cover the wanted year
-    if not year in calibrationDict.keys():
+    if yearCalib is None:
         warnings.warn('Calibration files for year {} (extracted from file name "{}") is'.format(year,fileName)+\
             ' not covered in calibration tables. Please update to newest version by invoking "pip install --upgrade DMCpy"')
         calibration = np.ones_like((128,1152))
@@ -84,8 +191,6 @@ def findCalibration(fileName):
         #raise FileNotFoundError('Calibration files for year {} (extracted from file name "{}") is'.format(year,fileName)+\
         #    ' not covered in calibration tables. Please update to newest version by invoking "pip install --upgrade DMCpy"')
 
-    yearCalib = calibrationDict[year]
-    
     limits = yearCalib['limits']
     
     # Calibration name is index of the last limit below file number
@@ -93,22 +198,297 @@ def findCalibration(fileName):
     
     idx = np.max([idx,0]) # ensure that idx is not negative
     
-    # Calibration is saved in yearCalib with name of calibration file
+    # Calibration is shared read-only between all files using it
     calibrationName = yearCalib['names'][idx]
-    calibration = yearCalib[calibrationName]
+    calibration = calibrationStore.calibration(year,calibrationName)
     return calibration,calibrationName
 
 # Custom class designed to perform a lazy q calculation. Usage:
 # All calculations are needed: q[None]
 # Only a specific slice is needed: q[:10]
+# Blocks of scan steps: for sl,q in q.blocks(10)
+# Rotated into other frame: q.project(ROT,sl), equal to ROT applied to q[sl]
 class lazyQ(object):
-    def __init__(self,rotationMatrix,q_temp):
+    """Lazy evaluation of q for all scan steps from the rotation matrices and the unrotated q
+
+    Args:
+
+        - rotationMatrix (array): Rotation matrices of shape (3,3,steps)
+
+        - q_temp (array): Unrotated q of shape (3,128,1152)
+
+    Kwargs:
+
+        - dtype (numpy.dtype): Type of evaluated q, e.g. np.float32 to half the memory (default None, float64)
+
+        - cache (bool): Keep evaluated slices in qCache, shared between all files and limited by qCache.maxBytes (default True)
+
+    """
+    def __init__(self,rotationMatrix,q_temp,dtype=None,cache=True):
         self.rotationMatrix = rotationMatrix
         self.q_temp = q_temp
-        
+        self.dtype = dtype
+        self.cache = cache
+        self._owner = None
+
+    def __len__(self):
+        return self.rotationMatrix.shape[-1]
+
+    def owner(self):
+        """Key of rotation matrices and unrotated q identifying evaluated slices in qCache"""
+        if self._owner is None or self._owner[0] is not self.rotationMatrix or self._owner[1] is not self.q_temp:
+            self._owner = (self.rotationMatrix,self.q_temp,('lazyQ',arrayKey(self.rotationMatrix),arrayKey(self.q_temp)))
+        return self._owner[2]
+
+    def __getstate__(self): # Key holds references to the arrays and is recalculated when needed
+        state = self.__dict__.copy()
+        state['_owner'] = None
+        return state
+
+    @staticmethod
+    def _key(sl):
+        if sl is None:
+            return ('all',)
+        if isinstance(sl,slice):
+            return ('slice',sl.start,sl.stop,sl.step)
+        if isinstance(sl,(int,np.integer)):
+            return ('index',int(sl))
+        return None # Not memoised
+
+    def _evaluate(self,rotation):
+        q_temp = self.q_temp
+        if not self.dtype is None:
+            rotation = rotation.astype(self.dtype,copy=False)
+            q_temp = q_temp.astype(self.dtype,copy=False)
+        return np.einsum('jki,k...->ji...',rotation,q_temp)
+
     def __getitem__(self,sl=None):
-        return np.einsum('jki,k...->ji...',self.rotationMatrix[:,:,sl].reshape(3,3,-1),self.q_temp)
+        key = self._key(sl)
+        loader = lambda: self._evaluate(self.rotationMatrix[:,:,sl].reshape(3,3,-1))
+        if not self.cache or key is None:
+            return loader()
+        # Evaluated q is read-only as it is shared between callers
+        return qCache.get(self.owner(),(key,None if self.dtype is None else np.dtype(self.dtype).str),loader)
+
+    def blocks(self,steps=1):
+        """Generator of (slice, q) for consecutive blocks of scan steps
+
+        Kwargs:
 
+            - steps (int): Number of scan steps per block (default 1)
+
+        """
+        for start,stop in _tools.arange(0,len(self),steps):
+            sl = slice(start,stop)
+            yield sl,self[sl]
+
+    def project(self,rotation,sl=None):
+        """Return q of slice rotated by rotation, i.e. rotation applied to q[sl], without evaluating q[sl]
+
+        Args:
+
+            - rotation (array): Rotation matrix of shape (3,3)
+
+        Kwargs:
+
+            - sl (slice): Scan steps to be evaluated (default None, all)
+
+        """
+        combined = np.einsum('ij,jkn->ikn',rotation,self.rotationMatrix[:,:,sl].reshape(3,3,-1))
+        return self._evaluate(combined)
+
+    def extremes(self,rotation=None,sl=None,steps=10):
+        """Return minimal and maximal q of slice, optionally rotated by rotation as in project, without evaluating q[sl]
+
+        Kwargs:
+
+            - rotation (array): Rotation matrix of shape (3,3) (default None, no rotation)
+
+            - sl (slice): Scan steps to be evaluated (default None, all)
+
+            - steps (int): Number of scan steps evaluated at once if q has to be evaluated (default 10)
+
+        Returns:
+
+            - extremes (array): Minimal and maximal value of qx, qy, and qz, shape (2,3)
+
+        For rotations around the vertical axis, as in A3 scans, each pixel takes its extreme values in the scan steps
+        closest to the angles given by the pixel and the rotation, and q is only evaluated in these steps. The result is
+        identical to the extremes of the evaluated q.
+
+        """
+        rotationMatrix = self.rotationMatrix[:,:,sl].reshape(3,3,-1)
+        if rotation is None:
+            rotation = np.eye(3)
+            combined = rotationMatrix
+        else:
+            combined = np.einsum('ij,jkn->ikn',rotation,rotationMatrix)
+
+        vertical = np.all(rotationMatrix[2,:2]==0) and np.all(rotationMatrix[:2,2]==0) and np.all(rotationMatrix[2,2]==1)
+        if not vertical: # Evaluate q block by block
+            extremes = []
+            for start,stop in _tools.arange(0,rotationMatrix.shape[-1],steps):
+                q = self._evaluate(combined[:,:,start:stop]).reshape(3,-1)
+                extremes.append([np.min(q,axis=1),np.max(q,axis=1)])
+            return np.array([np.min(extremes,axis=0)[0],np.max(extremes,axis=0)[1]])
+
+        # Pixel at (r cos(phi), r sin(phi), z) is rotated to (r cos(phi+a3), r sin(phi+a3), z) and component i of the
+        # rotated q is r*|rotation[i,:2]|*cos(phi+a3-psi_i) + rotation[i,2]*z. Extremes are found in the steps with
+        # a3 next to psi_i-phi (maximum) and psi_i-phi+pi (minimum) on both sides
+        q_temp = self.q_temp.reshape(3,-1)
+        angles = np.arctan2(rotationMatrix[1,0],rotationMatrix[0,0])
+        order = np.argsort(angles)
+        phi = np.arctan2(q_temp[1],q_temp[0])
+
+        if not self.dtype is None:
+            combined = combined.astype(self.dtype,copy=False)
+            q_temp = q_temp.astype(self.dtype,copy=False)
+
+        extremes = np.empty((2,3),dtype=combined.dtype)
+        for i in range(3):
+            psi = np.arctan2(rotation[i,1],rotation[i,0])
+            for j,offset in enumerate([np.pi,0.0]):
+                target = np.mod(psi+offset-phi+np.pi,2*np.pi)-np.pi
+                position = np.searchsorted(angles[order],target)
+                values = []
+                for candidate in [order[(position-1)%len(order)],order[position%len(order)]]:
+                    values.append(combined[i,0,candidate]*q_temp[0]+combined[i,1,candidate]*q_temp[1]+combined[i,2,candidate]*q_temp[2])
+                extremes[j,i] = np.min(values) if j == 0 else np.max(values)
+        return extremes
+
+
+def _nbytes(item):
+    """Memory footprint of an array or of a tuple/list of arrays"""
+    if isinstance(item,(tuple,list)):
+        return sum([_nbytes(i) for i in item])
+    return getattr(item,'nbytes',0)
+
+
+class ArrayCache(object):
+    """Least recently used cache of read-only arrays limited by a total byte budget.
+
+    Entries are stored by (owner, name), where owner is typically the full path of a data file
+    and name the hdf path of the array. Entries belonging to a pinned owner are never evicted.
+
+    Kwargs:
+
+        - maxBytes (int): Maximal number of bytes held by the cache (default 2 GB)
+
+    """
+    def __init__(self,maxBytes=2*1024**3):
+        self.maxBytes = maxBytes
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._pinned = defaultdict(int)
+
+    def __contains__(self,key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self,owner,name,loader=None):
+        """Get entry from cache, or load and insert it using loader if not present
+
+        Args:
+
+            - owner (str): Owner of the entry, e.g. path to data file
+
+            - name (str): Name of entry
+
+        Kwargs:
+
+            - loader (function): Function without arguments returning the value if not cached (default None)
+
+        Returns:
+
+            - value: Cached value, or None if not cached and no loader is provided
+
+        """
+        key = (owner,name)
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+        if loader is None:
+            return None
+        return self.insert(owner,name,loader())
+
+    def insert(self,owner,name,value):
+        """Insert value into cache. Arrays are flagged read-only as they are shared between callers.
+        Values larger than the byte budget are returned without being cached."""
+        key = (owner,name)
+        if key in self._entries:
+            self.nbytes -= _nbytes(self._entries.pop(key))
+
+        size = _nbytes(value)
+        if size > self.maxBytes:
+            return value
+
+        for item in (value if isinstance(value,(tuple,list)) else [value]):
+            if isinstance(item,np.ndarray):
+                item.flags.writeable = False
+
+        self._entries[key] = value
+        self.nbytes += size
+        self.evict()
+        return value
+
+    def fits(self,size):
+        """Check if an entry of size bytes can be held by the cache"""
+        return size <= self.maxBytes
+
+    def pin(self,owner):
+        """Protect all entries of owner from eviction until released. Pins are counted."""
+        self._pinned[owner] += 1
+
+    def release(self,owner):
+        """Release one pin of owner, making its entries evictable when no pins are left"""
+        if owner in self._pinned:
+            self._pinned[owner] -= 1
+            if self._pinned[owner] <= 0:
+                del self._pinned[owner]
+        self.evict()
+
+    def invalidate(self,owner=None,name=None):
+        """Remove entries from cache. If owner is None all owners are cleared, if name is None all entries of owner are removed."""
+        for key in list(self._entries.keys()):
+            if (owner is None or key[0] == owner) and (name is None or key[1] == name):
+                self.nbytes -= _nbytes(self._entries.pop(key))
+
+    def clear(self):
+        """Remove all entries (pins are kept)"""
+        self.invalidate()
+
+    def evict(self):
+        """Remove least recently used entries of unpinned owners until within byte budget"""
+        if self.nbytes <= self.maxBytes:
+            return
+        for key in list(self._entries.keys()):
+            if key[0] in self._pinned:
+                continue
+            self.nbytes -= _nbytes(self._entries.pop(key))
+            if self.nbytes <= self.maxBytes:
+                break
+
+
+# Cache for counts and background read from disk. Budget is changed through countsCache.maxBytes
+countsCache = ArrayCache()
+
+# Cache for detector geometry shared between all data files with equal geometry
+geometryCache = ArrayCache(maxBytes=512*1024**2)
+
+# Cache for q evaluated by lazyQ, shared between all data files
+qCache = ArrayCache(maxBytes=256*1024**2)
+
+def arrayKey(array):
+    """Hashable key of the content of array"""
+    array = np.ascontiguousarray(array)
+    return (array.shape,array.dtype.str,hashlib.sha1(array.tobytes()).hexdigest())
+
+
+def detectorTwoTheta(detectorPosition,twoThetaOffset=0.0):
+    """Two theta of the detector columns for detector position (twoThetaPosition as stored in file) and offset"""
+    return np.linspace(0,-132,1152) + detectorPosition + twoThetaOffset
 
 
 
@@ -125,11 +505,11 @@ def getInstrument(file):
     return file.get(location)
 
 
-@KwargChecker(include=['radius','twoTheta','verticalPosition','twoThetaPosition']+list(HDFTranslation.keys()))
+@KwargChecker(include=['radius','twoTheta','verticalPosition','twoThetaPosition','qDtype']+list(HDFTranslation.keys()))
 def loadDataFile(fileLocation=None,fileType='Unknown',unitCell=None,**kwargs):
     """Load DMC data file, either powder or single crystal data.
     
-    
+    Kwargs set as attributes of the data file before q is calculated, e.g. qDtype=np.float32 for single crystal data.
     """
     if fileLocation is None:
         return DataFile()
@@ -144,28 +524,32 @@ def loadDataFile(fileLocation=None,fileType='Unknown',unitCell=None,**kwargs):
     elif not os.path.exists(fileLocation): # load file from disk
         raise FileNotFoundError('Provided file path "{}" not found.'.format(fileLocation))
 
-    A3 = shallowRead([fileLocation],['A3'])[0]['A3']
+    # Open file once and read all metadata in one pass, used both for type detection and the DataFile
+    with hdf.File(fileLocation,mode='r') as f:
+        metadata = readMetadata(f)
 
-    se_r = shallowRead([fileLocation],['se_r'])[0]['se_r']
-    
-    T = 'Unknown' # type of datafile
+        A3 = metadata['A3']
 
-    if A3 is None: # there is no A3 values at all
-        T = 'powder'
+        se_r = metadata['se_r']
         
-    elif len(A3) == 1 and se_r.any() is None:
-        T = 'powder'
-    else:
-        T = 'singlecrystal'
+        T = 'Unknown' # type of datafile
 
-    ## here be genius function to determine type of data
-    
-    if fileType.lower() == 'powder' or T == 'powder':
-        df = PowderDataFile(fileLocation,unitCell=unitCell)
-    elif fileType.lower() == 'singlecrystal' or T == 'singlecrystal':
-        df = SingleCrystalDataFile(fileLocation,unitCell=unitCell)
-    else:
-        df = DataFile(fileLocation,unitCell=unitCell)
+        if A3 is None: # there is no A3 values at all
+            T = 'powder'
+            
+        elif len(A3) == 1 and se_r.any() is None:
+            T = 'powder'
+        else:
+            T = 'singlecrystal'
+
+        ## here be genius function to determine type of data
+        
+        if fileType.lower() == 'powder' or T == 'powder':
+            df = PowderDataFile(fileLocation,unitCell=unitCell,hdfFile=f,metadata=metadata)
+        elif fileType.lower() == 'singlecrystal' or T == 'singlecrystal':
+            df = SingleCrystalDataFile(fileLocation,unitCell=unitCell,hdfFile=f,metadata=metadata)
+        else:
+            df = DataFile(fileLocation,unitCell=unitCell,hdfFile=f,metadata=metadata)
 
 
     repeats = df.countShape[1]
@@ -176,17 +560,18 @@ def loadDataFile(fileLocation=None,fileType='Unknown',unitCell=None,**kwargs):
     if not 'verticalPosition' in kwargs:
         kwargs['verticalPosition'] = np.linspace(-0.1,0.1,repeats,endpoint=True)
 
-    # Overwrite parameters provided in the kwargs
-    for key,item in kwargs.items():
-        setattr(df,key,item)
-        
-    if 'twoThetaPosition' in kwargs:
-        if not 'twoTheta' in kwargs:
-            df.twoTheta = np.linspace(0,-132,9*128)+df.twoThetaPosition
-        else:
+    # Overwrite parameters provided in the kwargs, only recalculating Q once
+    with df.batchUpdate():
+        for key,item in kwargs.items():
+            setattr(df,key,item)
+            
+        if 'twoThetaPosition' in kwargs:
+            if not 'twoTheta' in kwargs:
+                df.twoTheta = np.linspace(0,-132,9*128)+df.twoThetaPosition
+            else:
+                df.twoTheta = kwargs['twoTheta']
+        elif 'twoTheta' in kwargs:
             df.twoTheta = kwargs['twoTheta']
-    elif 'twoTheta' in kwargs:
-        df.twoTheta = kwargs['twoTheta']
     
     df.initializeQ()
     df.loadNormalization()
@@ -205,11 +590,16 @@ def loadDataFile(fileLocation=None,fileType='Unknown',unitCell=None,**kwargs):
 
 class DataFile(object):
     @KwargChecker()
-    def __init__(self, file=None,unitCell=None):
+    def __init__(self, file=None,unitCell=None,hdfFile=None,metadata=None):
         self.fileType = 'DataFile'
         self._twoThetaOffset = 0.0
         self._counts = None
         self._background = None
+        self._geometryKey = None
+        self._batchDepth = 0
+        self._pendingQ = False
+        self._qDtype = None # Type of lazily evaluated q, e.g. np.float32
+        self._phi = None
 
         if not file is None: 
             if isinstance(file,DataFile): # Copy everything from provided file
@@ -217,14 +607,29 @@ class DataFile(object):
                 self.updateProperty(file.__dict__)
 
             elif os.path.exists(file): # load file from disk
-                self.loadFile(file,unitCell=unitCell)
+                self.loadFile(file,unitCell=unitCell,hdfFile=hdfFile,metadata=metadata)
 
 
             else:
                 raise FileNotFoundError('Provided file path "{}" not found.'.format(file))
 
     @KwargChecker()
-    def loadFile(self,filePath,unitCell=None):
+    def loadFile(self,filePath,unitCell=None,hdfFile=None,metadata=None):
+        """Load data file from disk
+
+        Args:
+
+            - filePath (str): Path to data file
+
+        Kwargs:
+
+            - unitCell (list): Unit cell of sample overwriting the one in file (default None)
+
+            - hdfFile (hdf.File): Already opened version of filePath to be used instead of reopening file (default None)
+
+            - metadata (dict): Metadata already read from file with FileStructure.readMetadata (default None)
+
+        """
         if not os.path.exists(filePath):
             raise FileNotFoundError('Provided file path "{}" not found.'.format(filePath))
 
@@ -234,70 +639,104 @@ class DataFile(object):
 
         self._wavelength = 0.0
 
+        if hdfFile is None:
+            # Open file in reading mode
+            with hdf.File(filePath,mode='r') as f:
+                self._loadFromHDF(f,metadata)
+        else:
+            self._loadFromHDF(hdfFile,metadata)
 
-        # Open file in reading mode
-        with hdf.File(filePath,mode='r') as f:
-
-            self.sample = Sample.Sample(sample=f.get(HDFTranslation['sample']))
-            self.countShape = f.get(HDFCounts).shape
-            self.hasBackground = not f.get(HDFCountsBG) is None
-            # load standard things using the shallow read
-            instr = getInstrument(f)
-
-            if not f.get('/entry/reduction') is None: # Data file is a merged/reduced data file
-                red = f['/entry/reduction']
-
-                # Complicated way to avoid having to guess the name of the reduction algorithm.....
-                self.original_files = np.asarray([name.decode('UTF8') for name in list(red.values())[0].get('rawdata')]) 
-                
-            for parameter in HDFTranslation.keys():
-                if parameter in ['unitCell','sample','unitCell']:
-                    continue
-                if parameter in HDFTranslationAlternatives:
-                    for entry in HDFTranslationAlternatives[parameter]:
-                        value = np.array(f.get(entry))
-                        if not value.shape == ():
-                            break
-
-                elif parameter in HDFTranslation:
-                    value = np.array(f.get(HDFTranslation[parameter]))
-                    TrF= HDFTranslationFunctions
-                elif parameter in HDFInstrumentTranslation:
-                    value = np.array(instr.get(HDFInstrumentTranslation[parameter]))
-                    TrF= HDFInstrumentTranslationFunctions
-
-                if value.shape == () or value is None:
-                    value = HDFTranslationDefault[parameter]
-
-                else:
-                    for func,args in TrF[parameter]:
-                        value = getattr(value,func)(*args)
-                
-                setattr(self,parameter,value)
-                
         self.countShape = (1,*self.countShape) # Standard shape
         if not unitCell is None:
             self.sample.unitCell = unitCell
-    
+
+    def _loadFromHDF(self,f,metadata=None):
+        self.sample = Sample.Sample(sample=f.get(HDFTranslation['sample']))
+        self.countShape = f.get(HDFCounts).shape
+        self.hasBackground = not f.get(HDFCountsBG) is None
+
+        if not f.get('/entry/reduction') is None: # Data file is a merged/reduced data file
+            red = f['/entry/reduction']
+
+            # Complicated way to avoid having to guess the name of the reduction algorithm.....
+            self.original_files = np.asarray([name.decode('UTF8') for name in list(red.values())[0].get('rawdata')]) 
+
+        # All metadata is read in one pass through the resolved file layout
+        if metadata is None:
+            metadata = readMetadata(f)
+
+        for parameter in HDFTranslation.keys():
+            if parameter in ['unitCell','sample','unitCell']:
+                continue
+            value = metadata[parameter]
+
+            if value.shape == () or value is None:
+                value = HDFTranslationDefault[parameter]
+
+            else:
+                for func,args in HDFTranslationFunctions[parameter]:
+                    value = getattr(value,func)(*args)
+            
+            setattr(self,parameter,value)
+
+    def _shareGeometry(self,twoTheta):
+        """Set twoTheta, pixelPosition and alpha from two theta of the detector columns. Geometry is shared between all files 
+        with same detector setup"""
+        self._geometryKey = ('detector',self.radius,arrayKey(twoTheta),arrayKey(self.verticalPosition),tuple(self.countShape[1:]))
+
+        def loader():
+            twoTheta2D, z = np.meshgrid(twoTheta,self.verticalPosition,indexing='xy')
+            pixelPosition = np.array([-self.radius*np.sin(np.deg2rad(twoTheta2D)),
+                                    self.radius*np.cos(np.deg2rad(twoTheta2D)),
+                                    -z]).reshape(3,*self.countShape[1:])
+            alpha = np.rad2deg(np.arctan2(pixelPosition[2],self.radius))
+            return twoTheta2D, pixelPosition, alpha
+
+        self.twoTheta, self.pixelPosition, self.alpha = geometryCache.get(self._geometryKey,'pixels',loader)
+
+    def __getstate__(self):
+        # Geometry, q and normalization are derived from the remaining state and shared between files, e.g. Q is a view 
+        # broadcast along A3. They are recalculated when unpickled instead of being transferred as full arrays
+        state = self.__dict__.copy()
+        state['_batchDepth'] = 0
+        state['_pendingQ'] = False
+        pixels = None if self._geometryKey is None else geometryCache.get(self._geometryKey,'pixels')
+        if pixels is None or not pixels[1] is self.pixelPosition:
+            return state
+        for key in ['pixelPosition','alpha','ki','kf','rotMat','q_temp','q','qLocal','Q','_phi']:
+            state.pop(key,None)
+        if self.twoTheta is pixels[0]:
+            state.pop('twoTheta')
+        state['_geometryTwoTheta'] = pixels[0][0]
+        if hasattr(self,'normalizationFile'):
+            state.pop('normalization',None)
+        return state
+
+    def __setstate__(self,state):
+        twoTheta = state.pop('_geometryTwoTheta',None)
+        self.__dict__.update(state)
+        if not twoTheta is None:
+            changedTwoTheta = getattr(self,'twoTheta',None)
+            self._shareGeometry(twoTheta)
+            if not changedTwoTheta is None:
+                self.twoTheta = changedTwoTheta
+            self.calculateQ()
+            if not 'normalization' in state:
+                self.loadNormalization()
+
     def initializeQ(self):
         if len(self.twoTheta.shape) == 2:
-            self.twoTheta, z = np.meshgrid(self.twoTheta[0].flatten(),self.verticalPosition,indexing='xy')
+            twoTheta = self.twoTheta[0].flatten()
         else:
-            self.twoTheta, z = np.meshgrid(self.twoTheta.flatten(),self.verticalPosition,indexing='xy')
-            
-        self.pixelPosition = np.array([-self.radius*np.sin(np.deg2rad(self.twoTheta)),
-                                    self.radius*np.cos(np.deg2rad(self.twoTheta)),
-                                    -z]).reshape(3,*self.countShape[1:])
-        
+            twoTheta = self.twoTheta.flatten()
+
+        self._shareGeometry(twoTheta)
         
         #self.Monitor = self.monitor
         
         if np.any(np.isclose(self.monitor,0)): # error mode from commissioning
             self.monitor = np.ones(self.countShape[0])
         
-        self.alpha = np.rad2deg(np.arctan2(self.pixelPosition[2],self.radius))
-        # Above line makes an implicit call to the self.calculateQ method!
-        
         self.calculateQ()
         self.generateMask(maskingFunction=None)
 
@@ -372,10 +811,26 @@ class DataFile(object):
             self._detector_position = np.array([0.0]*len(self.A3))
         else:
             self._detector_position = np.asarray(twoTheta)
-        self.twoTheta = np.repeat((np.linspace(0,-132,1152) + self._detector_position + self._twoThetaOffset)[np.newaxis],self.countShape[1],axis=0)
+        self.twoTheta = self._detectorTwoTheta()
         if hasattr(self,'_Ki') and hasattr(self,'twoTheta'):
             self.calculateQ()
 
+    @property
+    def qDtype(self):
+        """Type of lazily evaluated q, e.g. np.float32 to half the memory (None is float64)"""
+        return self._qDtype
+
+    @qDtype.setter
+    def qDtype(self,dtype):
+        self._qDtype = None if dtype is None else np.dtype(dtype)
+        if isinstance(getattr(self,'q',None),lazyQ):
+            self.q = lazyQ(self.q.rotationMatrix,self.q.q_temp,dtype=self._qDtype)
+
+    def _detectorTwoTheta(self):
+        """Two theta of all pixels for current detector position and offset, shared between files"""
+        key = ('twoTheta',arrayKey(self._detector_position),arrayKey(self._twoThetaOffset),self.countShape[1])
+        return geometryCache.get(key,'twoTheta',lambda: np.repeat(detectorTwoTheta(self._detector_position,self._twoThetaOffset)[np.newaxis],self.countShape[1],axis=0))
+
     
 
     @property
@@ -403,7 +858,7 @@ class DataFile(object):
     @twoThetaOffset.setter
     def twoThetaOffset(self,dTheta):
         self._twoThetaOffset = dTheta
-        self.twoTheta = np.repeat((np.linspace(0,-132,1152) + self._detector_position + self._twoThetaOffset)[np.newaxis],self.countShape[1],axis=0)
+        self.twoTheta = self._detectorTwoTheta()
         self.calculateQ()
 
     @property
@@ -422,31 +877,68 @@ class DataFile(object):
         self._Ki = 2*np.pi/wavelength
         self.calculateQ()
     
+    @contextmanager
+    def batchUpdate(self):
+        """Context manager deferring the recalculation of Q until all parameters within the context are updated
+
+        Example:
+            >>> with df.batchUpdate():
+            ...     df.twoThetaOffset = 0.5
+            ...     df.wavelength = 2.46
+        """
+        self._batchDepth += 1
+        try:
+            yield self
+        finally:
+            self._batchDepth -= 1
+            if self._batchDepth == 0 and self._pendingQ:
+                self._pendingQ = False
+                self.calculateQ()
+
     def calculateQ(self):
         """Calculate Q and qx,qy,qz using the current A3 values"""
         if not (hasattr(self,'Ki') and hasattr(self,'twoTheta')
                 and hasattr(self,'alpha') and hasattr(self,'A3')):
             return 
+        if self._batchDepth > 0:
+            self._pendingQ = True
+            return
         self.ki = np.array([0.0,self.Ki,0.0]) # along ki=2pi/lambda with y (Lumsden2005)
         self.ki.shape = (3,1,1)
 
-        self.kf = self.Ki*self.pixelPosition/np.linalg.norm(self.pixelPosition,axis=0)
+        singleCrystal = self.fileType.lower() == 'singlecrystal'
+        def loader():
+            kf = self.Ki*self.pixelPosition/np.linalg.norm(self.pixelPosition,axis=0)
+            if singleCrystal:
+                return kf, kf-self.ki
+            return kf, self.ki-kf
+
+        # Share kf and local q when pixel positions are the shared ones
+        pixels = None if self._geometryKey is None else geometryCache.get(self._geometryKey,'pixels')
+        if not pixels is None and pixels[1] is self.pixelPosition:
+            key = (self._geometryKey,arrayKey(self.Ki),singleCrystal)
+            self.kf, qLocal = geometryCache.get(key,'kf',loader)
+        else:
+            self.kf, qLocal = loader()
            
-        if self.fileType.lower() == 'singlecrystal': # A3 Scan
+        if singleCrystal: # A3 Scan
             # rotate kf to correct for A3
             zero = np.zeros_like(self.A3)
             ones = np.ones_like(self.A3)
             self.rotMat = np.array([[np.cos(np.deg2rad(self.A3)),np.sin(np.deg2rad(self.A3)),zero],[-np.sin(np.deg2rad(self.A3)),np.cos(np.deg2rad(self.A3)),zero],[zero,zero,ones]])
-            self.q_temp = self.kf-self.ki
+            self.q_temp = qLocal
 
-            self.q = lazyQ(self.rotMat, self.q_temp)
+            self.q = lazyQ(self.rotMat, self.q_temp, dtype=self.qDtype)
 
-            self.Q = np.repeat(np.linalg.norm(self.q[0],axis=0),self.countShape[0],axis=0)
+            # |Q| does not depend on A3, keep one detector image and broadcast it along the scan
+            self.Q = np.broadcast_to(np.linalg.norm(self.q[0],axis=0),self.countShape)
         else:
-            self.qLocal = self.ki-self.kf
+            self.qLocal = qLocal
             self.Q = np.array([np.linalg.norm(self.qLocal,axis=0)])
 
-        #self.correctedTwoTheta = 2.0*np.rad2deg(np.arcsin(self.wavelength*self.Q[0]/(4*np.pi)))[np.newaxis].repeat(self.Q.shape[0],axis=0)
+        # Out of plane angle is invariant under the A3 rotation around z
+        self._phi = np.rad2deg(np.arctan2(qLocal[2],np.linalg.norm(qLocal[:2],axis=0)))
+        self._phi.setflags(write=False)
         
         
 
@@ -495,7 +987,7 @@ class DataFile(object):
             raise AttributeError('Provided argument is not of type dictionary. Received instance of type {}'.format(type(dictionary)))
 
 
-    @KwargChecker(function=plt.errorbar,include=MPLKwargs)
+    @KwargChecker(function='matplotlib.pyplot.errorbar',include=MPLKwargs)
     def plotDetector(self,ax=None,applyCalibration=True,**kwargs):
         """Plot intensity as function of twoTheta (and vertical position of pixel in 2D)
 
@@ -508,6 +1000,7 @@ class DataFile(object):
             - All other key word arguments are passed on to plotting routine
 
         """
+        import matplotlib.pyplot as plt
 
         if ax is None:
             fig, ax = plt.subplots()
@@ -731,85 +1224,174 @@ class DataFile(object):
                 bg = self.background
             else:
                 bg = 0
-            with hdf.File(os.path.join(self.folder,self.fileName),mode='r') as f:
-                return (np.array(f.get(HDFCounts))).reshape(self.countShape)-bg
+            return self._readDataset(HDFCounts).reshape(self.countShape)-bg
         else:
             return self._counts.reshape(self.countShape)
     
     def countsSliced(self,sl):
         if self._counts is None:
             if self.hasBackground:
-                bg = self.background[sl]
+                bg = self.backgroundSliced(sl)
             else:
                 bg = 0
-            with hdf.File(os.path.join(self.folder,self.fileName),mode='r') as f:
-                return np.array(f.get(HDFCounts)[sl])-bg
+            return self._readDataset(HDFCounts,sl)-bg
         else:
             return self._counts[sl]
         
     @property
     def background(self):
         if self._background is None:
-            with hdf.File(os.path.join(self.folder,self.fileName),mode='r') as f:
-                if self.backgroundType == 'powder':
-                    bg = np.repeat(np.array(f.get(HDFCountsBG))[np.newaxis],repeats=self.countShape[0],axis=0)
-                else:
-                    bg = np.array(f.get(HDFCountsBG)).reshape(self.countShape)
-                return bg
+            bg = self._readDataset(HDFCountsBG)
+            if self.backgroundType == 'powder':
+                bg = np.repeat(bg[np.newaxis],repeats=self.countShape[0],axis=0)
+            else:
+                bg = bg.reshape(self.countShape)
+            return bg
         else:
             return self._background.reshape(self.countShape)
     
     def backgroundSliced(self,sl):
         if self._background is None:
-            with hdf.File(os.path.join(self.folder,self.fileName),mode='r') as f:
-                if self.backgroundType == 'powder':
-                    bg = np.repeat(np.array(f.get(HDFCountsBG))[np.newaxis],repeats=len(sl),axis=0)
-                else:
-                    bg = np.array(f.get(HDFCountsBG)[sl])
-                return bg
+            if self.backgroundType == 'powder':
+                bg = self._readDataset(HDFCountsBG)
+                bg = np.broadcast_to(bg,(self.countShape[0],*bg.shape))[sl]
+            else:
+                bg = self._readDataset(HDFCountsBG,sl)
+            return bg
         else:
             return self._background[sl]
-    
-            
 
-    @property
-    def intensity(self):
+    def _readDataset(self,hdfPath,sl=None):
+        """Read data set from disk through the counts cache. If the full data set does not fit 
+        within the cache budget only the requested slice is read."""
+        filePath = os.path.join(self.folder,self.fileName)
+        data = countsCache.get(filePath,hdfPath)
+        if data is None:
+            with hdf.File(filePath,mode='r') as f:
+                dset = f.get(hdfPath)
+                if not countsCache.fits(dset.size*dset.dtype.itemsize):
+                    if sl is None:
+                        return np.array(dset)
+                    return np.array(dset[sl])
+                data = countsCache.insert(filePath,hdfPath,np.array(dset))
+        if sl is None:
+            return data
+        return data[sl]
+
+    def chunkSlices(self,steps=None):
+        """Slices along the scan direction aligned to the chunks of the counts stored on disk
+
+        Kwargs:
+
+            - steps (int): Number of scan steps per slice, rounded up to a multiple of the chunk length (default None, one chunk or the full scan if counts are not chunked)
+
+        Returns:
+
+            - slices (list): List of slices covering the full scan
+
+        """
+        # Slices only depend on the file, not on whether counts are cached or in memory, as results summed over slices would 
+        # otherwise differ by rounding between calls
+        chunkLength = None
+        filePath = os.path.join(getattr(self,'folder',''),getattr(self,'fileName',''))
+        if os.path.isfile(filePath):
+            with hdf.File(filePath,mode='r') as f:
+                chunks = f.get(HDFCounts).chunks
+                if not chunks is None and len(chunks) == 3:
+                    chunkLength = chunks[0]
+        
+        if steps is None: # One chunk, or the full scan if counts are not chunked along the scan
+            steps = len(self) if chunkLength is None else chunkLength
+        elif not chunkLength is None:
+            steps = int(np.max([np.ceil(steps/chunkLength),1])*chunkLength)
+
+        return [slice(start,stop) for start,stop in _tools.arange(0,len(self),steps)]
+
+    def iterChunks(self,steps=None):
+        """Iterate through the scan in blocks aligned to the on-disk chunking of the counts. Each chunk is read only once.
+
+        Kwargs:
+
+            - steps (int): Number of scan steps per block, rounded up to a multiple of the chunk length (default None, one chunk)
+
+        Yields:
+
+            - sl (slice): Slice of the block along the scan direction
+
+            - counts (array): Counts of block with background subtracted
+
+            - background (array): Background of block (None if no background is present)
+
+            - monitor (array): Monitor of block
+
+            - mask (array): Mask of block
+
+        """
+        if self.fileType.lower() != 'singlecrystal': # Powder files are only one step
+            bg = self.background if self.hasBackground else None
+            yield slice(0,len(self)),self.counts,bg,self.monitor,self.mask
+            return
+
+        for sl in self.chunkSlices(steps=steps):
+            bg = self.backgroundSliced(sl) if self.hasBackground else None
+            if self._counts is None:
+                counts = self._readDataset(HDFCounts,sl)
+                if not bg is None:
+                    counts = counts-bg
+            else:
+                counts = self._counts[sl]
+            yield sl,counts,bg,self.monitor[sl],self.mask[sl]
+
+    def normalizeCounts(self,counts):
+        """Divide counts, or a block of counts along the scan direction, by the detector normalization"""
         with warnings.catch_warnings():
             warnings.simplefilter("ignore")
             if self.fileType.lower() == 'singlecrystal':
-                return np.divide(self.counts,self.normalization[np.newaxis])
+                return np.divide(counts,self.normalization[np.newaxis])
             else:
-                return np.divide(self.counts,self.normalization)
+                return np.divide(counts,self.normalization)
+
+    def pin(self):
+        """Keep counts and background of data file in memory until released"""
+        countsCache.pin(os.path.join(self.folder,self.fileName))
+
+    def release(self):
+        """Release pin on counts and background, allowing them to be evicted from memory"""
+        countsCache.release(os.path.join(self.folder,self.fileName))
+
+    def invalidateCache(self):
+        """Remove counts and background of data file from memory, forcing a new read from disk"""
+        countsCache.invalidate(os.path.join(self.folder,self.fileName))
+
+    @property
+    def intensity(self):
+        return self.normalizeCounts(self.counts)
 
     
     def intensitySliced(self,sl):
-        with warnings.catch_warnings():
-            warnings.simplefilter("ignore")
-            if self.fileType.lower() == 'singlecrystal':
-                return np.divide(self.countsSliced(sl),self.normalization[np.newaxis])
-            else:
-                return np.divide(self.countsSliced(sl),self.normalization)
-            #return np.divide(self.countsSliced(sl),self.normalization[sl])
+        return self.normalizeCounts(self.countsSliced(sl))
 
     
 
     def InteractiveViewer(self,**kwargs):
         if not self.fileType.lower() in ['singlecrystal','powder'] :
             raise AttributeError('Interactive Viewer can only be used for the new data files. Either for powder or for a single crystal A3 scan')
+        from DMCpy import InteractiveViewer
         return InteractiveViewer.InteractiveViewer(self.intensity,self.twoTheta,self.pixelPosition,self.A3,scanParameter = 'A3',scanValueUnit='deg',colorbar=True,**kwargs)
 
     @property
     def correctedTwoTheta(self):
-        return 2.0*np.rad2deg(np.arcsin(self.wavelength*self.Q[0]/(4*np.pi)))[np.newaxis].repeat(self.Q.shape[0],axis=0)
+        """Scattering angle calculated from |Q| for each pixel. Returned as read-only view broadcasted to shape of counts"""
+        return np.broadcast_to(2.0*np.rad2deg(np.arcsin(self.wavelength*self.Q[0]/(4*np.pi))),self.Q.shape)
 
     
 
     @property
     def phi(self):
+        """Out of plane angle for each pixel (read-only). For A3 scans broadcasted to shape of counts"""
         if self.fileType.lower() == 'singlecrystal':
-            return np.rad2deg(np.arctan2(self.q[None][2],np.linalg.norm(self.q[None][:2],axis=0)))
-        else:
-            return np.rad2deg(np.arctan2(self.qLocal[2],np.linalg.norm(self.qLocal[:2],axis=0)))
+            return np.broadcast_to(self._phi,self.Q.shape)
+        return self._phi
         
     def setProjectionVectors(self,p1,p2,p3=None):
         """Set or update the projection vectors used for the View3D
@@ -837,5 +1419,4 @@ class PowderDataFile(DataFile):
     def __init__(self,fileType,*args,**kwargs):
         super(PowderDataFile,self).__init__(fileType,*args,**kwargs)
         self.fileType = 'Powder'
-        self.counts.shape = (1,128,1152)
 
@@ -1,21 +1,299 @@
 import h5py as hdf
 import numpy as np
 import pickle as pickle
-import matplotlib.pyplot as plt
-import pandas as pd
 import shutil
 import os, copy
 import json, os, time
-from DMCpy import DataFile, _tools, Viewer3D, RLUAxes, TasUBlibDEG
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from DMCpy import DataFile, _tools, TasUBlibDEG
 from DMCpy.FileStructure import shallowRead, HDFCountsBG, HDFTranslation
 import warnings
 import DMCpy
 
+def _loadDataFile(arguments):
+    """Load a single data file from (fileLocation, unitCell). Used by worker processes in loadDataFiles."""
+    fileLocation,unitCell = arguments
+    return DataFile.loadDataFile(fileLocation,unitCell=unitCell)
+
+
+def loadDataFiles(dataFiles,unitCell=None,workers=None):
+    """Load list of data files, optionally in parallel using a pool of worker processes.
+
+    Args:
+
+        - dataFiles (list): List of file paths and/or DataFile objects. DataFile objects are passed through
+
+    Kwargs:
+
+        - unitCell (list): Unit cell given to all loaded files (default None)
+
+        - workers (int): Number of worker processes. If None or 1, files are loaded serially (default None)
+
+    Returns:
+
+        - dataFiles (list): Loaded DataFiles in the order provided
+
+    If loading of a file fails, the error of the first failing file in the list is raised as in serial loading.
+
+    """
+    paths = [(I,dF) for I,dF in enumerate(dataFiles) if isinstance(dF,str)]
+    if workers is None or workers <= 1 or len(paths) < 2:
+        return [DataFile.loadDataFile(dF,unitCell=unitCell) if isinstance(dF,(str)) else dF for dF in dataFiles]
+
+    dataFiles = list(dataFiles)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        loaded = executor.map(_loadDataFile,[(dF,unitCell) for _,dF in paths])
+        for (I,_),df in zip(paths,loaded):
+            # Geometry, q and normalization are not transferred but shared with the files already loaded when unpickled
+            dataFiles[I] = df
+    return dataFiles
+
+
+def _blockPositions(df,sl,rlu):
+    """Return q of scan steps sl in data file df, in the sample frame if rlu"""
+    if rlu: # shape -> 3,steps,128,1152
+        return df.q.project(df.sample.ROT,sl)
+    return df.q[sl]
+
+
+# Cache of position extremes per file and, if requested by cacheIndex in binData3D and cutQPlane, of the flat voxel index of each
+# pixel such that rebinning with changed normalization, mask, or raw/normalized data only redoes the accumulation. Entries live in 
+# the process filling them, i.e. tables computed by worker processes are discarded with the pool.
+voxelIndexCache = DataFile.ArrayCache(maxBytes=1024**3)
+
+def _blockGeometry(df,sl,rlu):
+    """Return (owner, key) identifying positions of scan steps sl in data file df in voxelIndexCache"""
+    key = (sl.start,sl.stop,rlu,str(df.q.dtype),DataFile.arrayKey(df.q.q_temp),DataFile.arrayKey(df.q.rotationMatrix[:,:,sl]))
+    if rlu:
+        key += (DataFile.arrayKey(df.sample.ROT),)
+    return os.path.abspath(os.path.join(df.folder,df.fileName)),key
+
+
+def _fileExtremes(df,rlu):
+    """Return minimal and maximal position of all pixels in single crystal data file df, shape (2,3). Found from the scan 
+    angles without evaluating q of all steps"""
+    owner,key = _blockGeometry(df,slice(0,len(df)),rlu)
+    return voxelIndexCache.get(owner,('extremes',key),lambda: df.q.extremes(df.sample.ROT if rlu else None))
+
+
+def _blockVoxels(df,sl,bins,rlu):
+    """Return flat index into bins (RegularGrid) of all pixels in scan steps sl of data file df, -1 outside of bins"""
+    owner,key = _blockGeometry(df,sl,rlu)
+    name = ('voxels',key,bins.origin.tobytes(),bins.step.tobytes(),tuple(bins.shape))
+    return voxelIndexCache.get(owner,name,lambda: _tools.voxelIndex(_blockPositions(df,sl,rlu).reshape(3,-1).T,bins.edges))
+
+
+def _blockPlane(df,sl,rotation,xBins,yBins):
+    """Return flat index into (xBins,yBins) and out-of-plane position of all pixels in scan steps sl of data file df 
+    projected by rotation"""
+    def loader():
+        q = df.q.project(rotation,sl).reshape(3,-1)
+        return _tools.voxelIndex(q[:2].T,(xBins,yBins)),q[2].copy()
+    owner,key = _blockGeometry(df,sl,False)
+    return voxelIndexCache.get(owner,('plane',key,DataFile.arrayKey(rotation),DataFile.arrayKey(xBins),DataFile.arrayKey(yBins)),loader)
+
+
+def _pixelWidths(twoTheta):
+    """Width of pixels along the scattering direction from the distance to neighbouring pixels"""
+    return np.abs(np.gradient(twoTheta,axis=-1))
+
+
+def _integrationPlan(twoTheta,bins,splitPixels=False):
+    """Return IntegrationPlan of pixels at twoTheta into bins. Plans are shared between data files with equal geometry 
+    through the geometry cache, and masks are applied when integrating."""
+    key = ('integrationPlan',DataFile.arrayKey(twoTheta),DataFile.arrayKey(bins),splitPixels)
+    return DataFile.geometryCache.get(key,'plan',lambda: _tools.IntegrationPlan(twoTheta,bins,widths=_pixelWidths(twoTheta) if splitPixels else None))
+
+
+def _binBlock(df,sl,bins,rlu,raw,sparse=False,cacheIndex=False):
+    """Bin the non-masked pixels of scan steps sl in data file df into bins. Returns intensity, monitor, and number of pixels,
+    as SparseHistogram if sparse. If cacheIndex, the voxel index of the pixels is kept in voxelIndexCache."""
+    counts = df.countsSliced(sl)
+    if raw:
+        dat = counts
+    else:
+        dat = df.normalizeCounts(counts)
+
+    mon = np.broadcast_to(df.monitor[sl][:,np.newaxis,np.newaxis],dat.shape)
+    boolMask = np.logical_not(df.mask[sl].flatten())
+
+    if cacheIndex:
+        index = _blockVoxels(df,sl,bins,rlu)
+        return _tools.histogramIndex(index[boolMask],bins.shape,weights=[dat.flatten()[boolMask],mon.flatten()[boolMask]],returnCounts=True,sparse=sparse)
+
+    pos = _blockPositions(df,sl,rlu)
+    localReturndata,_ = _tools.binData3D(*bins.step,pos=pos.reshape(3,-1)[:,boolMask],data=dat.flatten()[boolMask],mon=mon.flatten()[boolMask],bins=bins,sparse=sparse)
+    return localReturndata
+
+
+_binningFiles = None # Data files of the worker process, set by _initializeBinning
+
+def _initializeBinning(dataFiles):
+    """Keep the data files of the data set in a worker process of binData3D"""
+    global _binningFiles
+    _binningFiles = dataFiles
+
+
+def _binBlockWorker(arguments):
+    """Bin block (fileIndex, sl, bins, rlu, raw, sparse, cacheIndex) of the data files of the worker process"""
+    fileIndex,sl,bins,rlu,raw,sparse,cacheIndex = arguments
+    df = _binningFiles[fileIndex]
+    print(df.fileName,'from',sl.start,'to',sl.stop)
+    return _binBlock(df,sl,bins,rlu,raw,sparse,cacheIndex)
+
+
+def _addHistograms(returndata,localReturndata,sparse=False):
+    """Add partial histogram localReturndata to returndata (None if nothing is summed yet)"""
+    if returndata is None:
+        return localReturndata
+    if sparse:
+        return returndata+localReturndata
+    for data,newData in zip(returndata,localReturndata):
+        data+=newData
+    return returndata
+
+
+def _volumeKey(dataFiles,*parameters,rotation=False):
+    """Key of binned volume from content of data files and binning parameters.
+    
+    Raw counts are identified by path, modification time and size of the files, while all derived quantities entering the 
+    binning (q, mask, monitor, normalization, and if rotation the sample rotation) are hashed."""
+    content = [parameters]
+    for df in dataFiles:
+        filePath = os.path.abspath(os.path.join(df.folder,df.fileName))
+        stat = os.stat(filePath)
+        content.append((filePath,stat.st_mtime_ns,stat.st_size,df.hasBackground,
+                        DataFile.arrayKey(df.q.q_temp),DataFile.arrayKey(df.q.rotationMatrix),str(df.q.dtype),
+                        DataFile.arrayKey(df.mask),DataFile.arrayKey(df.monitor),DataFile.arrayKey(df.normalization)))
+        if rotation:
+            content.append(DataFile.arrayKey(df.sample.ROT))
+    return hashlib.sha1(repr(content).encode('utf8')).hexdigest()
+
+
+def _binDataFile(df,dx,dy,dz,cache=False):
+    """Bin normalized counts of all pixels in data file into bins of size (dx,dy,dz) in the instrument frame.
+    Returns bins and binned intensity divided by number of pixels in each bin, memory-mapped from the volume store if cache."""
+    def loader():
+        bins = _tools.calculateBins(dx,dy,dz,_fileExtremes(df,False).T)
+
+        Intensities = None
+        for sl,counts,_,_,_ in df.iterChunks():
+            localIntensities,_ = _tools.binData3D(dx,dy,dz,df.q[sl].reshape(3,-1),df.normalizeCounts(counts),bins=bins)
+            if Intensities is None:
+                Intensities = localIntensities
+            else:
+                for data,newData in zip(Intensities,localIntensities):
+                    data+=newData
+
+        with warnings.catch_warnings() as w:
+            warnings.simplefilter("ignore")
+            return bins,[np.divide(Intensities[0],Intensities[1])]
+
+    if cache:
+        bins,(Intensities,) = _tools.volumeStore.get(_volumeKey([df],'peakSearch',dx,dy,dz),['intensity'],loader)
+    else:
+        bins,(Intensities,) = loader()
+    return bins,Intensities
+
+
+def _formatLines(values,fmt,columns,prefix='',separator=' '):
+    """Format values into lines of columns values, the last line holding the remainder. Values are formatted by the 
+    %-style fmt in a single operation on the whole block instead of one by one."""
+    values = np.asarray(values,dtype=float).flatten().tolist()
+    fullLines,remainder = divmod(len(values),columns)
+    lines = fullLines*[prefix+separator.join(columns*[fmt])]
+    if remainder > 0:
+        lines.append(prefix+separator.join(remainder*[fmt]))
+    return '\n'.join(lines) % tuple(values)
+
+
+def _headerNumbers(line):
+    """Start, step, stop, and monitor from third header line of PSI and xye files"""
+    return [float(x) for x in line.split(',')[0].strip('#').split()]
+
+
+def _readPSI(fileName):
+    """Read .dat file in PSI format. Returns header lines, intensity, error, and lines following the data"""
+    with open(fileName,'r') as rf:
+        allinfo = rf.readlines()
+
+    info = allinfo[:3]
+    start,step,stop = _headerNumbers(info[2])[:3]
+    dataPoints = int(np.round((stop-start)/step)) + 1
+    dataLines = int(np.ceil(dataPoints/10))
+
+    commentlines = 3
+    intensity = np.array(' '.join(allinfo[commentlines:commentlines+dataLines]).split(),dtype=float)
+    err = np.array(' '.join(allinfo[commentlines+dataLines:commentlines+2*dataLines]).split(),dtype=float)[:dataPoints] # Padded with nan
+    return info,intensity,err,allinfo[commentlines+2*dataLines:]
+
+
+def _twoThetaRange(dataFile):
+    """Minimal and maximal absolute two theta of data file, given as path or DataFile. For a path, only the detector 
+    position is read from the file"""
+    if isinstance(dataFile,str):
+        position = shallowRead([dataFile],['twoThetaPosition'])[0]['twoThetaPosition']
+        if position is None or np.isnan(position): # As when loading the file
+            position = 0.0
+        twoTheta = DataFile.detectorTwoTheta(position)
+    else:
+        twoTheta = dataFile.twoTheta
+    return [func(np.abs(twoTheta)) for func in [np.min,np.max]]
+
+
+def _seriesBins(twoThetaRanges,dTheta):
+    """Two theta bins in steps of dTheta covering the (min, max) two theta of all files"""
+    twoTheta = np.asarray(twoThetaRanges)
+    anglesMin = np.min(twoTheta[:,0])
+    anglesMax = np.max(twoTheta[:,1])
+    return np.arange(anglesMin-0.5*dTheta,anglesMax+0.51*dTheta,dTheta)
+
+
+def _reduceSeriesFile(arguments):
+    """Reduce and export single data file of a series from (dataFile, useMask, maxAngle, kwargs of reducePowder, 
+    writers, kwargs of writers). The data file is given as path or DataFile and loaded in the calling process such that
+    worker processes of reduceSeries only receive their own file. Returns the reduction and metadata of the file."""
+    dataFile,useMask,maxAngle,reductionKwargs,writers,exportKwargs = arguments
+    if isinstance(dataFile,str):
+        dataFile = DataFile.loadDataFile(dataFile)
+    ds = DataSet([dataFile])
+
+    if useMask is True:
+        ds.generateMask(maxAngle=maxAngle,replace=False)
+    reduction = ds.reducePowder(**reductionKwargs)
+
+    for writer in writers:
+        getattr(ds,writer)(bins=reductionKwargs['bins'],useMask=useMask,maxAngle=maxAngle,applyCalibration=reductionKwargs['applyCalibration'],
+                           correctedTwoTheta=reductionKwargs['correctedTwoTheta'],reduction=reduction,**exportKwargs)
+
+    return reduction,_seriesMetadata([dataFile])
+
+
+def _seriesMetadata(dataFiles):
+    """File name, start time, mean temperature, magnetic and electric field, and total counting time of data files as 
+    returned for each file by reduceSeries and stored by export_npz_format"""
+    def mean(name):
+        values = [np.mean(getattr(df,name)) for df in dataFiles if not getattr(df,name,None) is None]
+        return np.nan if len(values) == 0 else np.mean(values)
+
+    times = [np.sum(df.time) for df in dataFiles if not getattr(df,'time',None) is None]
+    return {'fileName':','.join([df.fileName for df in dataFiles]),
+            'startTime':getattr(dataFiles[0],'startTime',None),
+            'temperature':mean('temperature'),
+            'magneticField':mean('magneticField'),
+            'electricField':mean('electricField'),
+            'time':np.nan if len(times) == 0 else np.sum(times)}
+
+
 class DataSet(object):
-    def __init__(self, dataFiles=None,unitCell=None,**kwargs):
+    def __init__(self, dataFiles=None,unitCell=None,workers=None,**kwargs):
         """DataSet object to hold a series of DataFile objects
         Kwargs:
             - dataFiles (list): List of data files to be used in reduction (default None)
+            - unitCell (list): Unit cell given to all loaded files (default None)
+            - workers (int): Number of processes used to load files in parallel (default None, serial loading)
         Raises:
             - NotImplementedError
             - AttributeError
@@ -27,7 +305,7 @@ class DataSet(object):
             if isinstance(dataFiles,(str,DataFile.DataFile)): # If either string or DataFile instance wrap in a list
                 dataFiles = [dataFiles]
             try:
-                self.dataFiles = [DataFile.loadDataFile(dF,unitCell=unitCell) if isinstance(dF,(str)) else dF for dF in dataFiles]
+                self.dataFiles = loadDataFiles(dataFiles,unitCell=unitCell,workers=workers)
             except TypeError:
                 raise AttributeError('Provided dataFiles attribute is not iterable, filepath, or of type DataFile. Got {}'.format(dataFiles))
             
@@ -98,14 +376,22 @@ class DataSet(object):
     def next(self):
         return self.__next__()
 
-    def append(self,item):
+    def append(self,item,workers=None):
+        """Append data file(s) to the DataSet
+
+        Args:
+
+            - item (str, DataFile, or list): File path(s) and/or DataFile(s) to be appended
+
+        Kwargs:
+
+            - workers (int): Number of processes used to load files in parallel (default None, serial loading)
+
+        """
         try:
             if isinstance(item,(str,DataFile.DataFile)): # A file path or DataFile has been provided
                 item = [item]
-            for f in item:
-                if isinstance(f,str):
-                    f = DataFile.loadDataFile(f)
-                self.dataFiles.append(f)
+            self.dataFiles.extend(loadDataFiles(item,workers=workers))
         except Exception as e:
             raise(e)
         self._getData()
@@ -131,6 +417,16 @@ class DataSet(object):
         for df in self:
             df.sample = sample
 
+    def pin(self):
+        """Keep counts and background of all data files in memory until released"""
+        for df in self:
+            df.pin()
+
+    def release(self):
+        """Release pins on counts and background of all data files"""
+        for df in self:
+            df.release()
+
     def generateMask(self,maskingFunction = DataFile.maskFunction, replace=True, **pars):
         """Generate mask to applied to data in data file
         
@@ -144,12 +440,13 @@ class DataSet(object):
         self._getData()
 
     @_tools.KwargChecker()
-    def sumDetector(self,twoThetaBins=None,applyCalibration=True,correctedTwoTheta=True,dTheta=0.125):
+    def sumDetector(self,twoThetaBins=None,applyCalibration=True,correctedTwoTheta=True,dTheta=0.125,splitPixels=False):
         """Find intensity as function of either twoTheta or correctedTwoTheta
         Kwargs:
             - twoThetaBins (list): Bins into which 2theta is to be binned (default min(2theta),max(2theta) in steps of 0.5)
             - applyCalibration (bool): If true, take detector efficiency into account (default True)
             - correctedTwoTheta (bool): If true, use corrected two theta, otherwise sum vertically on detector (default True)
+            - splitPixels (bool): If true, pixels are split between bins by their overlap in 2theta (default False)
         Returns:
             - twoTheta
             
@@ -159,43 +456,44 @@ class DataSet(object):
             - Total Monitor
         """
 
-        if correctedTwoTheta: 
-            twoTheta = np.concatenate([df.correctedTwoTheta[np.logical_not(df.mask)] for df in self],axis=0)
-        else:
-            twThetaList = []
-            for df in self:
-                if len(df.twoTheta.shape) == 2: # shape is (df,z,twoTheta), needs to be passed as (df,n,z,twoTheta)
-                    twThetaList.append(df.twoTheta[np.newaxis].repeat(df.countShape[0],axis=0)[np.logical_not(df.mask)]) # n = scan steps
-                else:
-                    twThetaList.append(df.twoTheta[np.logical_not(df.mask)])
-            twoTheta = np.concatenate(twThetaList,axis=0)
-            
-            
-
-        if self.type.lower() == 'powder':
-            twoTheta = np.absolute(twoTheta)
+        def blockTwoTheta(df,sl): # shape is (n,z,twoTheta) for n scan steps
+            if correctedTwoTheta:
+                twoTheta = np.broadcast_to(df.correctedTwoTheta,df.countShape)[sl]
+            else:
+                twoTheta = np.broadcast_to(df.twoTheta,df.countShape)[sl]
+            if self.type.lower() == 'powder':
+                twoTheta = np.absolute(twoTheta)
+            return twoTheta
 
         if twoThetaBins is None:
-            anglesMin = np.min(twoTheta)
-            anglesMax = np.max(twoTheta)
+            extremes = []
+            for df in self:
+                for sl in df.chunkSlices():
+                    twoTheta = blockTwoTheta(df,sl)[np.logical_not(df.mask[sl])]
+                    if len(twoTheta)>0:
+                        extremes.append([np.min(twoTheta),np.max(twoTheta)])
+            anglesMin = np.min([e[0] for e in extremes])
+            anglesMax = np.max([e[1] for e in extremes])
             twoThetaBins = np.arange(anglesMin-0.5*dTheta,anglesMax+0.51*dTheta,dTheta)
 
-        if self.type.lower() == 'singlecrystal':
-            monitorRepeated = np.array([np.ones(df.countShape)*df.monitor.reshape(-1,1,1) for df in self])
-        else:
-            monitorRepeated = np.concatenate([np.repeat(np.repeat(df.monitor[:,np.newaxis,np.newaxis],df.countShape[-2],axis=1),df.countShape[-1],axis=2)[np.logical_not(df.mask)] for df in self])
-            
-        counts = np.concatenate([df.counts[np.logical_not(df.mask)] for df in self])
-        
-        summedRawIntensity, _ = np.histogram(twoTheta,bins=twoThetaBins,weights=counts)
-
-        if applyCalibration:
-            normalization = np.concatenate([np.repeat(df.normalization,df.countShape[0],axis=0)[np.logical_not(df.mask)] for df in self])
-            summedMonitor, _ = np.histogram(twoTheta,bins=twoThetaBins,weights=monitorRepeated*normalization)
-        else:
-            summedMonitor, _ = np.histogram(twoTheta,bins=twoThetaBins,weights=monitorRepeated)
-        
-        #inserted, _  = np.histogram(twoTheta[np.logical_not(self.mask)],bins=twoThetaBins)
+        # Counts and monitor are accumulated block by block into the twoTheta bins, monitor and normalization 
+        # are broadcast to the shape of the block instead of repeated for each scan step
+        summedRawIntensity = np.zeros(len(twoThetaBins)-1)
+        summedMonitor = np.zeros(len(twoThetaBins)-1)
+        for df in self:
+            twoTheta = blockTwoTheta(df,slice(None))
+            equalSteps = twoTheta.shape[0] == 1 or twoTheta.strides[0] == 0 # twoTheta of pixels is equal for all scan steps
+            if equalSteps:
+                plan = _integrationPlan(twoTheta[0],twoThetaBins,splitPixels=splitPixels)
+            for sl,counts,_,monitor,mask in df.iterChunks():
+                if not equalSteps:
+                    plan = _tools.IntegrationPlan(twoTheta[sl],twoThetaBins,widths=_pixelWidths(twoTheta[sl]) if splitPixels else None)
+                weights = [counts,np.broadcast_to(monitor.reshape(-1,1,1),counts.shape)]
+                if applyCalibration:
+                    weights[1] = weights[1]*np.broadcast_to(df.normalization,counts.shape)
+                intensity,monitorCount = plan.integrate(weights,mask=mask)
+                summedRawIntensity += intensity
+                summedMonitor += monitorCount
         
         normalizedIntensity = np.divide(summedRawIntensity,summedMonitor)
         normalizedIntensityError =  np.sqrt(summedRawIntensity)/summedMonitor
@@ -203,7 +501,7 @@ class DataSet(object):
         return twoThetaBins, normalizedIntensity, normalizedIntensityError,summedMonitor
     
 
-    @_tools.KwargChecker(function=plt.errorbar,include=_tools.MPLKwargs)
+    @_tools.KwargChecker(function='matplotlib.pyplot.errorbar',include=_tools.MPLKwargs)
     def plotTwoTheta(self,ax=None,twoThetaBins=None,applyCalibration=True,correctedTwoTheta=True,dTheta=0.125,**kwargs):
         """Plot intensity as function of correctedTwoTheta or twoTheta
         Kwargs:
@@ -231,6 +529,7 @@ class DataSet(object):
             kwargs['fmt'] = '-'
 
         if ax is None:
+            import matplotlib.pyplot as plt
             fig,ax = plt.subplots()
 
         ax._errorbar = ax.errorbar(TwoThetaPositions,normalizedIntensity,yerr=normalizedIntensityError,**kwargs)
@@ -531,7 +830,7 @@ class DataSet(object):
     #     return Ax
 
     def Viewer3D(self,dqx,dqy,dqz,rlu=True,axis=2, raw=False,  log=False, grid = True, outputFunction=print, 
-                 cmap='viridis',smart=False, steps=None, multiplicationFactor=1):
+                 cmap='viridis',smart=False, steps=None, multiplicationFactor=1, workers=None, cache=False):
 
         """Generate a 3D view of all data files in the DatSet.
         
@@ -551,6 +850,8 @@ class DataSet(object):
             - outputFunction (function): Function called when clicking on the figure (default print)
             - cmap (str): Name of color map used for plot (default viridis)
             - multiplicationFactor (float): Multiply intensities with this factor (default 1)
+            - workers (int): Number of worker processes used for binning (default None, serial binning)
+            - cache (bool): Reuse binned data from the volume store if present, otherwise store it (default False)
         
         """
 
@@ -591,84 +892,115 @@ class DataSet(object):
         else:
             axes = None
 
-        Data,bins,_ = self.binData3D(dqx,dqy,dqz,rlu=rlu,raw=raw,smart=smart,steps=steps)
+        Data,bins,_ = self.binData3D(dqx,dqy,dqz,rlu=rlu,raw=raw,smart=smart,steps=steps,workers=workers,cache=cache)
 
-        Data*=multiplicationFactor
-
-        return Viewer3D.Viewer3D(Data,bins,axis=axis, ax=axes, grid=grid, log=log, outputFunction=outputFunction, cmap=cmap)
+        from DMCpy import Viewer3D
+        return Viewer3D.Viewer3D(Data,bins,axis=axis, ax=axes, grid=grid, log=log, outputFunction=outputFunction, cmap=cmap, multiplicationFactor=multiplicationFactor)
     
-    def binData3D(self,dqx,dqy,dqz,rlu=True,raw=False,smart=False,steps=10):
+    def binData3D(self,dqx,dqy,dqz,rlu=True,raw=False,smart=False,steps=10,workers=None,cache=False,sparse=False,cacheIndex=False):
+        """Bin all data files into equidistant 3D bins
 
-        maximas = []
-        minimas = []
-        for df in self:
-            if rlu:
-                pos = np.einsum('ij,jk',df.sample.ROT,df.q[None].reshape(3,-1))
-            else:
-                pos = df.q[None].reshape(3,-1)
-            maximas.append(np.max(pos,axis=1))
-            minimas.append(np.min(pos,axis=1))
+        Args:
 
-        maximas = np.max(maximas,axis=0)
-        minimas = np.min(minimas,axis=0)
-        extremePositions = np.array([minimas,maximas]).T
-        bins = _tools.calculateBins(dqx,dqy,dqz,extremePositions)
+            - dqx (float): Bin size along first axis in 1/AA
 
-        returndata = None
-        for df in self:
-            
-            if steps is None:
-                steps = len(df)
-            
-            stepsTaken = 0
+            - dqy (float): Bin size along second axis in 1/AA
 
-                
-            for idx in _tools.arange(0,len(df),steps):
-                q = df.q[idx[0]:idx[1]]
-                if raw:
-                    dat = df.countsSliced(slice(idx[0],idx[1]))
-                else:
-                    dat = df.intensitySliced(slice(idx[0],idx[1]))
-                    
+            - dqz (float): Bin size along third axis in 1/AA
 
-                mon = df.monitor[idx[0]:idx[1]]
-                mon=np.repeat(np.repeat(mon[:,np.newaxis],dat.shape[1],axis=1)[:,:,np.newaxis],dat.shape[2],axis=-1)
-                
-                print(df.fileName,'from',idx[0],'to',idx[-1])
-                stepsTaken+=steps
+        Kwargs:
 
-                if rlu:
-                    pos = np.einsum('ij,j...',df.sample.ROT,q).transpose(0,3,1,2) # shape -> steps,3,128,1152
+            - rlu (bool): Bin in the sample frame given by the projection vectors, otherwise in the instrument frame (default True)
 
-                else:
-                    pos = q.transpose(1,0,2,3)# shape -> steps,3,128,1152
+            - raw (bool): If True bin counts else normalized counts (default False)
 
-                if True:
-                    pos = pos.transpose(1,0,2,3)
-                    boolMask = np.logical_not(df.mask[idx[0]:idx[1]].flatten())
-                    localReturndata,_ = _tools.binData3D(dqx,dqy,dqz,pos=pos.reshape(3,-1)[:,boolMask],data=dat.flatten()[boolMask],mon=mon.flatten()[boolMask],bins = bins)
+            - steps (int): Number of scan steps binned at once (default 10)
 
-                    if returndata is None:
-                        returndata = localReturndata
-                    else:
+            - workers (int): Number of worker processes binning blocks of scan steps in parallel. If None or 1, blocks are binned serially (default None)
 
-                        
-                        for data,newData in zip(returndata,localReturndata):
-                            data+=newData
-                    
-        with warnings.catch_warnings() as w:
-            warnings.simplefilter("ignore")
-            intensities = np.divide(returndata[0],returndata[1])
-            errors = np.divide(np.sqrt(returndata[0]),returndata[1])
-        NaNs = returndata[-1]==0
-        intensities[NaNs]=np.nan
-        errors[NaNs]=np.nan
+            - cache (bool): If True, the binned intensities and errors are kept in the volume store, keyed by data, mask, 
+              normalization, sample rotation and bin sizes, and reused by later calls as read-only arrays memory-mapped from 
+              the volume file (default False)
+
+            - sparse (bool): If True, only occupied bins are accumulated and intensities and errors are returned as SparseHistogram. 
+              Use intensities.toDense(0,fillValue=np.nan) for the dense array. Not possible together with cache (default False)
+
+            - cacheIndex (bool): If True, the voxel index of all pixels is kept in voxelIndexCache such that rebinning into the same bins 
+              after changing mask, normalization, or raw only redoes the accumulation. Useful for repeated binning (default False)
+
+        Returns:
+
+            - intensities (3D array): Intensity divided by monitor, NaN in empty bins
+
+            - bins (RegularGrid): Bins used
+
+            - errors (3D array): Error of intensities, NaN in empty bins
+
+        With workers, the blocks are binned in parallel and the partial histograms summed in block order as for serial binning, 
+        such that the result is identical for any number of workers.
+
+        """
+        if sparse:
+            if cache:
+                raise AttributeError('Sparse binning cannot be combined with cache.')
+            bins,returndata = self._binData3DRaw(dqx,dqy,dqz,rlu=rlu,raw=raw,steps=steps,workers=workers,sparse=True,cacheIndex=cacheIndex)
+            intensity,monitor,_ = returndata.values # All stored bins are hit at least once
+            with warnings.catch_warnings() as w:
+                warnings.simplefilter("ignore")
+                intensities = _tools.SparseHistogram(returndata.shape,returndata.indices,[np.divide(intensity,monitor)])
+                errors = _tools.SparseHistogram(returndata.shape,returndata.indices,[np.divide(np.sqrt(intensity),monitor)])
+            return intensities,bins,errors
+
+        def loader():
+            bins,returndata = self._binData3DRaw(dqx,dqy,dqz,rlu=rlu,raw=raw,steps=steps,workers=workers,cacheIndex=cacheIndex)
+            with warnings.catch_warnings() as w:
+                warnings.simplefilter("ignore")
+                intensities = np.divide(returndata[0],returndata[1])
+                errors = np.divide(np.sqrt(returndata[0]),returndata[1])
+            NaNs = returndata[-1]==0
+            intensities[NaNs]=np.nan
+            errors[NaNs]=np.nan
+            return bins,[intensities,errors]
+
+        if cache:
+            key = _volumeKey(self,'binData3D',dqx,dqy,dqz,rlu,raw,rotation=rlu)
+            bins,(intensities,errors) = _tools.volumeStore.get(key,['intensity','error'],loader)
+        else:
+            bins,(intensities,errors) = loader()
         return intensities,bins,errors
 
-    @_tools.KwargChecker()
-    @_tools.overWritingFunctionDecorator(RLUAxes.createRLUAxes)
-    def createRLUAxes(*args,**kwargs): # pragma: no cover
-        raise RuntimeError('This code is not meant to be run but rather is to be overwritten by decorator. Something is wrong!! Should run {}'.format(RLUAxes.createRLUAxes))
+    def _binData3DRaw(self,dqx,dqy,dqz,rlu=True,raw=False,steps=10,workers=None,sparse=False,cacheIndex=False):
+        """Return bins and summed intensity, monitor, and hit count grids as used by binData3D, as SparseHistogram if sparse"""
+        blocks = [(fileIndex,sl) for fileIndex,df in enumerate(self) for sl in df.chunkSlices(steps=steps)]
+        extremes = np.array([_fileExtremes(df,rlu) for df in self])
+        extremePositions = np.array([np.min(extremes[:,0],axis=0),np.max(extremes[:,1],axis=0)]).T
+        bins = _tools.calculateBins(dqx,dqy,dqz,extremePositions)
+
+        returndata = None
+        if workers is None or workers <= 1 or len(blocks) < 2:
+            for fileIndex,sl in blocks:
+                df = self[fileIndex]
+                print(df.fileName,'from',sl.start,'to',sl.stop)
+                returndata = _addHistograms(returndata,_binBlock(df,sl,bins,rlu,raw,sparse,cacheIndex),sparse)
+        else:
+            # Blocks are binned by the workers and the partial histograms summed in block order as in the serial loop, such that 
+            # the result does not depend on the number of workers. At most two blocks per worker are submitted ahead to bound
+            # the memory held by partial histograms waiting to be summed.
+            arguments = ((fileIndex,sl,bins,rlu,raw,sparse,cacheIndex) for fileIndex,sl in blocks)
+            with ProcessPoolExecutor(max_workers=workers,initializer=_initializeBinning,initargs=(self.dataFiles,)) as executor:
+                pending = deque()
+                for argument in arguments:
+                    pending.append(executor.submit(_binBlockWorker,argument))
+                    if len(pending) >= 2*workers:
+                        returndata = _addHistograms(returndata,pending.popleft().result(),sparse)
+                while pending:
+                    returndata = _addHistograms(returndata,pending.popleft().result(),sparse)
+        return bins,returndata
+
+    @_tools.KwargChecker(function='DMCpy.RLUAxes.createRLUAxes')
+    def createRLUAxes(self,*args,**kwargs): # pragma: no cover
+        from DMCpy import RLUAxes # Imported on first use as it loads matplotlib
+        return RLUAxes.createRLUAxes(self,*args,**kwargs)
 
         
     def plotCut1D(self,P1,P2,rlu=True,stepSize=0.01,width=0.05,widthZ=0.05,raw=False,optimize=True,ax=None,fmt='.',**kwargs):
@@ -802,7 +1134,7 @@ class DataSet(object):
                 if not np.isclose(np.abs(np.dot(direction,[0,0,1])),1.0):
                     maxQz = np.max([QStart[2],QStop[2]])+widthZ*expansionFactior
                     minQz = np.min([QStart[2],QStop[2]])-widthZ*expansionFactior
-                    qzIdx = np.array(np.sort(np.array([np.argmin(np.abs(w-df.q[None][2,0,:,0])) for w in [minQz,maxQz]])))
+                    qzIdx = np.array(np.sort(np.array([np.argmin(np.abs(w-df.q[0][2,0,:,0])) for w in [minQz,maxQz]]))) # qz is independent of A3
                 else:
                     qzIdx = np.array([0,df.counts.shape[1]])#np.sort(np.array([np.argmin(np.abs(p[2]-df.q[2,0,:,0])) for p in [P1,P2]])))
                 
@@ -812,7 +1144,8 @@ class DataSet(object):
                         twoThetaIdx[0]:twoThetaIdx[1]+1]=True
                 
                 data = data[mask]
-                relativePosition = df.q[None][:,mask]-QStart.reshape(3,-1)
+                # Only evaluate q within the box of the mask
+                relativePosition = df.q[A3Idx[0]:A3Idx[1]+1][:,:,qzIdx[0]:qzIdx[1]+1,twoThetaIdx[0]:twoThetaIdx[1]+1].reshape(3,-1)-QStart.reshape(3,-1)
                 
             else:
                 # along = np.einsum('ij,i...->...j',relativePosition,directionVector)
@@ -922,7 +1255,7 @@ class DataSet(object):
 
 
 
-    def autoAlignScatteringPlane(self,scatteringNormal,threshold=30,dx=0.04,dy=0.04,dz=0.08,distanceThreshold=0.15):
+    def autoAlignScatteringPlane(self,scatteringNormal,threshold=30,dx=0.04,dy=0.04,dz=0.08,distanceThreshold=0.15,cache=False):
         """Automatically align scattering plane and peaks within
         
         Args:
@@ -941,6 +1274,8 @@ class DataSet(object):
             - dz (float): size of 3D binning along Qz (default 0.08)
             
             - distanceThreshold (float): Distance in 1/AA where peaks are clustered together (default 0.15)
+
+            - cache (bool): If True, binned data of each file is kept in the volume store and reused by later calls (default False)
           
             
         This methods is an attempt to automatically align the scattering plane of all data files
@@ -983,10 +1318,7 @@ class DataSet(object):
         for df in self:
             
             # 1) 
-            Intensities,bins = _tools.binData3D(dx,dy,dz,df.q[None].reshape(3,-1),df.intensity)
-            with warnings.catch_warnings() as w:
-                warnings.simplefilter("ignore")
-                Intensities = np.divide(Intensities[0],Intensities[1])
+            bins,Intensities = _binDataFile(df,dx,dy,dz,cache=cache)
             
             
             # 2)
@@ -994,9 +1326,8 @@ class DataSet(object):
             
             ints = Intensities[possiblePeaks]
             
-            centerPoints = [b[:-1,:-1,:-1]+0.5*dB for b,dB in zip(bins,[dx,dy,dz])]
-            
-            positions = np.array([b[possiblePeaks] for b in centerPoints]).T
+            # Only positions of bins above threshold are calculated from the 1D edges
+            positions = np.array([edges[:-1][index]+0.5*dB for edges,index,dB in zip(bins.edges,np.nonzero(possiblePeaks),[dx,dy,dz])]).T
             
             
             
@@ -1136,7 +1467,7 @@ class DataSet(object):
 
 
     
-    def autoAlignToRef(self,scatteringNormal,inPlaneRef=None,planeVector2=None,threshold=30,dx=0.04,dy=0.04,dz=0.08,distanceThreshold=0.15,axisOffset=0.0):
+    def autoAlignToRef(self,scatteringNormal,inPlaneRef=None,planeVector2=None,threshold=30,dx=0.04,dy=0.04,dz=0.08,distanceThreshold=0.15,axisOffset=0.0,cache=False):
         """Automatically align scattering plane and peaks within
         
         Args:
@@ -1155,6 +1486,8 @@ class DataSet(object):
             - dz (float): size of 3D binning along Qz (default 0.08)
             
             - distanceThreshold (float): Distance in 1/AA where peaks are clustered together (default 0.15)
+
+            - cache (bool): If True, binned data of each file is kept in the volume store and reused by later calls (default False)
           
             
         This methods is an attempt to automatically align the scattering plane of all data files
@@ -1197,19 +1530,15 @@ class DataSet(object):
         for df in self:
             
             # 1) 
-            Intensities,bins = _tools.binData3D(dx,dy,dz,df.q[None].reshape(3,-1),df.intensity)
-            with warnings.catch_warnings() as w:
-                warnings.simplefilter("ignore")
-                Intensities = np.divide(Intensities[0],Intensities[1])
+            bins,Intensities = _binDataFile(df,dx,dy,dz,cache=cache)
             
             
             # 2)
             possiblePeaks = Intensities>threshold
             ints = Intensities[possiblePeaks]
             
-            centerPoints = [b[:-1,:-1,:-1]+0.5*dB for b,dB in zip(bins,[dx,dy,dz])]
-            
-            positions = np.array([b[possiblePeaks] for b in centerPoints]).T
+            # Only positions of bins above threshold are calculated from the 1D edges
+            positions = np.array([edges[:-1][index]+0.5*dB for edges,index,dB in zip(bins.edges,np.nonzero(possiblePeaks),[dx,dy,dz])]).T
             
             
             
@@ -1475,7 +1804,7 @@ class DataSet(object):
             s.projectionVectors = np.array([s.P1,s.P2,s.P3]).T
 
 
-    def peakSearch(self,threshold=30,dx=0.04,dy=0.04,dz=0.08,distanceThreshold=0.15):
+    def peakSearch(self,threshold=30,dx=0.04,dy=0.04,dz=0.08,distanceThreshold=0.15,cache=False):
         """ Search for peaks in data set
           
         Kwargs:
@@ -1489,6 +1818,8 @@ class DataSet(object):
             - dz (float): size of 3D binning along Qz (default 0.08)
             
             - distanceThreshold (float): Distance in 1/AA where peaks are clustered together (default 0.15)
+
+            - cache (bool): If True, binned data of each file is kept in the volume store and reused by later calls (default False)
           
             
         This methods is an attempt to automatically align the scattering plane of all data files
@@ -1512,10 +1843,7 @@ class DataSet(object):
         for df in self:
             
             # 1) 
-            Intensities,bins = _tools.binData3D(dx,dy,dz,df.q[None].reshape(3,-1),df.intensity)
-            with warnings.catch_warnings() as w:
-                warnings.simplefilter("ignore")
-                Intensities = np.divide(Intensities[0],Intensities[1])
+            bins,Intensities = _binDataFile(df,dx,dy,dz,cache=cache)
             
             
             # 2)
@@ -1523,9 +1851,8 @@ class DataSet(object):
             
             ints = Intensities[possiblePeaks]
             
-            centerPoints = [b[:-1,:-1,:-1]+0.5*dB for b,dB in zip(bins,[dx,dy,dz])]
-            
-            positions = np.array([b[possiblePeaks] for b in centerPoints]).T
+            # Only positions of bins above threshold are calculated from the 1D edges
+            positions = np.array([edges[:-1][index]+0.5*dB for edges,index,dB in zip(bins.edges,np.nonzero(possiblePeaks),[dx,dy,dz])]).T
             
             
             
@@ -1627,6 +1954,7 @@ class DataSet(object):
                     folderType = '/'.join(HDFTranslation['backgroundType'].split('/')[:-1])
                     nameType = HDFTranslation['backgroundType'].split('/')[-1]
                     f[folderType].create_dataset(nameType,data=np.string_(['powder']))
+                fg.invalidateCache()
             else:
                 fg._background = newBG
 
@@ -1680,6 +2008,7 @@ class DataSet(object):
                     folderType = '/'.join(HDFTranslation['backgroundType'].split('/')[:-1])
                     nameType = HDFTranslation['backgroundType'].split('/')[-1]
                     f[folderType].create_dataset(nameType,data=np.string_(['singleCrystal']))
+                fg.invalidateCache()
             else:
                 fg._background = newBG
 
@@ -1688,7 +2017,7 @@ class DataSet(object):
                   
 
 
-    def export_PSI_format(self,dTheta=0.125,twoThetaOffset=0,bins=None,hourNormalization=False,outFile=None,addTitle=None,outFolder=None,useMask=False,maxAngle=5,applyCalibration=True,correctedTwoTheta=True,sampleName=True,sampleTitle=True,temperature=False,magneticField=False,electricField=False,fileNumber=False,waveLength=False):
+    def export_PSI_format(self,dTheta=0.125,twoThetaOffset=0,bins=None,hourNormalization=False,outFile=None,addTitle=None,outFolder=None,useMask=False,maxAngle=5,applyCalibration=True,correctedTwoTheta=True,sampleName=True,sampleTitle=True,temperature=False,magneticField=False,electricField=False,fileNumber=False,waveLength=False,reduction=None):
 
         """
         The function takes a data set and merge the files.
@@ -1732,6 +2061,8 @@ class DataSet(object):
                 
             - correctedTwoTheta (bool): Use corrected two theta for 2D data (default true)
             
+            - reduction (tuple): Result of reducePowder to be exported instead of reducing data again (default None)
+            
         Returns:
             
             .dat file in PSI format with input name
@@ -1753,13 +2084,10 @@ class DataSet(object):
         anglesMin = np.min(twoTheta[:,0])
         anglesMax = np.max(twoTheta[:,1])
         
-        if bins is None:
-            bins = np.arange(anglesMin-0.5*dTheta,anglesMax+0.51*dTheta,dTheta)
-
-        if useMask is True:
-            self.generateMask(maxAngle=maxAngle,replace=False)
+        if reduction is None:
+            reduction = self.reducePowder(dTheta=dTheta,bins=bins,useMask=useMask,maxAngle=maxAngle,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta)
 
-        bins,intensity,err,monitor = self.sumDetector(bins,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta)
+        bins,intensity,err,monitor = [np.array(x) for x in reduction] # Copy as intensity and err are rescaled below
         
         bins = bins + twoThetaOffset
         
@@ -1784,20 +2112,7 @@ class DataSet(object):
         meanTemp = np.mean(temperatures)
         stdTemp = np.std(temperatures)
 
-        if np.all([x == self[0].sample.name for x in [s.name for s in self.sample[1:]]]):
-            samName = self[0].sample.name        #.decode("utf-8")
-        else:
-            samName ='Unknown! Combined different sample names'
-        
-        if np.all([x == self[0].title for x in [s.title for s in self[1:]]]):
-            samTitle = self[0].title        #.decode("utf-8")
-        else:
-            samTitle ='Unknown! Combined different sample titles'
-
-        if np.all([np.isclose(df.wavelength,self[0].wavelength) for df in self[1:]]):
-            wavelength = self[0].wavelength
-        else:
-            wavelength ='Unknown! Combined different Wavelengths'
+        samName,samTitle,wavelength,year,fileNumbers = self._exportInfo()
         
 
         # reshape intensity and err to fit into (10,x)
@@ -1818,16 +2133,10 @@ class DataSet(object):
             paramLine2= ' '+' '.join(["{:7.3f}".format(x) for x in [start,step,stop]])+" {:7.0f}".format(meanMonitor)+'., sample="'+samName+'"'
         else:
             paramLine2= ' '+' '.join(["{:7.3f}".format(x) for x in [start,step,stop]])+" {:7.0f}".format(oneHourMonitor)+'., sample="'+samName+'"'   
-        dataLinesInt = '\n'.join([' '+' '.join(["{:6.0f}.".format(x).replace('nan.','    ') for x in line]) for line in intensity])
-        dataLinesErr = '\n'.join([' '+' '.join(["{:7.1f}".format(x).replace('nan.','    ') for x in line]) for line in err])
+        dataLinesInt = _formatLines(intensity,'%6.0f.',10,prefix=' ').replace('nan.','    ')
+        dataLinesErr = _formatLines(err,'%7.1f',10,prefix=' ')
         
         ## Generate bottom information part
-        if len(self) == 1:
-            year = 2022
-            fileNumbers = str(int(self[0].fileName.split('n')[-1].split('.')[0]))
-        else:
-            year,fileNumbers = _tools.numberStringGenerator([df.fileName for df in self])
-        
         fileList = " Filelist='dmc:{}:{}'".format(year,fileNumbers)
         
         minmax = [np.nanmin,np.nanmax]
@@ -1869,40 +2178,10 @@ class DataSet(object):
         paramLines.append("")
         fileString = '\n'.join([titleLine,paramLine,paramLine2,dataLinesInt,dataLinesErr,fileList,*paramLines])
         
-        magneticFields = [df.magneticField for df in self]
-        mag = np.mean(magneticFields)
-
-        electricFields = [df.electricField for df in self]
-        elec = np.mean(electricFields)
-        
-        if outFile is None:
-            saveFile = "DMC"
-            if hourNormalization == True:
-                saveFile += "_n"
-            if sampleName == True:
-                saveFile += f"_{samName[:20]}"
-            if sampleTitle ==True:
-                saveFile += f"_{samTitle[:30]}"
-            if temperature == True:
-                saveFile += "_" + str(meanTemp).replace(".","p")[:5] + "K"
-            if magneticField == True:
-                saveFile += "_" + str(mag) + "T"
-            if electricField == True:
-                saveFile += "_" + str(elec) + "keV"
-            if waveLength == True:
-                saveFile += "_{}AA".format(str(wavelength).replace('.','p')[:5])
-            if fileNumber == True:
-                saveFile += "_" + fileNumbers.replace(',','_') 
-            if addTitle is not None:
-                saveFile += "_" + str(addTitle)
-            if useMask == True:
-                saveFile += '_HR'
-        else:
-            saveFile = str(outFile.replace('.dat',''))
-            if useMask == True:
-                saveFile += '_HR'
-        
-        saveFile=saveFile.replace('__','_').replace('__','_').replace(' ','_').replace('.','p')
+        saveFile = self._exportFileName('.dat',samName=samName,samTitle=samTitle,meanTemp=meanTemp,wavelength=wavelength,fileNumbers=fileNumbers,
+                                        hourNormalization=hourNormalization,outFile=outFile,addTitle=addTitle,useMask=useMask,sampleName=sampleName,
+                                        sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,
+                                        fileNumber=fileNumber,waveLength=waveLength)
 
         if outFolder is None:
             outFolder = os.getcwd()
@@ -1910,7 +2189,7 @@ class DataSet(object):
         with open(os.path.join(outFolder,saveFile)+".dat",'w') as sf:
             sf.write(fileString)
 
-    def export_xye_format(self,dTheta=0.125,twoThetaOffset=0,bins=None,hourNormalization=False,outFile=None,addTitle=None,outFolder=None,useMask=False,maxAngle=5,applyCalibration=True,correctedTwoTheta=True,sampleName=True,sampleTitle=True,temperature=False,magneticField=False,electricField=False,fileNumber=False,waveLength=False):
+    def export_xye_format(self,dTheta=0.125,twoThetaOffset=0,bins=None,hourNormalization=False,outFile=None,addTitle=None,outFolder=None,useMask=False,maxAngle=5,applyCalibration=True,correctedTwoTheta=True,sampleName=True,sampleTitle=True,temperature=False,magneticField=False,electricField=False,fileNumber=False,waveLength=False,reduction=None):
 
         """
         The function takes a data set and merge the files.
@@ -1951,6 +2230,8 @@ class DataSet(object):
                 
             - correctedTwoTheta (bool): Use corrected two theta for 2D data (default true)
             
+            - reduction (tuple): Result of reducePowder to be exported instead of reducing data again (default None)
+            
         Returns:
             
             .xye file in with a comment line with info and xye data
@@ -1967,18 +2248,10 @@ class DataSet(object):
             
         """
 
-        twoTheta = np.asarray([[func(np.abs(df.twoTheta)) for func in [np.min,np.max]] for df in self])
-        
-        anglesMin = np.min(twoTheta[:,0])
-        anglesMax = np.max(twoTheta[:,1])
-        
-        if bins is None:
-            bins = np.arange(anglesMin-0.5*dTheta,anglesMax+0.51*dTheta,dTheta)
-        
-        if useMask is True:
-            self.generateMask(maxAngle=maxAngle,replace=False)
+        if reduction is None:
+            reduction = self.reducePowder(dTheta=dTheta,bins=bins,useMask=useMask,maxAngle=maxAngle,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta)
 
-        bins,intensity,err,monitor = self.sumDetector(bins,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta)
+        bins,intensity,err,monitor = [np.array(x) for x in reduction] # Copy as intensity and err are rescaled below
  
         bins = bins + twoThetaOffset
         
@@ -2002,40 +2275,12 @@ class DataSet(object):
         Centres=0.5*(bins[1:]+bins[:-1])
         saveData = np.array([Centres,intensity,err])
         
-        if np.all([x == self[0].sample.name for x in [s.name for s in self.sample[1:]]]):
-            samName = self[0].sample.name        #.decode("utf-8")
-        else:
-            samName ='Unknown! Combined different sample names'
-        
-        if np.all([x == self[0].title for x in [s.title for s in self[1:]]]):
-            samTitle = self[0].title        #.decode("utf-8")
-        else:
-            samTitle ='Unknown! Combined different sample titles'
-
-        if np.all([np.isclose(df.wavelength,self[0].wavelength) for df in self[1:]]):
-            wavelength = self[0].wavelength
-        else:
-            wavelength ='Unknown! Combined different Wavelengths'
+        samName,samTitle,wavelength,year,fileNumbers = self._exportInfo()
             
         
         temperatures = np.array([df.temperature for df in self])
         meanTemp = np.mean(temperatures)
         
-        magneticFields = [df.magneticField for df in self]
-        mag = np.mean(magneticFields)
-
-        electricFields = [df.electricField for df in self]
-        elec = np.mean(electricFields)
-
-        # fileNumbers = str(self.fileName) 
-        # fileNumbers_short = str(int(self.fileName[0].split('n')[-1].split('.')[0]))  # 
-        
-        if len(self) == 1:
-            year = 2022
-            fileNumbers = str(int(self[0].fileName.split('n')[-1].split('.')[0]))
-        else:
-            year,fileNumbers = _tools.numberStringGenerator([df.fileName for df in self])
-        
         titleLine1 = f"# DMC at SINQ, PSI: Sample name = {samName}, title = {samTitle}, wavelength = {str(wavelength)[:5]} AA, T = {str(meanTemp)[:5]} K"
         titleLine2 = "# Filelist='dmc:{}:{}'".format(year,fileNumbers)
         if useMask is True:
@@ -2046,6 +2291,43 @@ class DataSet(object):
             titleLine3= '# '+' '.join(["{:7.3f}".format(x) for x in [start,step,stop]])+" {:7.0f}".format(oneHourMonitor)+', sample="'+samName+'"'
        
         
+        saveFile = self._exportFileName('.xye',samName=samName,samTitle=samTitle,meanTemp=meanTemp,wavelength=wavelength,fileNumbers=fileNumbers,
+                                        hourNormalization=hourNormalization,outFile=outFile,addTitle=addTitle,useMask=useMask,sampleName=sampleName,
+                                        sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,
+                                        fileNumber=fileNumber,waveLength=waveLength)
+
+        if outFolder is None:
+            outFolder = os.getcwd()
+
+        with open(os.path.join(outFolder,saveFile)+".xye",'w') as sf:
+            sf.write(titleLine1+"\n")    
+            sf.write(titleLine2+"\n") 
+            sf.write(titleLine3+"\n") 
+            sf.write(_formatLines(saveData.T,'%.18e',3,separator='  ')+'\n') # as np.savetxt(sf,saveData.T,delimiter='  ')
+         
+
+    def _exportInfo(self):
+        """Sample name, title, wavelength, year, and file numbers of the data set as used by the export functions"""
+        if np.all([x == self[0].sample.name for x in [s.name for s in self.sample[1:]]]):
+            samName = self[0].sample.name
+        else:
+            samName ='Unknown! Combined different sample names'
+        
+        if np.all([x == self[0].title for x in [s.title for s in self[1:]]]):
+            samTitle = self[0].title
+        else:
+            samTitle ='Unknown! Combined different sample titles'
+
+        if np.all([np.isclose(df.wavelength,self[0].wavelength) for df in self[1:]]):
+            wavelength = self[0].wavelength
+        else:
+            wavelength ='Unknown! Combined different Wavelengths'
+
+        year,fileNumbers = _tools.numberStringGenerator([df.fileName for df in self])
+        return samName,samTitle,wavelength,year,fileNumbers
+
+    def _exportFileName(self,extension,samName,samTitle,meanTemp,wavelength,fileNumbers,hourNormalization=False,outFile=None,addTitle=None,useMask=False,sampleName=True,sampleTitle=True,temperature=False,magneticField=False,electricField=False,fileNumber=False,waveLength=False):
+        """Generate name of exported file (without extension) as used by the export functions"""
         if outFile is None:
             saveFile = "DMC"
             if hourNormalization == True:
@@ -2057,9 +2339,9 @@ class DataSet(object):
             if temperature == True:
                 saveFile += "_" + str(meanTemp).replace(".","p")[:5] + "K"
             if magneticField == True:
-                saveFile += "_" + str(mag) + "T"
+                saveFile += "_" + str(np.mean([df.magneticField for df in self])) + "T"
             if electricField == True:
-                saveFile += "_" + str(elec) + "keV"
+                saveFile += "_" + str(np.mean([df.electricField for df in self])) + "keV"
             if waveLength == True:
                 saveFile += "_{}AA".format(str(wavelength).replace('.','p')[:5])
             if fileNumber == True:
@@ -2069,22 +2351,158 @@ class DataSet(object):
             if useMask == True:
                 saveFile += '_HR'
         else:
-            saveFile = str(outFile.replace('.xye',''))
+            saveFile = str(outFile.replace(extension,''))
             if useMask == True:
                 saveFile += '_HR'
 
-        saveFile=saveFile.replace('__','_').replace('__','_').replace(' ','_').replace('.','p')
+        return saveFile.replace('__','_').replace('__','_').replace(' ','_').replace('.','p')
+
+    def export_npz_format(self,dTheta=0.125,twoThetaOffset=0,bins=None,hourNormalization=False,outFile=None,addTitle=None,outFolder=None,useMask=False,maxAngle=5,applyCalibration=True,correctedTwoTheta=True,sampleName=True,sampleTitle=True,temperature=False,magneticField=False,electricField=False,fileNumber=False,waveLength=False,reduction=None):
+        """Export reduced powder data as binary .npz archive alongside the PSI and xye formats.
+        The archive holds the two theta bins, intensity, error, and monitor with the same scaling as the text formats
+        together with the provenance of the data, and is read by loadReducedPowder.
+
+        Kwargs:
+
+            - all kwargs as for export_PSI_format
+
+        Returns:
+
+            .npz file with input name
+
+        The archive contains the arrays 'bins', 'intensity', 'error', 'monitor', 'scale', and 'hourNormalization' as well
+        as the provenance 'fileList', 'year', 'fileNumbers', 'calibration', 'useMask', 'maxAngle', 'sampleName', 'title',
+        'wavelength', and 'version', and the metadata of reduceSeries, 'fileName', 'startTime', 'temperature', 
+        'magneticField', 'electricField', and 'time'. All entries are loadable without pickle.
+
+        """
+        if reduction is None:
+            reduction = self.reducePowder(dTheta=dTheta,bins=bins,useMask=useMask,maxAngle=maxAngle,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta)
+
+        bins,intensity,err,monitor = [np.array(x) for x in reduction]
+
+        bins = bins + twoThetaOffset
+
+        # rescale intensity and err as for the text formats
+        if hourNormalization is False:
+            scale = np.median(monitor)
+        else:
+            scale = 100000000.0
+        intensity*=scale
+        err*=scale
+
+        samName,samTitle,wavelength,year,fileNumbers = self._exportInfo()
+        if isinstance(wavelength,str): # Combined different wavelengths
+            wavelength = np.nan
+
+        meanTemp = np.mean([df.temperature for df in self])
+
+        saveFile = self._exportFileName('.npz',samName=samName,samTitle=samTitle,meanTemp=meanTemp,wavelength=wavelength,fileNumbers=fileNumbers,
+                                        hourNormalization=hourNormalization,outFile=outFile,addTitle=addTitle,useMask=useMask,sampleName=sampleName,
+                                        sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,
+                                        fileNumber=fileNumber,waveLength=waveLength)
 
         if outFolder is None:
             outFolder = os.getcwd()
 
-        with open(os.path.join(outFolder,saveFile)+".xye",'w') as sf:
-            sf.write(titleLine1+"\n")    
-            sf.write(titleLine2+"\n") 
-            sf.write(titleLine3+"\n") 
-            np.savetxt(sf,saveData.T,delimiter='  ')
-            sf.close()
-         
+        np.savez(os.path.join(outFolder,saveFile)+".npz",bins=bins,intensity=intensity,error=err,monitor=monitor,scale=scale,
+                 hourNormalization=bool(hourNormalization),
+                 fileList=np.array([os.path.basename(df.fileName) for df in self],dtype=str),
+                 year=int(year),fileNumbers=str(fileNumbers),
+                 calibration=np.array([str(getattr(df,'normalizationFile',None)) for df in self],dtype=str),
+                 useMask=bool(useMask),maxAngle=float(maxAngle) if useMask is True else np.nan,
+                 sampleName=str(samName),title=str(samTitle),wavelength=float(wavelength),version=str(DMCpy.__version__),
+                 **{key:str(value) if key in ['fileName','startTime'] else float(value) for key,value in _seriesMetadata(self.dataFiles).items()})
+
+    def reducePowder(self,dTheta=0.125,bins=None,useMask=False,maxAngle=5,applyCalibration=True,correctedTwoTheta=True,splitPixels=False):
+        """Reduce data set to intensity as function of two theta as used by the export functions
+
+        Kwargs:
+
+            - dTheta (float): Step size of binning if no bins are given (default 0.125)
+
+            - bins (list): Bins into which 2theta is to be binned (default min(2theta),max(2theta) in steps of dTheta)
+
+            - useMask (bool): Apply angular mask, added to the current mask of the data files (default False)
+
+            - maxAngle (float): Angle of angular mask (default 5)
+
+            - applyCalibration (bool): Use normalization files (default True)
+
+            - correctedTwoTheta (bool): Use corrected two theta for 2D data (default True)
+
+            - splitPixels (bool): Split pixels between bins by their overlap in 2theta (default False)
+
+        Returns:
+
+            - bins, normalized intensity, normalized intensity error, and monitor as from sumDetector
+
+        """
+        if bins is None:
+            twoTheta = np.asarray([[func(np.abs(df.twoTheta)) for func in [np.min,np.max]] for df in self])
+            anglesMin = np.min(twoTheta[:,0])
+            anglesMax = np.max(twoTheta[:,1])
+            bins = np.arange(anglesMin-0.5*dTheta,anglesMax+0.51*dTheta,dTheta)
+
+        if useMask is True:
+            self.generateMask(maxAngle=maxAngle,replace=False)
+
+        return self.sumDetector(bins,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,splitPixels=splitPixels)
+
+    def exportPowder(self,PSI=True,xye=False,npz=False,useMask=True,onlyHR=False,maxAngle=5,hourNormalization=True,onlyNorm=True,dTheta=0.125,bins=None,applyCalibration=True,correctedTwoTheta=True,**kwargs):
+        """Export data set in all requested formats and normalizations. Data is reduced only once 
+        without and once with angular mask, and all output files are generated from these reductions.
+
+        Kwargs:
+
+            - PSI (bool): Export PSI format (default True)
+
+            - xye (bool): Export xye format (default False)
+
+            - npz (bool): Export binary .npz archive (default False)
+
+            - useMask (bool): Also export data with angular mask (default True)
+
+            - onlyHR (bool): Only export data with angular mask (default False)
+
+            - maxAngle (float): Angle of angular mask (default 5)
+
+            - hourNormalization (bool): Export files normalized to one hour on monitor (default True)
+
+            - onlyNorm (bool): Only export files normalized to one hour on monitor (default True)
+
+            - all other kwargs are passed on to export_PSI_format, export_xye_format, and export_npz_format
+
+        """
+        writers = []
+        if PSI is True:
+            writers.append(self.export_PSI_format)
+        if xye is True:
+            writers.append(self.export_xye_format)
+        if npz is True:
+            writers.append(self.export_npz_format)
+
+        normalizations = []
+        if onlyNorm is False:
+            normalizations.append(False)
+        if hourNormalization is True:
+            normalizations.append(True)
+
+        masks = []
+        if onlyHR is False:
+            masks.append(False)
+        if useMask is True:
+            masks.append(True)
+
+        if len(writers) == 0 or len(normalizations) == 0:
+            return
+
+        for mask in masks: # Unmasked data is to be reduced before mask is applied
+            reduction = self.reducePowder(dTheta=dTheta,bins=bins,useMask=mask,maxAngle=maxAngle,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta)
+            for writer in writers:
+                for normalization in normalizations:
+                    writer(dTheta=dTheta,bins=bins,useMask=mask,maxAngle=maxAngle,hourNormalization=normalization,applyCalibration=applyCalibration,
+                           correctedTwoTheta=correctedTwoTheta,reduction=reduction,**kwargs)
 
     def updateDataFiles(self,key,value):
         if np.all([hasattr(df,key) for df in self]): # all datafiles have the key
@@ -2115,7 +2533,7 @@ class DataSet(object):
 
 
 
-    def cutQPlane(self,points, width, dQx = None, dQy = None, xBins =None, yBins =None, rlu=False, steps=None, sample = None):
+    def cutQPlane(self,points, width, dQx = None, dQy = None, xBins =None, yBins =None, rlu=False, steps=None, sample = None, cacheIndex=False):
         """Perform QPlane cut where points within +-0.5*width are collapsed onto the plane and binned into xBins and yBins
         Args:
             - points (list): List of three points within the wanted plane. X is parallel to point 2 - point 1 (p1, p2, p3 = points)
@@ -2134,9 +2552,12 @@ class DataSet(object):
             
             - rlu (bool): If true utilize sample UB otherwise perform no rotation (default False)
             
-            - steps (int): Number of a3 step computated at once when performing operation (default len(df))
+            - steps (int): Number of a3 step computated at once when performing operation, rounded up to a multiple of the on-disk chunk length (default len(df))
 
             - sample (Sample): Use specified sample for RLU axis if RLU = True (default None = self.sample[0])
+
+            - cacheIndex (bool): If True and xBins and yBins are given, the in-plane bin index and out-of-plane position of all pixels are 
+              kept in voxelIndexCache for repeated cuts, e.g. with another width (default False)
         
         If dQx and dQy is set an automatic binning size is performed, however an error will be thrown if neither dQx (dQy) and  xBins (yBins) are set.
 
@@ -2180,25 +2601,25 @@ class DataSet(object):
         returndata = None
         for df in self:
             
-            if steps is None:
-                steps = len(df)
-            
-            stepsTaken = 0
-            
             totalRotMatDF = totalRotMat
             
-            for idx in _tools.arange(0,len(df),steps):
+            # One block read per step holding counts, monitor and mask
+            for sl,I,_,mon,mask in df.iterChunks(steps=len(df) if steps is None else steps):
                 
-                q = np.einsum('ij,jk->ik',totalRotMatDF,df.q[idx[0]:idx[-1]].reshape(3,-1),optimize='greedy')
-                mask = df.mask[idx[0]:idx[-1]]
+                if autoBins or not cacheIndex:
+                    q = df.q.project(totalRotMatDF,sl).reshape(3,-1)
+                    z = q[2]
+                else: # In-plane bin index of pixels is kept for repeated cuts with fixed bins
+                    index,z = _blockPlane(df,sl,totalRotMatDF,xBins,yBins)
                 
                 # Check that the points are in the plane and take only the local x and y coordinates
-                inside = np.logical_or(np.abs(q[2]-translation)<width*0.5,mask.flatten())
-                q = q[:2,inside]
-                print(df.fileName,'from',idx[0],'to',idx[-1])
-                if q.shape[1] == 0:
+                inside = np.logical_or(np.abs(z-translation)<width*0.5,mask.flatten())
+                print(df.fileName,'from',sl.start,'to',sl.stop)
+                if not np.any(inside):
                     print('Empty slices. Continuing...')
                     continue
+                if autoBins or not cacheIndex:
+                    q = q[:2,inside]
                 if autoBins:
                     
                     xMin,xMax = q[0].min(), q[0].max()
@@ -2237,24 +2658,17 @@ class DataSet(object):
                                 dat.append(mat)
                             returndata = dat          
                 
-                dat = df.intensitySliced(slice(idx[0],idx[1]))
-                    
-                mon = df.monitor[idx[0]:idx[1]]
-                mon=np.repeat(np.repeat(mon[:,np.newaxis],dat.shape[1],axis=1)[:,:,np.newaxis],dat.shape[2],axis=-1)
-                
-                
-                stepsTaken+=steps
-
-                I = df.counts[idx[0]:idx[1]]
-                Norm = df.normalization#[idx[0]:idx[1]]
-                Norm = np.repeat(Norm[np.newaxis],len(I),axis=0).flatten()[inside]
-                
-                I = I.flatten()[inside]
-                dat = dat.flatten()[inside]
-                mon = mon.flatten()[inside]
+                # Monitor and normalization are broadcast to the shape of the block instead of repeated
+                inside = inside.reshape(I.shape)
+                mon = np.broadcast_to(mon[:,np.newaxis,np.newaxis],I.shape)[inside]
+                Norm = np.broadcast_to(df.normalization,I.shape)[inside]
+                I = I[inside]
                 weights = [I,mon,Norm]
                 
-                intensity,monitorCount,Normalization,NormCount = _tools.histogramdd(q.T,bins=(xBins,yBins),weights=weights,returnCounts=True)
+                if autoBins or not cacheIndex:
+                    intensity,monitorCount,Normalization,NormCount = _tools.histogramdd(q.T,bins=(xBins,yBins),weights=weights,returnCounts=True)
+                else:
+                    intensity,monitorCount,Normalization,NormCount = _tools.histogramIndex(index[inside.flatten()],(len(xBins)-1,len(yBins)-1),weights=weights,returnCounts=True)
 
                 if returndata is None:
                     returndata = [intensity,monitorCount,Normalization,NormCount]
@@ -2309,6 +2723,7 @@ class DataSet(object):
             
             
         """
+        import matplotlib.pyplot as plt
         
         if 'zorder' in kwargs:
             zorder = kwargs['zorder']
@@ -2427,6 +2842,7 @@ class DataSet(object):
     
         
         def to_csv(fileName,ax,rmcFile,rmcFileName):
+            import pandas as pd
             Qx,Qy = ax.bins
             QxCenter = 0.25*(Qx[:-1,:-1]+Qx[:-1,1:]+Qx[1:,1:]+Qx[1:,:-1])
             QyCenter = 0.25*(Qy[:-1,:-1]+Qy[:-1,1:]+Qy[1:,1:]+Qy[1:,:-1])
@@ -2484,7 +2900,196 @@ class DataSet(object):
     
             
             
-def add(*listinput,PSI=True,xye=False,folder=None,outFolder=None,dataYear=None,dTheta=0.125,twoThetaOffset=0,bins=None,outFile=None,addTitle=None,useMask=True,onlyHR=False,maxAngle=5,hourNormalization=True,onlyNorm=True,applyCalibration=True,correctedTwoTheta=True,sampleName=True,sampleTitle=True,temperature=False,magneticField=False,electricField=False,fileNumber=False,waveLength=False):
+def reduceSeries(dataFiles,dTheta=0.125,bins=None,useMask=False,maxAngle=5,applyCalibration=True,correctedTwoTheta=True,splitPixels=False,workers=None,PSI=False,xye=False,npz=False,**kwargs):
+    """Reduce each data file of a series, e.g. a temperature or field sweep, onto a common two theta grid.
+
+    Args:
+
+        - dataFiles (list): List of file paths and/or DataFile objects, e.g. from _tools.fileListGenerator
+
+    Kwargs:
+
+        - dTheta (float): Step size of binning if no bins are given (default 0.125)
+
+        - bins (list): Bins into which 2theta is to be binned (default min(2theta),max(2theta) of all files in steps of dTheta)
+
+        - useMask (bool): Apply angular mask, added to the current mask of the data files (default False)
+
+        - maxAngle (float): Angle of angular mask (default 5)
+
+        - applyCalibration (bool): Use normalization files (default True)
+
+        - correctedTwoTheta (bool): Use corrected two theta for 2D data (default True)
+
+        - splitPixels (bool): Split pixels between bins by their overlap in 2theta (default False)
+
+        - workers (int): Number of worker processes used for loading and reducing. If None or 1, files are reduced serially (default None)
+
+        - PSI (bool): Also export each file in PSI format (default False)
+
+        - xye (bool): Also export each file in xye format (default False)
+
+        - npz (bool): Also export each file as binary .npz archive (default False)
+
+        - all other kwargs are passed on to export_PSI_format, export_xye_format, and export_npz_format
+
+    Returns:
+
+        - bins (array): Common two theta bins
+
+        - intensity (array): Normalized intensity of shape (files, bins-1)
+
+        - error (array): Normalized intensity error of shape (files, bins-1)
+
+        - monitor (array): Summed monitor of shape (files, bins-1)
+
+        - metadata (dict): File name, start time, mean temperature, magnetic and electric field, and counting time of each file
+
+    Files with equal detector geometry share the integration plan (within each worker process). With workers, each file is 
+    loaded, reduced, and exported by a worker process and only the reduction is transferred back. If no bins are given, 
+    the two theta range is found from the detector position stored in the files, which are thereby only loaded once.
+
+    Example:
+
+    >>> files = _tools.fileListGenerator('1200-1499',folder,year=2022)
+    >>> bins,intensity,error,monitor,metadata = reduceSeries(files,workers=4)
+    >>> plt.pcolormesh(bins,metadata['temperature'],intensity)
+
+    """
+    if isinstance(dataFiles,(str,DataFile.DataFile)):
+        dataFiles = [dataFiles]
+
+    writers = [writer for writer,export in zip(['export_PSI_format','export_xye_format','export_npz_format'],[PSI,xye,npz]) if export is True]
+    kwargs['dTheta'] = dTheta
+    reductionKwargs = {'bins':bins,'applyCalibration':applyCalibration,'correctedTwoTheta':correctedTwoTheta,'splitPixels':splitPixels}
+
+    if workers is None or workers <= 1 or len(dataFiles) < 2:
+        dataFiles = DataSet(dataFiles).dataFiles
+        if bins is None:
+            reductionKwargs['bins'] = bins = _seriesBins([_twoThetaRange(df) for df in dataFiles],dTheta)
+        results = [_reduceSeriesFile((df,useMask,maxAngle,reductionKwargs,writers,kwargs)) for df in dataFiles]
+    else: # Files are only loaded in the worker processes
+        if bins is None:
+            reductionKwargs['bins'] = bins = _seriesBins([_twoThetaRange(df) for df in dataFiles],dTheta)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_reduceSeriesFile,[(df,useMask,maxAngle,reductionKwargs,writers,kwargs) for df in dataFiles]))
+
+    intensity,error,monitor = [np.array([reduction[i] for reduction,_ in results]) for i in range(1,4)]
+
+    metadata = {key:[fileMetadata[key] for _,fileMetadata in results] for key in ['fileName','startTime']}
+    for key in ['temperature','magneticField','electricField','time']:
+        metadata[key] = np.array([fileMetadata[key] for _,fileMetadata in results])
+
+    return bins,intensity,error,monitor,metadata
+
+
+def loadReducedPowder(fileName,folder=None):
+    """Load binary archive written by export_npz_format.
+
+    Args:
+
+        - fileName (str): Name of .npz archive (extension may be omitted)
+
+    Kwargs:
+
+        - folder (str): Path to directory of archive, default is current working directory
+
+    Returns:
+
+        - bins (array): Two theta bins
+
+        - intensity (array): Intensity scaled as in the exported text formats
+
+        - error (array): Intensity error scaled as in the exported text formats
+
+        - monitor (array): Summed monitor
+
+        - metadata (dict): Scale, normalization, and provenance stored in the archive
+
+    """
+    if folder is None:
+        folder = os.getcwd()
+
+    with np.load(os.path.join(folder,fileName.replace('.npz','')+'.npz'),allow_pickle=False) as archive:
+        bins,intensity,error,monitor = [archive[key] for key in ['bins','intensity','error','monitor']]
+        metadata = {}
+        for key in archive.files:
+            if key in ['bins','intensity','error','monitor']:
+                continue
+            value = archive[key]
+            metadata[key] = value.item() if value.ndim == 0 else value.tolist() if value.dtype.kind == 'U' else value
+
+    return bins,intensity,error,monitor,metadata
+
+
+def loadReducedSeries(fileNames,folder=None):
+    """Load a series of binary archives written by export_npz_format or reduceSeries sharing the same two theta bins.
+
+    Args:
+
+        - fileNames (list): Names of .npz archives
+
+    Kwargs:
+
+        - folder (str): Path to directory of archives, default is current working directory
+
+    Returns:
+
+        - bins, intensity, error, monitor, and metadata as for reduceSeries
+
+    """
+    loaded = [loadReducedPowder(fileName,folder=folder) for fileName in fileNames]
+    bins = loaded[0][0]
+    if not np.all([len(l[0]) == len(bins) and np.allclose(l[0],bins) for l in loaded[1:]]):
+        raise AttributeError('Archives do not share the same two theta bins.')
+
+    intensity,error,monitor = [np.array([l[i] for l in loaded]) for i in range(1,4)]
+    metadata = {key:[l[4][key] for l in loaded] for key in ['fileName','startTime']}
+    for key in ['temperature','magneticField','electricField','time']:
+        metadata[key] = np.array([l[4][key] for l in loaded])
+    return bins,intensity,error,monitor,metadata
+
+
+@_tools.KwargChecker(function='matplotlib.pyplot.errorbar',include=_tools.MPLKwargs)
+def plotReducedPowder(fileName,ax=None,folder=None,**kwargs):
+    """Plot intensity of binary archive written by export_npz_format
+
+    Args:
+
+        - fileName (str): Name of .npz archive
+
+    Kwargs:
+
+        - ax (axis): Matplotlib axis into which data is plotted (default None - generates new)
+
+        - folder (str): Path to directory of archive, default is current working directory
+
+        - All other key word arguments are passed on to plotting routine
+
+    Returns:
+
+        - ax: Matplotlib axis into which data was plotted
+
+    """
+    bins,intensity,error,_,metadata = loadReducedPowder(fileName,folder=folder)
+    TwoThetaPositions = 0.5*(bins[:-1]+bins[1:])
+
+    if not 'fmt' in kwargs:
+        kwargs['fmt'] = '-'
+    if not 'label' in kwargs:
+        kwargs['label'] = metadata['fileNumbers']
+
+    if ax is None:
+        import matplotlib.pyplot as plt
+        fig,ax = plt.subplots()
+
+    ax.errorbar(TwoThetaPositions,intensity,yerr=error,**kwargs)
+    ax.set_xlabel(r'$2\theta$ [deg]')
+    ax.set_ylabel(r'Intensity [arb]')
+    return ax
+
+
+def add(*listinput,PSI=True,xye=False,npz=False,folder=None,outFolder=None,dataYear=None,dTheta=0.125,twoThetaOffset=0,bins=None,outFile=None,addTitle=None,useMask=True,onlyHR=False,maxAngle=5,hourNormalization=True,onlyNorm=True,applyCalibration=True,correctedTwoTheta=True,sampleName=True,sampleTitle=True,temperature=False,magneticField=False,electricField=False,fileNumber=False,waveLength=False):
 
     """
     
@@ -2503,6 +3108,8 @@ def add(*listinput,PSI=True,xye=False,folder=None,outFolder=None,dataYear=None,d
         - PSI (bool): Export PSI format. Default is True
         
         - xye (bool): Export xye format. Default is True
+
+        - npz (bool): Export binary .npz archive, see export_npz_format. Default is False
         - outFolder (str): Path to folder data will be saved. Default is current working directory.
         
         - all from export_PSI_format and export_xye_format
@@ -2559,26 +3166,7 @@ def add(*listinput,PSI=True,xye=False,folder=None,outFolder=None,dataYear=None,d
         inputNumber = _tools.fileListGenerator(listOfDataFiles[:-1],folder,year=dataYear)
         ds = DataSet(inputNumber)
         try:
-            if PSI is True and onlyHR is False:
-                if onlyNorm is False:
-                    ds.export_PSI_format(dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,useMask=False,maxAngle=maxAngle,hourNormalization=False,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)    
-                if hourNormalization is True:
-                    ds.export_PSI_format(dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,useMask=False,maxAngle=maxAngle,hourNormalization=hourNormalization,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)    
-            if xye is True and onlyHR is False:
-                if onlyNorm is False:
-                    ds.export_xye_format(dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,useMask=False,maxAngle=maxAngle,hourNormalization=False,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)    
-                if hourNormalization is True:
-                    ds.export_xye_format(dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,useMask=False,maxAngle=maxAngle,hourNormalization=hourNormalization,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)    
-            if PSI is True and useMask is True:
-                if onlyNorm is False:
-                    ds.export_PSI_format(dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,useMask=useMask,maxAngle=maxAngle,hourNormalization=False,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)    
-                if hourNormalization is True:
-                    ds.export_PSI_format(dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,useMask=useMask,maxAngle=maxAngle,hourNormalization=hourNormalization,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)        
-            if xye is True and useMask is True:
-                if onlyNorm is False:
-                    ds.export_xye_format(dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,useMask=useMask,maxAngle=maxAngle,hourNormalization=False,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)    
-                if hourNormalization is True:
-                    ds.export_xye_format(dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,useMask=useMask,maxAngle=maxAngle,hourNormalization=hourNormalization,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)    
+            ds.exportPowder(PSI=PSI,xye=xye,npz=npz,useMask=useMask,onlyHR=onlyHR,maxAngle=maxAngle,hourNormalization=hourNormalization,onlyNorm=onlyNorm,dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)
         except:
                 print(f"Cannot export! File is wrong format: {elemnt}")                    
 
@@ -2586,7 +3174,7 @@ def add(*listinput,PSI=True,xye=False,folder=None,outFolder=None,dataYear=None,d
 # add(565,566,567,(570),'571-573',[574],sampleName=False,temperature=False)
 
 
-def export(*listinput,PSI=True,xye=False,folder=None,outFolder=None,dataYear=None,dTheta=0.125,twoThetaOffset=0,bins=None,outFile=None,addTitle=None,useMask=True,onlyHR=False,maxAngle=5,hourNormalization=True,onlyNorm=True,applyCalibration=True,correctedTwoTheta=True,sampleName=True,sampleTitle=True,temperature=False,magneticField=False,electricField=False,fileNumber=False,waveLength=False):
+def export(*listinput,PSI=True,xye=False,npz=False,folder=None,outFolder=None,dataYear=None,dTheta=0.125,twoThetaOffset=0,bins=None,outFile=None,addTitle=None,useMask=True,onlyHR=False,maxAngle=5,hourNormalization=True,onlyNorm=True,applyCalibration=True,correctedTwoTheta=True,sampleName=True,sampleTitle=True,temperature=False,magneticField=False,electricField=False,fileNumber=False,waveLength=False):
 
     """
     
@@ -2605,6 +3193,8 @@ def export(*listinput,PSI=True,xye=False,folder=None,outFolder=None,dataYear=Non
         - PSI (bool): Export PSI format. Default is True
         
         - xye (bool): Export xye format. Default is True
+
+        - npz (bool): Export binary .npz archive, see export_npz_format. Default is False
         - outFolder (str): Path to folder data will be saved. Default is current working directory.
         
         - all from export_PSI_format and export_xye_format
@@ -2656,26 +3246,7 @@ def export(*listinput,PSI=True,xye=False,folder=None,outFolder=None,dataYear=Non
         inputNumber = _tools.fileListGenerator(elemnt,folder,year=dataYear)
         ds = DataSet(inputNumber)
         try:
-            if PSI is True and onlyHR is False:
-                if onlyNorm is False:
-                    ds.export_PSI_format(dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,useMask=False,maxAngle=maxAngle,hourNormalization=False,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)    
-                if hourNormalization is True:
-                    ds.export_PSI_format(dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,useMask=False,maxAngle=maxAngle,hourNormalization=hourNormalization,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)    
-            if xye is True and onlyHR is False:
-                if onlyNorm is False:
-                    ds.export_xye_format(dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,useMask=False,maxAngle=maxAngle,hourNormalization=False,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)    
-                if hourNormalization is True:
-                    ds.export_xye_format(dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,useMask=False,maxAngle=maxAngle,hourNormalization=hourNormalization,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)    
-            if PSI is True and useMask is True:
-                if onlyNorm is False:
-                    ds.export_PSI_format(dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,useMask=useMask,maxAngle=maxAngle,hourNormalization=False,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)    
-                if hourNormalization is True:
-                    ds.export_PSI_format(dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,useMask=useMask,maxAngle=maxAngle,hourNormalization=hourNormalization,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)        
-            if xye is True and useMask is True:
-                if onlyNorm is False:
-                    ds.export_xye_format(dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,useMask=useMask,maxAngle=maxAngle,hourNormalization=False,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)    
-                if hourNormalization is True:
-                    ds.export_xye_format(dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,useMask=useMask,maxAngle=maxAngle,hourNormalization=hourNormalization,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)    
+            ds.exportPowder(PSI=PSI,xye=xye,npz=npz,useMask=useMask,onlyHR=onlyHR,maxAngle=maxAngle,hourNormalization=hourNormalization,onlyNorm=onlyNorm,dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)
         except:
                 print(f"Cannot export! File is wrong format: {elemnt}")                    
 
@@ -2686,7 +3257,7 @@ def export(*listinput,PSI=True,xye=False,folder=None,outFolder=None,dataYear=Non
 # export(565,'566',[567,568,570,571],'570-573',(574,575),sampleName=False,temperature=False)  
         
 
-def exportAll(*listinput,PSI=True,xye=False,folder=None,outFolder=None,dataYear=None,dTheta=0.125,twoThetaOffset=0,bins=None,outFile=None,addTitle=None,useMask=True,onlyHR=False,maxAngle=5,hourNormalization=True,onlyNorm=True,applyCalibration=True,correctedTwoTheta=True,sampleName=True,sampleTitle=True,temperature=False,magneticField=False,electricField=False,fileNumber=False,waveLength=False):
+def exportAll(*listinput,PSI=True,xye=False,npz=False,folder=None,outFolder=None,dataYear=None,dTheta=0.125,twoThetaOffset=0,bins=None,outFile=None,addTitle=None,useMask=True,onlyHR=False,maxAngle=5,hourNormalization=True,onlyNorm=True,applyCalibration=True,correctedTwoTheta=True,sampleName=True,sampleTitle=True,temperature=False,magneticField=False,electricField=False,fileNumber=False,waveLength=False):
 
     """
     
@@ -2705,6 +3276,8 @@ def exportAll(*listinput,PSI=True,xye=False,folder=None,outFolder=None,dataYear=
         - PSI (bool): Export PSI format. Default is True
         
         - xye (bool): Export xye format. Default is True
+
+        - npz (bool): Export binary .npz archive, see export_npz_format. Default is False
         - outFolder (str): Path to folder data will be saved. Default is current working directory.
         
         - all from export_PSI_format and export_xye_format
@@ -2759,33 +3332,14 @@ def exportAll(*listinput,PSI=True,xye=False,folder=None,outFolder=None,dataYear=
             print(f"Export of: {fileNumbers}")
             ds = DataSet([elemnt])
             try:
-                if PSI is True and onlyHR is False:
-                    if onlyNorm is False:
-                        ds.export_PSI_format(dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,useMask=False,maxAngle=maxAngle,hourNormalization=False,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)    
-                    if hourNormalization is True:
-                        ds.export_PSI_format(dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,useMask=False,maxAngle=maxAngle,hourNormalization=hourNormalization,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)    
-                if xye is True and onlyHR is False:
-                    if onlyNorm is False:
-                        ds.export_xye_format(dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,useMask=False,maxAngle=maxAngle,hourNormalization=False,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)    
-                    if hourNormalization is True:
-                        ds.export_xye_format(dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,useMask=False,maxAngle=maxAngle,hourNormalization=hourNormalization,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)    
-                if PSI is True and useMask is True:
-                    if onlyNorm is False:
-                        ds.export_PSI_format(dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,useMask=useMask,maxAngle=maxAngle,hourNormalization=False,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)    
-                    if hourNormalization is True:
-                        ds.export_PSI_format(dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,useMask=useMask,maxAngle=maxAngle,hourNormalization=hourNormalization,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)        
-                if xye is True and useMask is True:
-                    if onlyNorm is False:
-                        ds.export_xye_format(dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,useMask=useMask,maxAngle=maxAngle,hourNormalization=False,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)    
-                    if hourNormalization is True:
-                        ds.export_xye_format(dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,useMask=useMask,maxAngle=maxAngle,hourNormalization=hourNormalization,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)    
+                ds.exportPowder(PSI=PSI,xye=xye,npz=npz,useMask=useMask,onlyHR=onlyHR,maxAngle=maxAngle,hourNormalization=hourNormalization,onlyNorm=onlyNorm,dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)
             except:
                     print(f"Cannot export! File is wrong format: {elemnt}")                    
 
 
 
 
-def export_from(startFile,PSI=True,xye=False,folder=None,outFolder=None,dataYear=None,dTheta=0.125,twoThetaOffset=0,bins=None,outFile=None,addTitle=None,useMask=True,onlyHR=False,maxAngle=5,hourNormalization=True,onlyNorm=True,applyCalibration=True,correctedTwoTheta=True,sampleName=True,sampleTitle=True,temperature=False,magneticField=False,electricField=False,fileNumber=False,waveLength=False):
+def export_from(startFile,PSI=True,xye=False,npz=False,folder=None,outFolder=None,dataYear=None,dTheta=0.125,twoThetaOffset=0,bins=None,outFile=None,addTitle=None,useMask=True,onlyHR=False,maxAngle=5,hourNormalization=True,onlyNorm=True,applyCalibration=True,correctedTwoTheta=True,sampleName=True,sampleTitle=True,temperature=False,magneticField=False,electricField=False,fileNumber=False,waveLength=False):
 
     """
     
@@ -2803,6 +3357,8 @@ def export_from(startFile,PSI=True,xye=False,folder=None,outFolder=None,dataYear
         - PSI (bool): Export PSI format. Default is True
         
         - xye (bool): Export xye format. Default is True
+
+        - npz (bool): Export binary .npz archive, see export_npz_format. Default is False
         - outFolder (str): Path to folder data will be saved. Default is current working directory.
         
         - all from export_PSI_format and export_xye_format
@@ -2860,26 +3416,7 @@ def export_from(startFile,PSI=True,xye=False,folder=None,outFolder=None,dataYear
         inputNumber = _tools.fileListGenerator(file,folder,dataYear)
         ds = DataSet(inputNumber)
         try:
-            if PSI is True and onlyHR is False:
-                if onlyNorm is False:
-                    ds.export_PSI_format(dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,useMask=False,maxAngle=maxAngle,hourNormalization=False,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)    
-                if hourNormalization is True:
-                    ds.export_PSI_format(dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,useMask=False,maxAngle=maxAngle,hourNormalization=hourNormalization,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)    
-            if xye is True and onlyHR is False:
-                if onlyNorm is False:
-                    ds.export_xye_format(dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,useMask=False,maxAngle=maxAngle,hourNormalization=False,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)    
-                if hourNormalization is True:
-                    ds.export_xye_format(dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,useMask=False,maxAngle=maxAngle,hourNormalization=hourNormalization,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)    
-            if PSI is True and useMask is True:
-                if onlyNorm is False:
-                    ds.export_PSI_format(dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,useMask=useMask,maxAngle=maxAngle,hourNormalization=False,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)    
-                if hourNormalization is True:
-                    ds.export_PSI_format(dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,useMask=useMask,maxAngle=maxAngle,hourNormalization=hourNormalization,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)        
-            if xye is True and useMask is True:
-                if onlyNorm is False:
-                    ds.export_xye_format(dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,useMask=useMask,maxAngle=maxAngle,hourNormalization=False,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)    
-                if hourNormalization is True:
-                    ds.export_xye_format(dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,useMask=useMask,maxAngle=maxAngle,hourNormalization=hourNormalization,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)    
+            ds.exportPowder(PSI=PSI,xye=xye,npz=npz,useMask=useMask,onlyHR=onlyHR,maxAngle=maxAngle,hourNormalization=hourNormalization,onlyNorm=onlyNorm,dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)
         except:
                 print(f"Cannot export! File is wrong format: {file}")                    
 
@@ -2892,7 +3429,7 @@ def export_from(startFile,PSI=True,xye=False,folder=None,outFolder=None,dataYear
 
 
 
-def export_from_to(startFile,endFile,PSI=True,xye=False,folder=None,outFolder=None,dataYear=None,dTheta=0.125,twoThetaOffset=0,bins=None,outFile=None,addTitle=None,useMask=True,onlyHR=False,maxAngle=5,hourNormalization=True,onlyNorm=True,applyCalibration=True,correctedTwoTheta=True,sampleName=True,sampleTitle=True,temperature=False,magneticField=False,electricField=False,fileNumber=False,waveLength=False):
+def export_from_to(startFile,endFile,PSI=True,xye=False,npz=False,folder=None,outFolder=None,dataYear=None,dTheta=0.125,twoThetaOffset=0,bins=None,outFile=None,addTitle=None,useMask=True,onlyHR=False,maxAngle=5,hourNormalization=True,onlyNorm=True,applyCalibration=True,correctedTwoTheta=True,sampleName=True,sampleTitle=True,temperature=False,magneticField=False,electricField=False,fileNumber=False,waveLength=False):
 
     """
     
@@ -2910,6 +3447,8 @@ def export_from_to(startFile,endFile,PSI=True,xye=False,folder=None,outFolder=No
         - PSI (bool): Export PSI format. Default is True
         
         - xye (bool): Export xye format. Default is True
+
+        - npz (bool): Export binary .npz archive, see export_npz_format. Default is False
         - outFolder (str): Path to folder data will be saved. Default is current working directory.
         
         - all from export_PSI_format and export_xye_format
@@ -2963,26 +3502,7 @@ def export_from_to(startFile,endFile,PSI=True,xye=False,folder=None,outFolder=No
         inputNumber = _tools.fileListGenerator(file,folder,dataYear)
         ds = DataSet(inputNumber)
         try:
-            if PSI is True and onlyHR is False:
-                if onlyNorm is False:
-                    ds.export_PSI_format(dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,useMask=False,maxAngle=maxAngle,hourNormalization=False,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)    
-                if hourNormalization is True:
-                    ds.export_PSI_format(dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,useMask=False,maxAngle=maxAngle,hourNormalization=hourNormalization,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)    
-            if xye is True and onlyHR is False:
-                if onlyNorm is False:
-                    ds.export_xye_format(dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,useMask=False,maxAngle=maxAngle,hourNormalization=False,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)    
-                if hourNormalization is True:
-                    ds.export_xye_format(dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,useMask=False,maxAngle=maxAngle,hourNormalization=hourNormalization,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)    
-            if PSI is True and useMask is True:
-                if onlyNorm is False:
-                    ds.export_PSI_format(dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,useMask=useMask,maxAngle=maxAngle,hourNormalization=False,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)    
-                if hourNormalization is True:
-                    ds.export_PSI_format(dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,useMask=useMask,maxAngle=maxAngle,hourNormalization=hourNormalization,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)        
-            if xye is True and useMask is True:
-                if onlyNorm is False:
-                    ds.export_xye_format(dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,useMask=useMask,maxAngle=maxAngle,hourNormalization=False,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)    
-                if hourNormalization is True:
-                    ds.export_xye_format(dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,useMask=useMask,maxAngle=maxAngle,hourNormalization=hourNormalization,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)    
+            ds.exportPowder(PSI=PSI,xye=xye,npz=npz,useMask=useMask,onlyHR=onlyHR,maxAngle=maxAngle,hourNormalization=hourNormalization,onlyNorm=onlyNorm,dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)
         except:
                 print(f"Cannot export! File is wrong format: {file}")                    
 
@@ -2997,7 +3517,7 @@ def export_from_to(startFile,endFile,PSI=True,xye=False,folder=None,outFolder=No
 
 
 
-def export_list(listinput,PSI=True,xye=False,folder=None,outFolder=None,dataYear=None,dTheta=0.125,twoThetaOffset=0,bins=None,outFile=None,addTitle=None,useMask=True,onlyHR=False,maxAngle=5,hourNormalization=True,onlyNorm=True,applyCalibration=True,correctedTwoTheta=True,sampleName=True,sampleTitle=True,temperature=False,magneticField=False,electricField=False,fileNumber=False,waveLength=False):
+def export_list(listinput,PSI=True,xye=False,npz=False,folder=None,outFolder=None,dataYear=None,dTheta=0.125,twoThetaOffset=0,bins=None,outFile=None,addTitle=None,useMask=True,onlyHR=False,maxAngle=5,hourNormalization=True,onlyNorm=True,applyCalibration=True,correctedTwoTheta=True,sampleName=True,sampleTitle=True,temperature=False,magneticField=False,electricField=False,fileNumber=False,waveLength=False):
 
     """
     
@@ -3013,6 +3533,8 @@ def export_list(listinput,PSI=True,xye=False,folder=None,outFolder=None,dataYear
         - PSI (bool): Export PSI format. Default is True
         
         - xye (bool): Export xye format. Default is True
+
+        - npz (bool): Export binary .npz archive, see export_npz_format. Default is False
         - outFolder (str): Path to folder data will be saved. Default is current working directory.
         
         - all from export_PSI_format and export_xye_format
@@ -3065,26 +3587,7 @@ def export_list(listinput,PSI=True,xye=False,folder=None,outFolder=None,dataYear
         inputNumber = _tools.fileListGenerator(file,folder,dataYear)
         ds = DataSet(inputNumber)
         try:
-            if PSI is True and onlyHR is False:
-                if onlyNorm is False:
-                    ds.export_PSI_format(dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,useMask=False,maxAngle=maxAngle,hourNormalization=False,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)    
-                if hourNormalization is True:
-                    ds.export_PSI_format(dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,useMask=False,maxAngle=maxAngle,hourNormalization=hourNormalization,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)    
-            if xye is True and onlyHR is False:
-                if onlyNorm is False:
-                    ds.export_xye_format(dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,useMask=False,maxAngle=maxAngle,hourNormalization=False,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)    
-                if hourNormalization is True:
-                    ds.export_xye_format(dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,useMask=False,maxAngle=maxAngle,hourNormalization=hourNormalization,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)    
-            if PSI is True and useMask is True:
-                if onlyNorm is False:
-                    ds.export_PSI_format(dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,useMask=useMask,maxAngle=maxAngle,hourNormalization=False,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)    
-                if hourNormalization is True:
-                    ds.export_PSI_format(dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,useMask=useMask,maxAngle=maxAngle,hourNormalization=hourNormalization,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)        
-            if xye is True and useMask is True:
-                if onlyNorm is False:
-                    ds.export_xye_format(dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,useMask=useMask,maxAngle=maxAngle,hourNormalization=False,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)    
-                if hourNormalization is True:
-                    ds.export_xye_format(dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,useMask=useMask,maxAngle=maxAngle,hourNormalization=hourNormalization,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)    
+            ds.exportPowder(PSI=PSI,xye=xye,npz=npz,useMask=useMask,onlyHR=onlyHR,maxAngle=maxAngle,hourNormalization=hourNormalization,onlyNorm=onlyNorm,dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,addTitle=addTitle,outFolder=outFolder,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,sampleTitle=sampleTitle,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber,waveLength=waveLength)
         except:
                 print(f"Cannot export! File is wrong format: {file}")                    
 
@@ -3121,62 +3624,26 @@ def subtract_PSI(file1,file2,outFile=None,folder=None,outFolder=None):
     if folder is None:
         folder = os.getcwd()
         
-    with open(os.path.join(folder,file1.replace('.dat','')+'.dat'),'r') as rf:
-        allinfo1 = rf.readlines()
-        rf.close()
-
-    with open(os.path.join(folder,file2.replace('.dat','')+'.dat'),'r') as rf:
-        allinfo2 = rf.readlines()
-        rf.close()    
-
-    info1 = allinfo1[:3] 
-    info2 = allinfo2[:3] 
+    info1,intensity1,err1,paramLines1 = _readPSI(os.path.join(folder,file1.replace('.dat','')+'.dat'))
+    info2,intensity2,err2,paramLines2 = _readPSI(os.path.join(folder,file2.replace('.dat','')+'.dat'))
 
     if info1[2].split(',')[0].split(',')[0] != info2[2].split(',')[0].split(',')[0]:
         return print('Not same range of files! Cannot subtract.')          
         
-    infoStr1 = (info1[2].split(',')[0].strip('#').replace('  ',' ').replace('  ',' ').replace('  ',' ').replace('  ',' '))
-    infoArr1 = [float(x) for x in infoStr1[1:].split(' ')]
-
-    infoStr2 = (info2[2].split(',')[0].strip('#').replace('  ',' ').replace('  ',' ').replace('  ',' ').replace('  ',' '))
-    infoArr2 = [float(x) for x in infoStr2[1:].split(' ')]
-        
-    monitor1 = infoArr1[3]
-    monitor2 = infoArr2[3]
+    monitor1 = _headerNumbers(info1[2])[3]
+    monitor2 = _headerNumbers(info2[2])[3]
     monitorRatio = monitor1/monitor2    
-    dataPoints = int((infoArr1[2]-infoArr1[0]) / infoArr1[1]) + 1
-    subInt = []
-    subErr = []
-    
-    dataLines = int(np.ceil(dataPoints/10)) 
-    commentlines = 3
     
-    for intLines in range(dataLines): 
-        subIntList = []
-        subErrList = []
-        intline1= allinfo1[intLines+commentlines]
-        intline2= allinfo2[intLines+commentlines]
-        errline1= allinfo1[intLines+dataLines+commentlines]
-        errline2= allinfo2[intLines+dataLines+commentlines]
-        intensity1 = [float(x) for x in intline1[:-2].replace('  ',' ').replace('  ',' ').replace('  ',' ').replace('nan','').replace('na','').split(' ') if x != '' ]  
-        intensity2 = [float(x) for x in intline2[:-2].replace('  ',' ').replace('  ',' ').replace('  ',' ').replace('nan','').replace('na','').split(' ') if x != '' ] 
-        err1 = [float(x) for x in errline1[:-2].replace('  ',' ').replace('  ',' ').replace('  ',' ').replace('nan','').replace('na','').split(' ') if x != '' ] 
-        err2 = [float(x) for x in errline2[:-2].replace('  ',' ').replace('  ',' ').replace('  ',' ').replace('nan','').replace('na','').split(' ') if x != '' ] 
-        for i, j in zip(intensity1,intensity2):
-            subIntList.append(i-j*monitorRatio)
-        for h, k in zip(err1,err2):
-            subErrList.append(np.sqrt(h**2 + monitorRatio**2 * k**2))
-        subInt.append(subIntList)
-        subErr.append(subErrList)
+    subInt = intensity1-intensity2*monitorRatio
+    subErr = np.sqrt(err1**2 + monitorRatio**2 * err2**2)
     
     titleLine = str(info1[0]).strip('\n') + ', subtracted: ' + str(info2[0])  + str(info1[1]) + str(info1[2]).strip('\n')
-    dataLinesInt = '\n'.join([' '+' '.join(["{:6.0f}.".format(x) for x in line]) for line in subInt])
-    dataLinesErr = '\n'.join([' '+' '.join(["{:7.1f}".format(x) for x in line]) for line in subErr])
-    indexParamLines = dataLines*2 + commentlines
-    paramLine1 = '\n'.join([str(line).strip('\n') for line in allinfo1[indexParamLines:]])
+    dataLinesInt = _formatLines(subInt,'%6.0f.',10,prefix=' ')
+    dataLinesErr = _formatLines(subErr,'%7.1f',10,prefix=' ')
+    paramLine1 = '\n'.join([str(line).strip('\n') for line in paramLines1])
     paramLine2 = ' subtracted:'
     paramLine3 = str(info2[0])  + str(info1[1]) + str(info1[2]).strip('\n')
-    paramLine4 = ''.join([str(line) for line in allinfo2[indexParamLines:]])
+    paramLine4 = ''.join([str(line) for line in paramLines2])
     fileString = '\n'.join([titleLine,dataLinesInt,dataLinesErr,paramLine1,paramLine2,paramLine3,paramLine4])
     
     if outFile is None:
@@ -3223,8 +3690,8 @@ def subtract_xye(file1,file2,outFile=None,folder=None,outFolder=None):
     if folder is None:
         folder = os.getcwd()
     
-    data1 = np.genfromtxt(os.path.join(folder,file1.replace('.xye','')+'.xye'), delimiter='  ')
-    data2 = np.genfromtxt(os.path.join(folder,file2.replace('.xye','')+'.xye'), delimiter='  ')  
+    data1 = np.loadtxt(os.path.join(folder,file1.replace('.xye','')+'.xye'))
+    data2 = np.loadtxt(os.path.join(folder,file2.replace('.xye','')+'.xye'))
     
     with open(os.path.join(folder,file1.replace('.xye','')+'.xye'),'r') as rf:
         info1 = rf.readlines()[:3]
@@ -3237,22 +3704,13 @@ def subtract_xye(file1,file2,outFile=None,folder=None,outFolder=None):
     if info1[2].split(',')[0].split(',')[0] != info2[2].split(',')[0].split(',')[0]:
         return print('Not same range of files! Cannot subtract.')          
         
-    infoStr1 = (info1[2].split(',')[0].strip('#').replace('  ',' ').replace('  ',' ').replace('  ',' ').replace('  ',' '))
-    infoArr1 = [float(x) for x in infoStr1[1:].split(' ')]
-
-    infoStr2 = (info2[2].split(',')[0].strip('#').replace('  ',' ').replace('  ',' ').replace('  ',' ').replace('  ',' '))
-    infoArr2 = [float(x) for x in infoStr2[1:].split(' ')]
-
-    monitorRatio = infoArr1[3]/infoArr2[3]
+    monitorRatio = _headerNumbers(info1[2])[3]/_headerNumbers(info2[2])[3]
 
     subInt = np.subtract(data1[:,1], np.multiply(monitorRatio,(data2[:,1])))
 
     intErr2 = monitorRatio * data2[:,2]
     
-    subErr = 0 * data2[:,1]
-    
-    for i in range(len(data1[:,2])):
-        subErr[i] = np.sqrt( (data1[i,2])**2 + (intErr2[i])**2 ) 
+    subErr = np.sqrt( (data1[:,2])**2 + (intErr2)**2 ) 
     
     saveData = np.array([data1[:,0],subInt,subErr])
 
@@ -3270,13 +3728,65 @@ def subtract_xye(file1,file2,outFile=None,folder=None,outFolder=None):
         sf.write('# ' + str(info1) + "\n")   
         sf.write("# subtracted file: \n") 
         sf.write('# ' + str(info2) + "\n") 
-        np.savetxt(sf,saveData.T,delimiter='  ')
-        sf.close()
+        sf.write(_formatLines(saveData.T,'%.18e',3,separator='  ')+'\n')
 
         
     # subtract_xye('DMC_565','DMC_573')
 
-def subtract(file1,file2,PSI=True,xye=True,outFile=None,folder=None,outFolder=None):
+def subtract_npz(file1,file2,outFile=None,folder=None,outFolder=None):
+
+    """
+    
+    This function takes two binary .npz archives from export_npz_format and export a differnce archive with correct uncertainties. 
+    
+    The second file is scaled after the monitor of the first file.
+    
+    Kwargs:
+        
+        - folder (str): Path to directory for data files, default is current working directory
+        
+        - outFile (str): string for name of outfile (given without extension)
+        - outFolder (str): Path to folder data will be saved. Default is current working directory. 
+        
+    Example:
+        >>> subtract_npz('DMC_565.npz','DMC_573')
+        
+    """
+
+    if folder is None:
+        folder = os.getcwd()
+
+    file1 = file1.replace('.npz','')
+    file2 = file2.replace('.npz','')
+
+    bins1,intensity1,err1,monitor1,metadata1 = loadReducedPowder(file1,folder=folder)
+    bins2,intensity2,err2,monitor2,metadata2 = loadReducedPowder(file2,folder=folder)
+
+    if len(bins1) != len(bins2) or not np.allclose(bins1,bins2):
+        return print('Not same range of files! Cannot subtract.')
+
+    monitorRatio = metadata1['scale']/metadata2['scale']
+
+    subInt = intensity1-intensity2*monitorRatio
+    subErr = np.sqrt(err1**2 + monitorRatio**2 * err2**2)
+
+    if outFile is None:
+        saveFile = file1 + '_sub_' + file2
+    else:
+        saveFile = str(outFile.replace('.npz',''))
+
+    print(f'Subtracting npz: {file1}.npz minus {file2}.npz')
+
+    if outFolder is None:
+        outFolder = os.getcwd()
+
+    metadata = {key:value for key,value in metadata1.items()}
+    metadata['subtractedFileList'] = np.array(metadata2['fileList'],dtype=str)
+    metadata['subtractedFileNumbers'] = metadata2['fileNumbers']
+    np.savez(os.path.join(outFolder,saveFile)+".npz",bins=bins1,intensity=subInt,error=subErr,monitor=monitor1,**metadata)
+
+
+def subtract(file1,file2,PSI=True,xye=True,npz=False,outFile=None,folder=None,outFolder=None):
     """
     This function takes two files and export a differnce curve with correct uncertainties. 
     The second file is scaled after the monitor of the first file.
@@ -3286,6 +3796,8 @@ def subtract(file1,file2,PSI=True,xye=True,outFile=None,folder=None,outFolder=No
         
         - xye (bool): Subtract xye format. Default is True
         
+        - npz (bool): Subtract binary .npz archives. Default is False
+        
         - folder (str): Path to directory for data files, default is current working directory
         
         - outFile (str): string for name of outfile (given without extension)
@@ -3299,8 +3811,8 @@ def subtract(file1,file2,PSI=True,xye=True,outFile=None,folder=None,outFolder=No
     if folder is None:
         folder = os.getcwd()
 
-    file1 = file1.replace('.xye','').replace('.dat','')
-    file2 = file2.replace('.xye','').replace('.dat','')
+    file1 = file1.replace('.xye','').replace('.dat','').replace('.npz','')
+    file2 = file2.replace('.xye','').replace('.dat','').replace('.npz','')
 
     if PSI == True:
         try:
@@ -3312,13 +3824,18 @@ def subtract(file1,file2,PSI=True,xye=True,outFile=None,folder=None,outFolder=No
             subtract_xye(file1,file2,outFile,folder=folder,outFolder=outFolder)
         except:
             print('Cannot subtract xye format files')
+    if npz == True:
+        try:
+            subtract_npz(file1,file2,outFile,folder=folder,outFolder=outFolder)
+        except:
+            print('Cannot subtract npz format files')
         
         
 #subtract('DMC_565.xye','DMC_573')
 
 def DMCsort(filelist,sortKey):
     
-    names =  shallowRead(filelist,[str(sortKey)])
+    names =  shallowRead(filelist,[str(sortKey)],useIndex=True)
     
     listOfFiles = []
     listOfTitles = []
@@ -3331,7 +3848,7 @@ def DMCsort(filelist,sortKey):
 
     for file,title in zip(listOfFiles,listOfTitles):
         if title in sumFile:
-            pass
+            sumFile[title].append(file)
         else:
             sumFile[title] = [file]
 
@@ -3362,7 +3879,7 @@ def sortExport(fileList,dataFolder=None,PSI=True,xye=True,outFolder=None,dTheta=
             sampleTitleSort = DMCsort(sampleSort[key],'title')
         for key in sampleTitleSort.keys():
             year, fileNumbers = _tools.numberStringGenerator(sampleTitleSort[key])
-            DataSet.add(fileNumbers,folder=dataFolder,PSI=PSI,xye=xye,outFolder=outFolder,dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber)
+            add(fileNumbers,folder=dataFolder,dataYear=year,PSI=PSI,xye=xye,outFolder=outFolder,dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber)
   
 
 def sortExportLong(fileListLong,dataFolder=None,PSI=True,xye=True,outFolder=None,dTheta=0.125,twoThetaOffset=0,bins=None,outFile=None,applyCalibration=True,correctedTwoTheta=True,sampleName=True,temperature=False,magneticField=False,electricField=False,fileNumber=False):
@@ -3381,7 +3898,7 @@ def sortExportLong(fileListLong,dataFolder=None,PSI=True,xye=True,outFolder=None
             sampleTitleSort = DMCsort(sampleSort[key],'title')
         for key in sampleTitleSort.keys():
             year, fileNumbers = _tools.numberStringGenerator(sampleTitleSort[key])
-            DataSet.add(fileNumbers,folder=dataFolder,PSI=PSI,xye=xye,outFolder=outFolder,dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber)
+            add(fileNumbers,folder=dataFolder,dataYear=year,PSI=PSI,xye=xye,outFolder=outFolder,dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber)
  
 
 def listGenerator(start=None,end=None):
@@ -3414,14 +3931,127 @@ def listGenerator(start=None,end=None):
     return fileList, fileListLong, dataFolder
 
 
+class ExportWatcher(object):
+    """Incremental export of data files in a data folder, added together by sample name and title.
+
+    The data folder is compared to a snapshot of file sizes and modification times taken at the previous update. 
+    Only new, changed, or removed files are read, and only the sample name/title groups affected are exported again.
+    Files with empty sample name are not exported. Groups failing to export are retried at the next update.
+
+    Args:
+
+        - dataFolder (str): Folder holding the data files
+
+    Kwargs:
+
+        - start (int): First file number to be exported (default None, all files)
+
+        - end (int): Last file number to be exported (default None, all files)
+
+        - all other kwargs are passed on to add
+
+    """
+    def __init__(self,dataFolder,start=None,end=None,**kwargs):
+        self.dataFolder = dataFolder
+        self.start = start
+        self.end = end
+        self.exportKwargs = kwargs
+
+        self.files = {} # file -> (modification time, size) at last update
+        self.fileGroup = {} # file -> (sample name, title)
+        self.groups = {} # (sample name, title) -> set of files
+        self.failed = set() # Groups to be exported again at next update
+
+    def snapshot(self):
+        """Return modification time and size of all data files within the file number range"""
+        files = {}
+        with os.scandir(self.dataFolder) as entries:
+            for entry in entries:
+                if not entry.name.endswith('.hdf'):
+                    continue
+                try:
+                    number = int(os.path.splitext(entry.name)[0].split('n')[-1])
+                except ValueError:
+                    continue
+                if (not self.start is None and number < self.start) or (not self.end is None and number > self.end):
+                    continue
+                stat = entry.stat()
+                files[entry.path] = (stat.st_mtime_ns,stat.st_size)
+        return files
+
+    def _readGroups(self,files):
+        try:
+            values = shallowRead(files,['sampleName','title'],useIndex=True)
+        except OSError: # At least one file is still being written, read files one by one
+            values = []
+            for file in files:
+                try:
+                    values.extend(shallowRead([file],['sampleName','title'],useIndex=True))
+                except OSError:
+                    pass
+        return {v['file']:(v['sampleName'],v['title']) for v in values}
+
+    def _removeFile(self,file):
+        group = self.fileGroup.pop(file,None)
+        if not group is None:
+            self.groups[group].discard(file)
+        return group
+
+    def update(self):
+        """Check data folder for new, changed, or removed files and export all affected groups
+
+        Returns:
+
+            - groups (list): List of (sample name, title) groups exported
+
+        """
+        snapshot = self.snapshot()
+        affected = set()
+
+        for file in [f for f in self.files if not f in snapshot]:
+            affected.add(self._removeFile(file))
+            del self.files[file]
+
+        changed = [f for f,stat in snapshot.items() if self.files.get(f) != stat]
+        for file,group in self._readGroups(sorted(changed)).items(): # Files not readable are retried at next update
+            affected.add(self._removeFile(file))
+            self.fileGroup[file] = group
+            self.groups.setdefault(group,set()).add(file)
+            self.files[file] = snapshot[file]
+            affected.add(group)
+
+        affected.update(self.failed)
+        self.failed = set()
+
+        exported = []
+        # Sample name or title is None if missing in the file
+        for group in sorted([g for g in affected if not g is None],key=lambda g: tuple('' if v is None else str(v) for v in g)):
+            files = sorted(self.groups.get(group,[]))
+            if group[0] in ['',None] or len(files) == 0:
+                continue
+            try:
+                year, fileNumbers = _tools.numberStringGenerator(files)
+                add(fileNumbers,folder=self.dataFolder,dataYear=year,**self.exportKwargs)
+            except Exception as error: # Keep watching, the group is exported again at next update
+                warnings.warn('Export of sample "{}", title "{}" failed and is retried at next update: {}'.format(*group,repr(error)))
+                self.failed.add(group)
+                continue
+            exported.append(group)
+        return exported
+
+    def watch(self,sleepTime):
+        """Update and export continuously, waiting sleepTime seconds between updates"""
+        while True:
+            self.update()
+            print(f'waiting {sleepTime} s')
+            time.sleep(float(sleepTime))
+
+
 def sleepExport(sleep_time,start=None,end=None,PSI=True,xye=True,outFolder=None,dTheta=0.125,twoThetaOffset=0,bins=None,outFile=None,applyCalibration=True,correctedTwoTheta=True,sampleName=True,temperature=False,magneticField=False,electricField=False,fileNumber=False):
           
-    Flag = True
-    while Flag:
-        fileList, fileListLong, dataFolder = listGenerator(start=start,end=end)
-        sortExportLong(fileListLong,dataFolder,PSI=PSI,xye=xye,outFolder=outFolder,dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber)
-        print(f'waiting {sleep_time} s')
-        time.sleep(float(sleep_time)) 
+    fileList, fileListLong, dataFolder = listGenerator(start=start,end=end)
+    watcher = ExportWatcher(dataFolder,start=start,end=end,PSI=PSI,xye=xye,outFolder=outFolder,dTheta=dTheta,twoThetaOffset=twoThetaOffset,bins=bins,outFile=outFile,applyCalibration=applyCalibration,correctedTwoTheta=correctedTwoTheta,sampleName=sampleName,temperature=temperature,magneticField=magneticField,electricField=electricField,fileNumber=fileNumber)
+    watcher.watch(sleep_time)
 
 
 def export_help(): 
@@ -3475,9 +4105,9 @@ def export_help():
     
 
 
-from matplotlib.ticker import FuncFormatter
-
 def generate1DAxis(q1,q2,rlu=True,outputFunction=print):
+    import matplotlib.pyplot as plt
+    from matplotlib.ticker import FuncFormatter
     fig,ax = plt.subplots()
     ax = plt.gca()
     q1 = np.asarray(q1,dtype=float)
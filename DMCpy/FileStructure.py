@@ -1,7 +1,9 @@
 import numpy as np
 from collections import defaultdict
 import warnings, os
+import hashlib, pickle, sqlite3
 import h5py as hdf
+import DMCpy
 
 
 HDFCounts = 'entry/DMC/detector/data'
@@ -186,7 +188,211 @@ def getInstrument(file):
     location = file.visititems(lambda x,y: getNX_class(x,y,b'NXinstrument'))
     return file.get(location)
 
-def shallowRead(files,parameters):
+def metadataCandidates(parameter):
+    """Return candidate hdf positions of parameter in order of priority together with a flag 
+    signifying if positions are relative to the instrument group"""
+    if parameter in HDFTranslationAlternatives:
+        return HDFTranslationAlternatives[parameter], False
+    elif parameter in HDFTranslation:
+        return [HDFTranslation[parameter]], False
+    elif parameter in HDFInstrumentTranslation:
+        return [HDFInstrumentTranslation[parameter]], True
+    raise AttributeError('Parameter "{}" not found'.format(parameter))
+
+
+## Resolved layouts, i.e. existing positions of all metadata entries, for the file layouts seen so far
+_metadataLayouts = {}
+
+def _groupListing(f,group):
+    g = f.get(group)
+    if not isinstance(g,hdf.Group):
+        return None
+    return tuple(g.keys())
+
+def layoutSignature(f):
+    """Signature of the file layout given by the entries of all groups holding metadata"""
+    groups = set()
+    for parameter in HDFTranslation.keys():
+        for position in metadataCandidates(parameter)[0]:
+            if not position is None:
+                groups.add(os.path.dirname(position.strip('/')))
+    groups = sorted(groups)
+    return tuple((group,_groupListing(f,group)) for group in groups)
+
+def getLayout(f):
+    """Return existing hdf positions of all metadata parameters for the layout of the open file f.
+
+    Positions are only resolved once for each layout signature, after which they are reused. 
+
+    """
+    signature = layoutSignature(f)
+    layout = _metadataLayouts.get(signature)
+    if layout is None:
+        layout = {}
+        instrument = None
+        if len(HDFInstrumentTranslation)>0:
+            instr = getInstrument(f)
+            instrument = None if instr is None else instr.name
+        for parameter in list(HDFTranslation.keys())+list(HDFInstrumentTranslation.keys()):
+            if parameter in layout:
+                continue
+            positions, relative = metadataCandidates(parameter)
+            if relative:
+                if instrument is None:
+                    positions = []
+                else:
+                    positions = [instrument+'/'+position for position in positions]
+            layout[parameter] = [position for position in positions if not position is None and position in f]
+        _metadataLayouts[signature] = layout
+    return layout
+
+def readMetadata(f,parameters=None):
+    """Read metadata parameters from open hdf file in one pass using the resolved file layout.
+
+    Args:
+
+        - f (hdf.File): Open hdf file
+
+    Kwargs:
+
+        - parameters (list): Parameters to be read (default None, all parameters except sample)
+
+    Returns:
+
+        - metadata (dict): Raw values as numpy arrays. Entries not present in file are given as np.array(None)
+
+    """
+    layout = getLayout(f)
+    if parameters is None:
+        parameters = [p for p in layout.keys() if not p == 'sample']
+    metadata = {}
+    for parameter in parameters:
+        value = np.array(None)
+        for position in layout[parameter]:
+            value = np.array(f.get(position))
+            if not value.shape == (): # First alternative holding data is used
+                break
+        metadata[parameter] = value
+    return metadata
+
+
+class MetadataIndex(object):
+    """Persistent index of the raw metadata of data files, stored as one SQLite database per data folder.
+
+    Entries are keyed by file path, modification time and size and hold all metadata read by readMetadata. 
+    Only files not seen before or changed since last indexing are opened. If the index cannot be written, 
+    e.g. read-only cache folder, files are read directly.
+
+    Kwargs:
+
+        - folder (str): Folder holding the databases (default None, DMCpy.cacheFolder/index)
+
+    """
+    batchSize = 500 # Number of files looked up per query
+
+    def __init__(self,folder=None):
+        self.folder = folder
+
+    @property
+    def location(self):
+        if self.folder is None:
+            return os.path.join(DMCpy.cacheFolder,'index')
+        return self.folder
+
+    def _databaseFile(self,dataFolder):
+        key = hashlib.sha1(os.path.abspath(dataFolder).encode('utf8')).hexdigest()
+        return os.path.join(self.location,key+'.sqlite')
+
+    def _connect(self,dataFolder):
+        os.makedirs(self.location,exist_ok=True)
+        connection = sqlite3.connect(self._databaseFile(dataFolder),timeout=30)
+        connection.execute('CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, mtime INTEGER, size INTEGER, metadata BLOB)')
+        return connection
+
+    def read(self,files):
+        """Return raw metadata of files, as given by readMetadata, in order of files.
+
+        Args:
+
+            - files (list): List of data file paths
+
+        """
+        stats = []
+        for file in files:
+            stat = os.stat(file)
+            stats.append((os.path.abspath(file),stat.st_mtime_ns,stat.st_size))
+
+        folders = defaultdict(list)
+        for I,(path,_,_) in enumerate(stats):
+            folders[os.path.dirname(path)].append(I)
+
+        values = [None]*len(files)
+        for dataFolder,indices in folders.items():
+            try:
+                connection = self._connect(dataFolder)
+            except (OSError,sqlite3.Error):
+                connection = None
+
+            known = {}
+            if not connection is None:
+                # Only entries of the requested files are read, in batches below the SQLite limit of query parameters
+                paths = sorted(set(stats[I][0] for I in indices))
+                for start in range(0,len(paths),self.batchSize):
+                    batch = paths[start:start+self.batchSize]
+                    query = 'SELECT path, mtime, size, metadata FROM files WHERE path IN ({})'.format(','.join(len(batch)*['?']))
+                    for path,mtime,size,metadata in connection.execute(query,batch):
+                        known[path] = (mtime,size,metadata)
+
+            updates = []
+            for I in indices:
+                path,mtime,size = stats[I]
+                entry = known.get(path)
+                if not entry is None and entry[:2] == (mtime,size):
+                    values[I] = pickle.loads(entry[2])
+                    continue
+                with hdf.File(files[I],mode='r') as f:
+                    values[I] = readMetadata(f)
+                updates.append((path,mtime,size,pickle.dumps(values[I])))
+
+            if not connection is None:
+                try:
+                    with connection:
+                        connection.executemany('INSERT OR REPLACE INTO files VALUES (?,?,?,?)',updates)
+                except sqlite3.Error:
+                    pass
+                connection.close()
+        return values
+
+    def clear(self):
+        """Remove all databases of the index"""
+        if not os.path.isdir(self.location):
+            return
+        for fileName in os.listdir(self.location):
+            if fileName.endswith('.sqlite'):
+                os.remove(os.path.join(self.location,fileName))
+
+
+metadataIndex = MetadataIndex()
+
+
+def shallowRead(files,parameters,useIndex=False):
+    """Read metadata parameters from data files without loading them.
+
+    Args:
+
+        - files (list): List of data file paths
+
+        - parameters (list): Parameters to be read, see possibleAttributes
+
+    Kwargs:
+
+        - useIndex (bool): If True, look up values in the persistent metadata index and only open new or changed files (default False)
+
+    Returns:
+
+        - values (list): List of dictionaries with file path and value of each parameter
+
+    """
 
     parameters = np.array(parameters)
     values = []
@@ -201,43 +407,43 @@ def shallowRead(files,parameters):
         else:
             raise AttributeError('Parameter {} not found'.format(parameters[np.logical_not(possible)]))
     
-    for file in files:
+    hdfParameters = [p for p in parameters if not p in extraAttributes]
+    if useIndex and not 'sample' in hdfParameters:
+        indexed = metadataIndex.read(files)
+    else:
+        indexed = None
+
+    for I,file in enumerate(files):
         vals = {}
         vals['file'] = file
-        with hdf.File(file,mode='r') as f:
-            instr = getInstrument(f)
-            for p in parameters:
-                if p == 'name':
-                    v = os.path.basename(file)
-                    vals[p] = v
-                    continue
-                elif p == 'fileLocation':
-                    v = os.path.dirname(file)
-                    vals[p] = v
-                    continue
-                elif p in HDFTranslationAlternatives:
-                    for entry in HDFTranslationAlternatives[p]:
-                        v = np.array(f.get(entry))
-                        if not v.shape == ():
-                            TrF= HDFTranslationFunctions
-                            break
-
-                elif p in HDFTranslation:
-                    v = np.array(f.get(HDFTranslation[p]))
-                    TrF= HDFTranslationFunctions
-                elif p in HDFInstrumentTranslation:
-                    v = np.array(instr.get(HDFInstrumentTranslation[p]))
-                    TrF= HDFInstrumentTranslationFunctions
-                else:
-                    raise AttributeError('Parameter "{}" not found'.format(p))
-                for func,args in TrF[p]:
-                    try:
-                        v = getattr(v,func)(*args)
-                    except (IndexError,AttributeError):
-                        warnings.warn('Parameter "{}" not found in file "{}"'.format(p,file))
-                        v = None
-                        
+        if indexed is None:
+            with hdf.File(file,mode='r') as f:
+                metadata = readMetadata(f,hdfParameters)
+        else:
+            metadata = indexed[I]
+        for p in parameters:
+            if p == 'name':
+                v = os.path.basename(file)
+                vals[p] = v
+                continue
+            elif p == 'fileLocation':
+                v = os.path.dirname(file)
                 vals[p] = v
+                continue
+            
+            v = metadata[p]
+            if p in HDFInstrumentTranslation and not p in HDFTranslation:
+                TrF= HDFInstrumentTranslationFunctions
+            else:
+                TrF= HDFTranslationFunctions
+            for func,args in TrF[p]:
+                try:
+                    v = getattr(v,func)(*args)
+                except (IndexError,AttributeError):
+                    warnings.warn('Parameter "{}" not found in file "{}"'.format(p,file))
+                    v = None
+                    
+            vals[p] = v
         values.append(vals)
 
     return values
\ No newline at end of file
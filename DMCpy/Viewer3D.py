@@ -15,7 +15,7 @@ pythonSubVersion = sys.version_info[1]
 class Viewer3D(object):  
     @_tools.KwargChecker(include=[_tools.MPLKwargs])
     def __init__(self,Data,bins,axis=2, ax=None,log=False, grid = False, adjustable=True, outputFunction=print, 
-                 cmap='viridis', **kwargs):#pragma: no cover
+                 cmap='viridis', multiplicationFactor=1, **kwargs):#pragma: no cover
         """3 dimensional viewing object generating interactive Matplotlib figure. 
         Keeps track of all the different plotting functions and variables in order to allow the user to change between different slicing modes and to scroll through the data in an interactive way.
 
@@ -23,7 +23,7 @@ class Viewer3D(object):
 
             - Data (3D array): Intensity array in three dimensions. Assumed to have Qx, Qy, and E along the first, second, and third directions respectively.
 
-            - bins (List of 1D arrays): Coordinates of the three directions as returned by the BinData3D functionality of DataSet.
+            - bins (RegularGrid or list of 3D arrays): Bin edges of the three directions as returned by the BinData3D functionality of DataSet.
 
         Kwargs:
 
@@ -39,6 +39,10 @@ class Viewer3D(object):
 
             - cmap (str): Name of colormap used for plotting (default viridas)
 
+            - multiplicationFactor (float): Multiply intensities with this factor (default 1)
+
+        Data given as a single 3D array, e.g. memory-mapped from the volume store, is only read plane by plane.
+
 
         For an example, see the `quick plotting tutorial <../Tutorials/Quick/QuickView3D.html>`_ under scripting tutorials.
 
@@ -58,10 +62,9 @@ class Viewer3D(object):
         else:
             self.Data = Data
             self.allData = False
-        if log:
-            self.Data = np.log10(self.Data+1e-20)
+        self.log = log
+        self.multiplicationFactor = multiplicationFactor
         self.bins = bins
-        self.dataLimits = [np.nanmin(Data),np.nanmax(Data)]
 
         gs = matplotlib.gridspec.GridSpec(1, 2, width_ratios=[4, 1]) 
         
@@ -182,13 +185,9 @@ class Viewer3D(object):
         self.cid = self.figure.canvas.mpl_connect('button_press_event', lambda event: eventdecorator(onclick,self,event,outputFunction=outputFunction))
         
         try:
-            maxVal = np.nanmax(self.masked_array[np.isfinite(self.masked_array)])
-        except ValueError:
-            maxVal = 1
-        try:
-            minVal = np.nanmin(self.masked_array[np.isfinite(self.masked_array)])
+            minVal,maxVal = self.masked_array.limits()
         except ValueError:
-            minVal = 0
+            minVal,maxVal = 0,1
         self.caxis = [minVal,maxVal]
         if self.grid:
             self.ax.grid(True,zorder=self.gridZOrder)
@@ -290,7 +289,7 @@ class Viewer3D(object):
         Y=self.bins[axes[1]].transpose(axes)
         Z=self.bins[axes[2]].transpose(axes)
         
-        masked_array = np.ma.array (self.Data, mask=np.isnan(self.Data)).transpose(axes)
+        masked_array = PlaneSlicer(self.Data,axes,multiplicationFactor=self.multiplicationFactor,log=self.log)
         self.emptyData = masked_array[:,:,0].T.flatten().copy()
         self._axesChanged = True
         upperLim = self.Data.shape[axis]-1
@@ -385,6 +384,57 @@ class Viewer3D(object):
                 self.ax.set_ylim([np.min(self.Y),np.max(self.Y)])
 
 
+class PlaneSlicer(object):
+    """Masked view of 3D data transposed by axes. Only the sliced part of the data is read, scaled, and masked (NaN),
+    such that planes can be shown from memory-mapped volumes without loading the full volume.
+
+    Args:
+
+        - Data (3D array): Intensity array
+
+        - axes (tuple): Permutation of the axes of Data
+
+    Kwargs:
+
+        - multiplicationFactor (float): Multiply intensities with this factor (default 1)
+
+        - log (bool): If true, the log 10 of the intensity is returned (default False)
+
+    """
+    def __init__(self,Data,axes,multiplicationFactor=1,log=False):
+        self.Data = Data.transpose(axes)
+        self.multiplicationFactor = multiplicationFactor
+        self.log = log
+
+    @property
+    def shape(self):
+        return self.Data.shape
+
+    def _values(self,item):
+        values = np.asarray(self.Data[item])*self.multiplicationFactor
+        if self.log:
+            values = np.log10(values+1e-20)
+        return values
+
+    def __getitem__(self,item):
+        values = self._values(item)
+        if values.ndim == 0:
+            return np.ma.masked if np.isnan(values) else values[()]
+        return np.ma.array(values,mask=np.isnan(values))
+
+    def limits(self):
+        """Minimal and maximal finite value, found plane by plane. Raises ValueError if no value is finite."""
+        extremes = []
+        for plane in range(self.shape[2]):
+            values = self._values((slice(None),slice(None),plane))
+            values = values[np.isfinite(values)]
+            if len(values) > 0:
+                extremes.append([np.min(values),np.max(values)])
+        if len(extremes) == 0:
+            raise ValueError('No finite values in data.')
+        return np.min(extremes,axis=0)[0],np.max(extremes,axis=0)[1]
+
+
 def eventdecorator(function,self,event,*args,**kwargs):# pragma: no cover
     if event.xdata is not None and self.ax.in_axes(event):
         try:
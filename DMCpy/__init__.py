@@ -1,29 +1,53 @@
 import sys,os
 sys.path.append('.')
-import pickle,numpy as np
+import pickle
 
 __version__ = 'version=0.9.0'
 __author__ = 'Jakob Lass'
 
-# installFolder = os.path.abspath(os.path.split(__file__)[0])
-# calibrationFile =  os.path.join(installFolder,'calibrationDict.dat')
-
 installFolder = os.path.abspath(os.path.join(os.path.split(__file__)[0],'..'))
 calibrationFile =  os.path.join(installFolder,'DMCpy','calibrationDict.dat')
 
-try:
-    with open(calibrationFile,'rb') as f:
-        calibrationDict = pickle.load(f)
-except FileNotFoundError:
-    def find(name, path):
-        result = []
-        for root, dirs, files in os.walk(path):
-            if name in files:
-                result.append(os.path.join(root, name))
-        return result
-
-    
-    foundFile = str(find('calibrationDict.dat',os.path.abspath(os.path.join(installFolder,'..','..','..','..','..','..')))[0])
-
-    with open(foundFile,'rb') as f:
-        calibrationDict = pickle.load(f)
\ No newline at end of file
+# Locations searched for the calibration tables. Besides the package folder, setup.py installs the
+# data files relative to the prefix of the running interpreter (differs from the package folder in virtual environments)
+calibrationLocations = [calibrationFile]
+if sys.prefix != sys.base_prefix:
+    calibrationLocations.append(os.path.join(sys.prefix,os.path.relpath(os.path.join(installFolder,'DMCpy'),sys.base_prefix),'calibrationDict.dat'))
+
+# Folder used for derived data kept between sessions, e.g. memory-mapped calibrations
+cacheFolder = os.environ.get('DMCPY_CACHE',os.path.join(os.path.expanduser('~'),'.cache','DMCpy'))
+
+_calibrationDict = None
+
+def findCalibrationFile():
+    """Return path to the detector calibration tables.
+
+    Raises:
+
+        - FileNotFoundError
+
+    """
+    for location in calibrationLocations:
+        if os.path.isfile(location):
+            return location
+    raise FileNotFoundError('Calibration tables not found in {}. Please reinstall DMCpy by invoking "pip install --upgrade DMCpy"'.format(', '.join(['"{}"'.format(l) for l in calibrationLocations])))
+
+def loadCalibrationDict():
+    """Load detector calibration tables. The tables are only read on first call and kept in memory afterwards.
+
+    Raises:
+
+        - FileNotFoundError
+
+    """
+    global _calibrationDict
+    if _calibrationDict is None:
+        with open(findCalibrationFile(),'rb') as f:
+            _calibrationDict = pickle.load(f)
+    return _calibrationDict
+
+
+def __getattr__(name): # Keep DMCpy.calibrationDict available while loading it lazily
+    if name == 'calibrationDict':
+        return loadCalibrationDict()
+    raise AttributeError("module '{}' has no attribute '{}'".format(__name__,name))
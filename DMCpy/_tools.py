@@ -1,4 +1,5 @@
 import functools
+import importlib
 import sys
 sys.path.append('.')
 import numpy as np
@@ -41,15 +42,25 @@ def KwargChecker(function=None,include=None):
         return newFunc
     return KwargCheckerNone
 
+def resolveFunction(function):
+    """Return function, importing it first if given as a dotted path (e.g. 'matplotlib.pyplot.errorbar'). 
+    This allows heavy modules to only be imported when the decorated function is called."""
+    if isinstance(function,str):
+        moduleName,functionName = function.rsplit('.',1)
+        function = getattr(importlib.import_module(moduleName),functionName)
+    return function
+
 def extractArgsList(func,newFunc,function,include):
     N = func.__code__.co_argcount # Number of arguments with which the function is called
     argList = list(newFunc._original.__code__.co_varnames[:N]) # List of arguments
     if not function is None:
         if isinstance(function,(list,np.ndarray)): # allow function kwarg to be list or ndarray
             for f in function:
+                f = resolveFunction(f)
                 for arg in f.__code__.co_varnames[:f.__code__.co_argcount]: # extract all arguments from function
                     argList.append(str(arg))
         else: # if single function
+            function = resolveFunction(function)
             for arg in function.__code__.co_varnames[:function.__code__.co_argcount]:
                 argList.append(str(arg))
     if not include is None:
@@ -187,7 +198,7 @@ def roundPower(x,default=4):
         return default
 
 
-def binData3D(dx,dy,dz,pos,data,norm=None,mon=None,bins=None):
+def binData3D(dx,dy,dz,pos,data,norm=None,mon=None,bins=None,sparse=False):
     """ 3D binning of data.
 
     Args:
@@ -208,7 +219,9 @@ def binData3D(dx,dy,dz,pos,data,norm=None,mon=None,bins=None):
 
         - mon (array): Flattened monitor array.
 
-        - bins (list of arrays): Bins locating edges in the x, y, and z directions.
+        - bins (RegularGrid or list of arrays): Bins locating edges in the x, y, and z directions.
+
+        - sparse (bool): If True, re-binned data is returned as a SparseHistogram holding only occupied bins (default False)
 
     returns:
 
@@ -229,7 +242,10 @@ def binData3D(dx,dy,dz,pos,data,norm=None,mon=None,bins=None):
     #NonNaNs = 1-np.isnan(data.flatten())
 
     #pos = [np.array(x[NonNaNs]) for x in pos]
-    HistBins = [bins[0][:,0,0],bins[1][0,:,0],bins[2][0,0,:]]
+    if isinstance(bins,RegularGrid):
+        HistBins = bins.edges
+    else:
+        HistBins = [bins[0][:,0,0],bins[1][0,:,0],bins[2][0,0,:]]
 
     if False:
         intensity =    np.histogramdd(np.array(pos).T,bins=HistBins,weights=data.flatten())[0].astype(data.dtype)
@@ -253,30 +269,287 @@ def binData3D(dx,dy,dz,pos,data,norm=None,mon=None,bins=None):
         if not norm is None:
             weights.append(norm.flatten())
         
-        returndata = histogramdd(np.array(pos).T,bins=HistBins,weights=weights,returnCounts=True)
+        returndata = histogramdd(np.array(pos).T,bins=HistBins,weights=weights,returnCounts=True,sparse=sparse)
 
     return returndata,bins
 
 
+class RegularGrid(object):
+    """Equidistant 3D bins described by origin, step size and number of bins along each direction.
+
+    Args:
+
+        - origin (3 array): Lowest edge along x, y, and z
+
+        - step (3 array): Bin size along x, y, and z
+
+        - shape (3 array): Number of bins along x, y, and z
+
+    Indexing the grid as a list, i.e. grid[0], gives the edge mesh along one direction with shape shape+1 as
+    returned by calculateGrid3D. The meshes are read-only views of the 1D edges and do not take up memory.
+
+    Example:
+
+    >>> grid = RegularGrid(origin=[-1.0,-1.0,0.0],step=[0.05,0.05,0.1],shape=[40,40,10])
+    >>> xEdges,yEdges,zEdges = grid.edges
+    >>> X,Y,Z = grid # mesh of edges
+
+    """
+    def __init__(self,origin,step,shape):
+        self.origin = np.asarray(origin,dtype=float)
+        self.step = np.asarray(step,dtype=float)
+        self.shape = tuple(int(s) for s in shape)
+        if not (len(self.origin) == len(self.step) == len(self.shape)):
+            raise AttributeError('Origin, step, and shape need to have same length. Got {}, {}, and {}.'.format(len(self.origin),len(self.step),len(self.shape)))
+
+    @property
+    def edges(self):
+        """List of 1D bin edges along each direction"""
+        return [o+s*np.arange(n+1) for o,s,n in zip(self.origin,self.step,self.shape)]
+
+    @property
+    def centers(self):
+        """List of 1D bin centers along each direction"""
+        return [o+s*(np.arange(n)+0.5) for o,s,n in zip(self.origin,self.step,self.shape)]
+
+    def __len__(self):
+        return len(self.shape)
+
+    def __getitem__(self,index):
+        if not isinstance(index,(int,np.integer)):
+            return [self[i] for i in range(len(self))[index]]
+        edges = self.edges[index]
+        meshShape = [n+1 for n in self.shape]
+        expand = [1]*len(self)
+        expand[index] = len(edges)
+        return np.broadcast_to(edges.reshape(expand),meshShape)
+
+    def __eq__(self,other):
+        if not isinstance(other,RegularGrid):
+            return False
+        return self.shape == other.shape and np.all(self.origin == other.origin) and np.all(self.step == other.step)
+
+    def __repr__(self):
+        return 'RegularGrid(origin={},step={},shape={})'.format(self.origin.tolist(),self.step.tolist(),list(self.shape))
+
+
+class BinnedVolume(object):
+    """Binned 3D data stored out-of-core in an HDF file. Grids are read from disk only when sliced.
+
+    Args:
+
+        - fileName (str): Path to volume file written by saveBinnedVolume
+
+    Example:
+
+    >>> volume = BinnedVolume(fileName)
+    >>> plane = volume['intensity'][:,:,10] # Only the plane is read
+    >>> volume.close()
+
+    """
+    def __init__(self,fileName):
+        self.fileName = fileName
+        self._file = hdf.File(fileName,mode='r')
+        self.bins = RegularGrid(origin=self._file.attrs['origin'],step=self._file.attrs['step'],shape=self._file.attrs['shape'])
+        self.names = [name.decode() if isinstance(name,bytes) else str(name) for name in self._file.attrs['names']]
+
+    def __getitem__(self,name):
+        if not name in self.names:
+            raise AttributeError('Volume does not contain "{}". Available are {}.'.format(name,', '.join(self.names)))
+        return self._file[name]
+
+    def read(self):
+        """Read all grids into memory in order of names"""
+        return [self._file[name][()] for name in self.names]
+
+    def memmap(self):
+        """Return all grids in order of names as read-only arrays memory-mapped from the volume file. Grids stored 
+        compressed cannot be mapped and are read into memory. The mapped arrays stay valid after closing the volume."""
+        grids = []
+        for name in self.names:
+            dset = self._file[name]
+            offset = dset.id.get_offset()
+            if dset.chunks is None and dset.compression is None and not offset is None:
+                grids.append(np.memmap(self.fileName,dtype=dset.dtype,mode='r',offset=offset,shape=dset.shape))
+            else:
+                grids.append(dset[()])
+        return grids
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        self.close()
+
+
+def saveBinnedVolume(fileName,bins,grids,names,compression=None):
+    """Save 3D grids binned on a RegularGrid to an HDF file. The file is written to a temporary
+    file first and moved into place afterwards such that readers never see partial files.
+
+    Args:
+
+        - fileName (str): Path of volume file
+
+        - bins (RegularGrid): Bins of the grids
+
+        - grids (list): List of 3D arrays of shape bins.shape
+
+        - names (list): Name of each grid, e.g. ['intensity','error']
+
+    Kwargs:
+
+        - compression (int): Compression level used by gzip. If None, grids are stored contiguous and uncompressed such 
+          that they can be memory-mapped (default None)
+
+    """
+    temporary = fileName+'.{}.tmp'.format(os.getpid())
+    try:
+        with hdf.File(temporary,mode='w') as f:
+            f.attrs['origin'] = bins.origin
+            f.attrs['step'] = bins.step
+            f.attrs['shape'] = np.array(bins.shape)
+            f.attrs['names'] = np.array(names,dtype=object).astype('S')
+            for name,grid in zip(names,grids):
+                if compression is None:
+                    f.create_dataset(name,data=grid)
+                else:
+                    f.create_dataset(name,data=grid,chunks=True,compression='gzip',compression_opts=compression,shuffle=True)
+        os.replace(temporary,fileName)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+
+class VolumeStore(object):
+    """Persistent store of binned 3D volumes, one BinnedVolume file per key. Stored grids are returned memory-mapped from 
+    the volume files. When the volumes exceed maxBytes, the least recently used are removed. If a volume cannot be written,
+    e.g. read-only cache folder, it is recalculated on every request.
+
+    Kwargs:
+
+        - folder (str): Folder holding the volumes (default None, DMCpy.cacheFolder/volumes)
+
+        - maxBytes (int): Maximal total size of the volumes on disk (default 10 GB)
+
+    """
+    def __init__(self,folder=None,maxBytes=10*1024**3):
+        self.folder = folder
+        self.maxBytes = maxBytes
+
+    @property
+    def location(self):
+        if self.folder is None:
+            return os.path.join(DMCpy.cacheFolder,'volumes')
+        return self.folder
+
+    def fileName(self,key):
+        return os.path.join(self.location,key+'.h5')
+
+    def get(self,key,names,loader):
+        """Return (bins, grids) stored under key. If not present, these are calculated by loader and stored. 
+        Stored grids are returned as read-only memory-mapped arrays.
+
+        Args:
+
+            - key (str): Key describing the content of the volume, e.g. a hash of data and binning parameters
+
+            - names (list): Names of the grids returned by loader
+
+            - loader (function): Function returning (bins, grids)
+
+        """
+        fileName = self.fileName(key)
+        if os.path.isfile(fileName):
+            try:
+                with BinnedVolume(fileName) as volume:
+                    if volume.names == list(names):
+                        bins,grids = volume.bins,volume.memmap()
+                        try:
+                            os.utime(fileName) # Mark as recently used
+                        except OSError:
+                            pass # Read-only or shared store, volume is still valid
+                        return bins,grids
+            except (OSError,KeyError):
+                pass # Corrupt volume, recalculate
+        
+        bins,grids = loader()
+        try:
+            os.makedirs(self.location,exist_ok=True)
+            saveBinnedVolume(fileName,bins,grids,names)
+            self.evict(keep=fileName)
+        except OSError:
+            pass
+        return bins,grids
+
+    def volumes(self):
+        """Return list of (path, size, last use) of stored volumes, least recently used first"""
+        if not os.path.isdir(self.location):
+            return []
+        volumes = []
+        for file in os.listdir(self.location):
+            if file.endswith('.h5'):
+                path = os.path.join(self.location,file)
+                try:
+                    stat = os.stat(path)
+                except OSError: # Removed by other process
+                    continue
+                volumes.append((path,stat.st_size,stat.st_mtime_ns))
+        return sorted(volumes,key=lambda volume: volume[2])
+
+    def evict(self,keep=None):
+        """Remove least recently used volumes until their total size is below maxBytes. The volume keep is not removed."""
+        volumes = self.volumes()
+        totalBytes = np.sum([size for _,size,_ in volumes])
+        for path,size,_ in volumes:
+            if totalBytes <= self.maxBytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            totalBytes -= size
+
+    def clear(self):
+        """Remove all stored volumes"""
+        for path,_,_ in self.volumes():
+            os.remove(path)
+
+
+volumeStore = VolumeStore()
+
+
 def calculateBins(dx,dy,dz,pos):
-    diffx = np.abs(np.max(pos[0])-np.min(pos[0]))
-    diffy = np.abs(np.max(pos[1])-np.min(pos[1]))
-    diffz = np.abs(np.max(pos[2])-np.min(pos[2]))
-    
-    xbins = np.round(diffx/dx).astype(int)+1
-    ybins = np.round(diffy/dy).astype(int)+1
-    zbins = np.round(diffz/dz).astype(int)+1
-    
-    _X = np.linspace(np.min(pos[0]),np.max(pos[0]),xbins)
-    _Y = np.linspace(np.min(pos[1]),np.max(pos[1]),ybins)
-    _Z = np.linspace(np.min(pos[2]),np.max(pos[2]),zbins)
-    
-    X,Y,Z = np.meshgrid(_X,_Y,_Z,indexing='ij')
+    """Calculate equidistant bins of approximately size dx, dy, and dz centered on the extremal positions.
+
+    Args:
+
+        - dx (float): Step size in x
+
+        - dy (float): Step size in y
+
+        - dz (float): Step size in z
+
+        - pos (list): Positions (X,Y,Z), only extrema are used
+
+    Returns:
+
+        - RegularGrid
+
+    """
+    minimum = np.array([np.min(p) for p in pos[:3]])
+    maximum = np.array([np.max(p) for p in pos[:3]])
     
-    XX,YY,ZZ = calculateGrid3D(X=X,Y=Y,Z=Z)
+    centers = np.round(np.abs(maximum-minimum)/np.array([dx,dy,dz])).astype(int)+1
+    if np.any(centers <= 1):
+        raise AttributeError('Provided array has dimension(s) {} of size <= 1'.format(centers))
     
-    bins=[XX,YY,ZZ]
-    return bins
+    step = (maximum-minimum)/(centers-1)
+    return RegularGrid(origin=minimum-0.5*step,step=step,shape=centers)
 
 
 
@@ -862,7 +1135,7 @@ def merge(dataFilesList,saveFileName,directory=None, A3Tolerance=0.05, A4Toleran
     # Perform checks
     equalParameters = ['twoThetaPosition','wavelength']
     equalParametersTolerance = [A4Tolerance,wavelengthTolerance]
-    files = shallowRead(dataFilesList,equalParameters)
+    files = shallowRead(dataFilesList,equalParameters,useIndex=True)
     
     trueValue = None
     truthTable = []
@@ -899,7 +1172,7 @@ def merge(dataFilesList,saveFileName,directory=None, A3Tolerance=0.05, A4Toleran
     shutil.copy(dataFilesList[0],savepath)
     
     # Find min and max of A3 as well as average across all files
-    A3files = shallowRead(dataFilesList,['A3'])
+    A3files = shallowRead(dataFilesList,['A3'],useIndex=True)
     
     # Check if length is 1, then it is a powder!!!
     powderFiles = [f['file'] for f in A3files if len(f['A3'])<2 ]
@@ -1039,7 +1312,204 @@ def merge(dataFilesList,saveFileName,directory=None, A3Tolerance=0.05, A4Toleran
         print('Data merged and saved in {:}'.format(savepath))
 
 
-def histogramdd(sample, bins, weights, returnCounts = False):
+def uniformBins(edges,rtol=1e-9):
+    """Check if bin edges are equidistant.
+
+    Args:
+
+        - edges (array): Bin edges in increasing order
+
+    Kwargs:
+
+        - rtol (float): Relative tolerance on the bin width (default 1e-9)
+
+    Returns:
+
+        - (start, step) if edges are equidistant, otherwise None
+
+    """
+    edges = np.asarray(edges)
+    if len(edges)<2 or edges.ndim != 1:
+        return None
+    step = (edges[-1]-edges[0])/(len(edges)-1)
+    if not step > 0:
+        return None
+    if not np.allclose(np.diff(edges),step,rtol=rtol,atol=0.0):
+        return None
+    return edges[0],step
+
+
+def uniformBinIndex(x,edges,start,step):
+    """Bin index of x for equidistant edges calculated by index arithmetic. Equals np.searchsorted(edges,x,side='right')
+    except that values on the rightmost edge are put into the last bin.
+
+    Args:
+
+        - x (array): Values to be binned
+
+        - edges (array): Equidistant bin edges
+
+        - start (float): First edge
+
+        - step (float): Distance between edges
+
+    """
+    n = len(edges)
+    index = np.subtract(x,start,dtype=float)
+    index/=step
+    np.floor(index,out=index)
+    # fmin/fmax ignore NaN, which is thereby sorted after all edges
+    np.fmin(index,n-1,out=index)
+    np.fmax(index,-1,out=index)
+    index = index.astype(np.intp)
+    index+=1
+
+    # Correct for rounding in the division; at most one bin off
+    below = x<np.take(edges,index-1,mode='clip')
+    below[index==0] = False
+    index-=below
+    above = x>=np.take(edges,index,mode='clip')
+    above[index==n] = False
+    index+=above
+
+    index[x == edges[-1]] = n-1 # Rightmost edge belongs to last bin
+    return index
+
+
+class SparseHistogram(object):
+    """Histogram holding only occupied bins, given by their flat index into the dense histogram.
+
+    Args:
+
+        - shape (list): Shape of the dense histogram
+
+        - indices (array): Sorted flat indices of the occupied bins
+
+        - values (list): List of arrays with one value per occupied bin, e.g. summed weights and counts
+
+    Histograms are summed bin by bin with + or +=, in the same order as dense histograms. Use toDense to get dense arrays.
+
+    """
+    def __init__(self,shape,indices,values):
+        self.shape = tuple(int(s) for s in shape)
+        self.indices = np.asarray(indices,dtype=np.int64)
+        self.values = [np.asarray(v) for v in values]
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self,index):
+        return self.values[index]
+
+    @property
+    def occupied(self):
+        """Number of occupied bins"""
+        return len(self.indices)
+
+    @property
+    def nbytes(self):
+        return self.indices.nbytes+np.sum([v.nbytes for v in self.values],dtype=int)
+
+    def __add__(self,other):
+        if not isinstance(other,SparseHistogram):
+            return NotImplemented
+        if self.shape != other.shape or len(self.values) != len(other.values):
+            raise AttributeError('Histograms of shape {} with {} values and shape {} with {} values cannot be added.'.format(self.shape,len(self.values),other.shape,len(other.values)))
+        indices = np.union1d(self.indices,other.indices)
+        selfPosition = np.searchsorted(indices,self.indices)
+        otherPosition = np.searchsorted(indices,other.indices)
+        values = []
+        for a,b in zip(self.values,other.values):
+            value = np.zeros(len(indices),dtype=np.result_type(a,b))
+            value[selfPosition] = a
+            value[otherPosition] += b
+            values.append(value)
+        return SparseHistogram(self.shape,indices,values)
+
+    def toDense(self,index=None,fillValue=0):
+        """Return dense histograms.
+
+        Kwargs:
+
+            - index (int): Return only values with this index, otherwise list of all (default None)
+
+            - fillValue (float): Value of empty bins (default 0)
+
+        """
+        if index is None:
+            return [self.toDense(i,fillValue=fillValue) for i in range(len(self.values))]
+        values = self.values[index]
+        dense = np.full(int(np.prod(self.shape)),fillValue,dtype=np.result_type(values,np.min_scalar_type(fillValue)) if fillValue != 0 else values.dtype)
+        dense[self.indices] = values
+        return dense.reshape(self.shape)
+
+    def __repr__(self):
+        return 'SparseHistogram(shape={}, occupied={}, values={})'.format(list(self.shape),self.occupied,len(self.values))
+
+
+histogramBlockSize = 2**16 # Number of points for which bin indices are calculated at once
+
+def _binNumber(x,edges,uniform):
+    """Bin number of x including outlier bins (0 below and len(edges) above edges)"""
+    if uniform is None:
+        # avoid np.digitize to work around gh-11022
+        Ncount = np.searchsorted(edges, x, side='right')
+
+        # Using digitize, values that fall on an edge are put in the right bin.
+        # For the rightmost bin, we want values equal to the right edge to be
+        # counted in the last bin, and not as an outlier.
+        Ncount[x == edges[-1]] -= 1
+        return Ncount
+    return uniformBinIndex(x,edges,*uniform)
+
+_fusedHistogramKernel = None # Compiled by numba on first use, False if numba is not installed
+
+def fusedHistogramKernel():
+    """Return histogram kernel compiled by numba, or None if numba is not installed. The optional numba backend is
+    imported on first use as importing it is slow compared to importing DMCpy."""
+    global _fusedHistogramKernel
+    if _fusedHistogramKernel is None:
+        try:
+            import numba
+        except ImportError:
+            _fusedHistogramKernel = False
+        else:
+            _fusedHistogramKernel = numba.njit(nogil=True)(_fusedHistogram)
+    return _fusedHistogramKernel if _fusedHistogramKernel is not False else None
+
+
+def _fusedHistogram(sample,edges,offsets,starts,steps,nbin,weights,hist): # pragma: no cover
+    N,D = sample.shape
+    W = len(weights)
+    for i in range(N):
+        xy = 0
+        for d in range(D):
+            x = sample[i,d]
+            o = offsets[d]
+            n = offsets[d+1]-o
+            if np.isnan(x):
+                index = n
+            else:
+                f = np.floor((x-starts[d])/steps[d])+1
+                if f<0:
+                    index = 0
+                elif f>n:
+                    index = n
+                else:
+                    index = int(f)
+                if index>0 and x<edges[o+index-1]:
+                    index-=1
+                elif index<n and x>=edges[o+index]:
+                    index+=1
+                if x == edges[o+n-1]:
+                    index = n-1
+            xy = xy*nbin[d]+index
+        for w in range(W):
+            hist[xy,w]+=weights[w][i]
+        hist[xy,W]+=1.0
+
+
+def histogramdd(sample, bins, weights, returnCounts = False, backend = None, sparse = False):
     """
     Restricted version of numpys multidimensional histogram function. 
 
@@ -1055,6 +1525,13 @@ def histogramdd(sample, bins, weights, returnCounts = False):
 
         - returnCounts (bool): if True return also number of entries in each bin (default False)
 
+        - backend (str): 'numba' for compiled kernel, 'numpy' or None for best available (default None)
+
+        - sparse (bool): If True return a SparseHistogram holding only occupied bins instead of list of dense histograms (default False)
+
+    For equidistant bins the bin index is found by index arithmetic instead of searching the edges, and with numba 
+    installed all weights and counts are accumulated in a single pass over the sample.
+
     """
 
     try:
@@ -1076,6 +1553,11 @@ def histogramdd(sample, bins, weights, returnCounts = False):
         # bins is an integer
         bins = D*[bins]
 
+    if not backend in [None,'numpy','numba']:
+        raise AttributeError('Provided backend "{}" not understood. Use "numpy" or "numba".'.format(backend))
+    if backend == 'numba' and fusedHistogramKernel() is None:
+        raise AttributeError('Backend "numba" requested but numba is not installed.')
+
 
     nbin = np.empty(D, int)
     edges = D*[None]
@@ -1083,26 +1565,51 @@ def histogramdd(sample, bins, weights, returnCounts = False):
         edges[i] = np.asarray(bins[i])
         nbin[i] = len(edges[i])+1
     
-
-    # Compute the bin number each sample falls into.
-    Ncount = tuple(
-        # avoid np.digitize to work around gh-11022
-        np.searchsorted(edges[i], sample[:, i], side='right')
-        for i in range(D)
-    )
-
-    # Using digitize, values that fall on an edge are put in the right bin.
-    # For the rightmost bin, we want values equal to the right edge to be
-    # counted in the last bin, and not as an outlier.
-    for i in range(D):
-        # Find which points are on the rightmost edge.
-        on_edge = (sample[:, i] == edges[i][-1])
-        # Shift these points one bin to the left.
-        Ncount[i][on_edge] -= 1
-
-    # Compute the sample indices in the flattened histogram matrix.
-    # This raises an error if the array is too large.
-    xy = np.ravel_multi_index(Ncount, nbin)
+    uniform = [uniformBins(e) for e in edges]
+    core = D*(slice(1, -1),)
+
+    kernel = None
+    if not sparse and backend != 'numpy' and all([not u is None for u in uniform]):
+        kernel = fusedHistogramKernel()
+    if not kernel is None:
+        # Weights and counts of a bin are kept next to each other in memory. Allocated here 
+        # as np.zeros only touches the memory of bins being filled
+        hist = np.zeros((nbin.prod(),len(weights)+1))
+        kernel(np.asarray(sample,dtype=float),np.concatenate(edges).astype(float),
+                        np.cumsum([0]+[len(e) for e in edges]),np.array([u[0] for u in uniform],dtype=float),
+                        np.array([u[1] for u in uniform],dtype=float),nbin,
+                        tuple([np.asarray(w,dtype=float).reshape(N) for w in weights]),hist)
+
+        histograms = [hist[:,i].reshape(nbin)[core].astype(w.dtype) for i,w in enumerate(weights)]
+        if returnCounts:
+            histograms.append(hist[:,-1].reshape(nbin)[core].astype(int))
+        return histograms
+
+    if np.prod([int(n) for n in nbin])>np.iinfo(np.intp).max:
+        raise ValueError('Histogram with {} bins is too large to be indexed.'.format(nbin))
+
+    # Compute the sample indices in the flattened histogram matrix. Done in blocks 
+    # to keep temporaries small
+    xy = np.empty(N,dtype=np.intp)
+    for start in range(0,N,histogramBlockSize):
+        block = sample[start:start+histogramBlockSize]
+        local = xy[start:start+histogramBlockSize]
+        local[:] = 0
+        for i in range(D):
+            local *= nbin[i]
+            local += _binNumber(block[:, i],edges[i],uniform[i])
+
+    if sparse:
+        # Only occupied bins are accumulated, bins of outliers are removed afterwards
+        occupied, inverse = np.unique(xy, return_inverse=True)
+        del xy
+        values = [np.bincount(inverse, w, minlength=len(occupied)).astype(w.dtype) for w in weights]
+        if returnCounts:
+            values.append(np.bincount(inverse, minlength=len(occupied)).astype(int))
+        index = np.unravel_index(occupied, nbin)
+        inside = np.all([np.logical_and(i>0,i<n-1) for i,n in zip(index,nbin)],axis=0)
+        indices = np.ravel_multi_index([i[inside]-1 for i in index], nbin-2)
+        return SparseHistogram(shape=nbin-2,indices=indices,values=[v[inside] for v in values])
 
     # Compute the number of repetitions in xy and assign it to the
     # flattened histmat.
@@ -1118,7 +1625,6 @@ def histogramdd(sample, bins, weights, returnCounts = False):
         hist = hist.astype(w.dtype)#, casting='safe')
 
         # Remove outliers (indices 0 and -1 for each dimension).
-        core = D*(slice(1, -1),)
         hist = hist[core]
         histograms.append(hist)
 
@@ -1132,12 +1638,189 @@ def histogramdd(sample, bins, weights, returnCounts = False):
         hist = hist.astype(int)#, casting='safe')
 
         # Remove outliers (indices 0 and -1 for each dimension).
-        core = D*(slice(1, -1),)
         hist = hist[core]
         histograms.append(hist)
 
     return histograms
 
+def voxelIndex(sample, bins):
+    """
+    Flat index of the bin in which each point of the sample falls, as used by histogramIndex.
+
+    Args:
+
+        - sample (n x m array): Position in m-dimensional space
+
+        - bins (m list): List of bins
+
+    Returns:
+
+        - index (n array): Index into the raveled histogram of shape [len(b)-1 for b in bins] and -1 for points outside the bins
+
+    The index is stored as int32 whenever the histogram is small enough, allowing the index of large data sets to 
+    be kept in memory and reused when the same positions are binned with different weights.
+
+    """
+    sample = np.asarray(sample)
+    if sample.ndim == 1:
+        sample = sample.reshape(-1,1)
+    N, D = sample.shape
+    if len(bins) != D:
+        raise ValueError(
+            'The dimension of bins must be equal to the dimension of the '
+            ' sample x.')
+
+    edges = [np.asarray(b) for b in bins]
+    uniform = [uniformBins(e) for e in edges]
+    shape = [len(e)-1 for e in edges]
+
+    dtype = np.int32 if np.prod([float(n) for n in shape]) <= np.iinfo(np.int32).max else np.int64
+    index = np.empty(N,dtype=dtype)
+    for start in range(0,N,histogramBlockSize):
+        block = sample[start:start+histogramBlockSize]
+        local = np.zeros(len(block),dtype=np.int64)
+        outside = np.zeros(len(block),dtype=bool)
+        for i in range(D):
+            Ncount = _binNumber(block[:, i],edges[i],uniform[i])
+            outside |= np.logical_or(Ncount == 0, Ncount > shape[i])
+            local *= shape[i]
+            local += Ncount-1
+        local[outside] = -1
+        index[start:start+histogramBlockSize] = local
+    return index
+
+def histogramIndex(index, shape, weights, returnCounts = False, sparse = False):
+    """
+    Histogram of points with bin indices precomputed by voxelIndex. Gives the same result as histogramdd of the
+    positions used to generate the index.
+
+    Args:
+
+        - index (n array): Flat bin index of each point, negative for points outside the histogram
+
+        - shape (list): Shape of histogram
+
+        - weights (list): List of weights where each entry has the length n
+
+    Kwargs:
+
+        - returnCounts (bool): if True return also number of entries in each bin (default False)
+
+        - sparse (bool): If True return a SparseHistogram holding only occupied bins instead of list of dense histograms (default False)
+
+    """
+    shape = np.asarray(shape,dtype=int)
+    index = np.asarray(index)
+    weights = [np.asarray(w) for w in weights]
+    inside = index >= 0
+    if not np.all(inside):
+        index = index[inside]
+        weights = [w[inside] for w in weights]
+
+    if sparse:
+        occupied, inverse = np.unique(index, return_inverse=True)
+        values = [np.bincount(inverse, w, minlength=len(occupied)).astype(w.dtype) for w in weights]
+        if returnCounts:
+            values.append(np.bincount(inverse, minlength=len(occupied)).astype(int))
+        return SparseHistogram(shape=shape,indices=occupied,values=values)
+
+    histograms = [np.bincount(index, w, minlength=shape.prod()).astype(w.dtype).reshape(shape) for w in weights]
+    if returnCounts:
+        histograms.append(np.bincount(index, minlength=shape.prod()).astype(int).reshape(shape))
+    return histograms
+
+class IntegrationPlan(object):
+    """Mapping of detector pixels onto 1D bins, e.g. two theta, for repeated integration of data with equal geometry.
+
+    Args:
+
+        - positions (array): Position of each pixel
+
+        - bins (array): Bin edges
+
+    Kwargs:
+
+        - widths (array): Width of each pixel. If provided, pixels are split between bins by overlap (default None)
+
+    Pixels are assigned to bins as in histogramdd, while split pixels contribute to all overlapped bins with the
+    fraction of the pixel inside the bin. Parts of pixels outside of the bins are discarded.
+
+    """
+    def __init__(self,positions,bins,widths=None):
+        positions = np.asarray(positions)
+        self.shape = positions.shape
+        self.bins = np.asarray(bins)
+        positions = positions.reshape(-1)
+        binCount = len(self.bins)-1
+
+        if widths is None:
+            self.index = voxelIndex(positions,[self.bins]).reshape(-1,1)
+            self.fraction = None
+            return
+
+        widths = np.abs(np.asarray(widths,dtype=float)).reshape(-1)
+        lower = positions-0.5*widths
+        upper = positions+0.5*widths
+        first = np.clip(np.searchsorted(self.bins,lower,side='right')-1,0,binCount-1)
+        split = int(np.ceil(np.max(widths)/np.min(np.diff(self.bins))))+1
+
+        index = first[:,np.newaxis]+np.arange(split)[np.newaxis]
+        inside = index<binCount
+        index[np.logical_not(inside)] = binCount-1
+        overlap = np.minimum(upper[:,np.newaxis],self.bins[index+1])-np.maximum(lower[:,np.newaxis],self.bins[index])
+        with np.errstate(divide='ignore',invalid='ignore'):
+            fraction = np.clip(overlap,0,None)/widths[:,np.newaxis]
+        
+        # Pixels without width are assigned as points
+        point = widths == 0
+        fraction[point] = 0.0
+        fraction[point,0] = 1.0
+        index[point,0] = voxelIndex(positions[point],[self.bins])
+
+        fraction[np.logical_not(inside)] = 0.0
+        index[np.logical_or(fraction == 0,np.logical_not(inside))] = -1
+        self.index = index.astype(np.int32)
+        self.fraction = fraction
+
+    @property
+    def nbytes(self):
+        return self.index.nbytes+(0 if self.fraction is None else self.fraction.nbytes)
+
+    def integrate(self,weights,mask=None):
+        """Sum weights of non-masked pixels into bins
+
+        Args:
+
+            - weights (list): List of arrays of shape (n,)+shape, where n is e.g. the number of scan steps
+
+        Kwargs:
+
+            - mask (array): Pixels to be left out, of same shape as weights (default None)
+
+        Returns:
+
+            - histograms (list): Summed weights in each bin
+
+        """
+        pixels = int(np.prod(self.shape))
+        weights = [np.asarray(w).reshape(-1,pixels) for w in weights]
+        shape = (weights[0].shape[0],)+self.index.shape
+        index = np.broadcast_to(self.index,shape)
+        fraction = None if self.fraction is None else np.broadcast_to(self.fraction,shape)
+        if mask is None:
+            notMasked = np.ones(shape[:2],dtype=bool)
+        else:
+            notMasked = np.logical_not(np.asarray(mask).reshape(-1,pixels))
+
+        index = index[notMasked]
+        weights = [w[notMasked] for w in weights]
+        if fraction is None:
+            return histogramIndex(index[:,0],[len(self.bins)-1],weights)
+
+        fraction = fraction[notMasked]
+        return histogramIndex(index.reshape(-1),[len(self.bins)-1],[(w[:,np.newaxis]*fraction).reshape(-1) for w in weights])
+
+
 def findOrthogonalBasis(v1,v2,v3,B):
     """Calculate an orthogonal basis from projection vectors and B matrix"""
     p1 = LengthOrder(v1)
@@ -0,0 +1,90 @@
+"""Benchmark of the 3D histogramming used by binData3D, cutQPlane and cut1D.
+
+Compares the previous searchsorted based implementation with the index arithmetic of _tools.histogramdd for 
+equidistant bins, using both the NumPy and (if installed) the numba backend.
+
+Usage:
+
+    python benchmarks/histogramdd.py --steps 600
+
+"""
+import argparse
+import time
+import sys,os
+sys.path.insert(0,os.path.abspath(os.path.join(os.path.dirname(__file__),'..')))
+
+import numpy as np
+from DMCpy import _tools
+
+
+def searchsortedHistogram(sample,bins,weights):
+    """Previous implementation: searchsorted per dimension and one bincount per weight and for counts"""
+    N, D = sample.shape
+    nbin = np.array([len(b)+1 for b in bins])
+    Ncount = tuple(np.searchsorted(bins[i], sample[:, i], side='right') for i in range(D))
+    for i in range(D):
+        Ncount[i][sample[:, i] == bins[i][-1]] -= 1
+    xy = np.ravel_multi_index(Ncount, nbin)
+    core = D*(slice(1, -1),)
+    histograms = [np.bincount(xy, w, minlength=nbin.prod()).reshape(nbin).astype(w.dtype)[core] for w in weights]
+    histograms.append(np.bincount(xy, minlength=nbin.prod()).reshape(nbin).astype(int)[core])
+    return histograms
+
+
+def timeit(function,repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter()-start)
+    return np.min(times),result
+
+
+def blockwise(histogram,blocks,weights):
+    """Accumulate histograms over A3 blocks as binData3D does for the blocks of a scan"""
+    result = None
+    for pos,w in zip(blocks,weights):
+        local = histogram(pos,w)
+        result = local if result is None else [r+l for r,l in zip(result,local)]
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark 3D histogramming of an A3 scan')
+    parser.add_argument('--steps',type=int,default=600,help='Number of A3 steps in the scan (default 600)')
+    parser.add_argument('--block',type=int,default=60,help='Number of A3 steps histogrammed at a time (default 60)')
+    parser.add_argument('--dq',type=float,default=0.03,help='Bin size in 1/AA (default 0.03)')
+    parser.add_argument('--repeats',type=int,default=3,help='Number of repetitions (default 3)')
+    args = parser.parse_args()
+
+    # Scattering vectors of a DMC A3 scan at 2.46 AA, same layout as in binData3D, i.e. sample is the transposed (3,N) array.
+    # The scan is histogrammed in blocks of A3 steps, as binData3D does, to keep the temporaries of a 128x1152x600 scan in memory
+    twoTheta,z = np.meshgrid(np.linspace(0,-132,1152)-10.0,np.linspace(-0.1,0.1,128),indexing='xy')
+    pixelPosition = np.array([-0.8*np.sin(np.deg2rad(twoTheta)),0.8*np.cos(np.deg2rad(twoTheta)),-z])
+    Ki = 2*np.pi/2.46
+    qLocal = Ki*pixelPosition/np.linalg.norm(pixelPosition,axis=0)-np.array([0.0,Ki,0.0]).reshape(3,1,1)
+    A3 = np.deg2rad(np.linspace(0,180,args.steps))
+    zero,ones = np.zeros_like(A3),np.ones_like(A3)
+    rotMat = np.array([[np.cos(A3),np.sin(A3),zero],[-np.sin(A3),np.cos(A3),zero],[zero,zero,ones]])
+    blocks = [np.einsum('jki,k...->ji...',rotMat[:,:,start:start+args.block],qLocal).reshape(3,-1).T for start in range(0,args.steps,args.block)]
+    N = np.sum([len(pos) for pos in blocks])
+
+    rng = np.random.default_rng(0)
+    monitor = np.full(len(blocks[0]),1e5)
+    weights = [[rng.poisson(2.0,size=len(pos)).astype(float),monitor[:len(pos)]] for pos in blocks]
+
+    extremes = np.array([np.min([pos.min(axis=0) for pos in blocks],axis=0),np.max([pos.max(axis=0) for pos in blocks],axis=0)]).T
+    bins = _tools.calculateBins(args.dq,args.dq,args.dq,extremes)
+    HistBins = [bins[0][:,0,0],bins[1][0,:,0],bins[2][0,0,:]]
+    print('{} points in blocks of {} steps into {} bins'.format(N,args.block,'x'.join([str(len(b)-1) for b in HistBins])))
+
+    reference, referenceResult = timeit(lambda: blockwise(lambda pos,w: searchsortedHistogram(pos,HistBins,w),blocks,weights),args.repeats)
+    print('{:<12s} {:8.3f} s'.format('searchsorted',reference))
+
+    backends = ['numpy'] if _tools.fusedHistogramKernel() is None else ['numpy','numba']
+    for backend in backends:
+        if backend == 'numba': # compile before timing
+            _tools.histogramdd(blocks[0][:10],HistBins,[w[:10] for w in weights[0]],returnCounts=True,backend=backend)
+        duration, result = timeit(lambda: blockwise(lambda pos,w: _tools.histogramdd(pos,HistBins,w,returnCounts=True,backend=backend),blocks,weights),args.repeats)
+        identical = all([np.array_equal(a,b) for a,b in zip(result,referenceResult)])
+        print('{:<12s} {:8.3f} s  speedup {:5.2f}  identical {}'.format(backend,duration,reference/duration,identical))
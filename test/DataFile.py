@@ -119,6 +119,36 @@ def test_calibration():
     assert(calibName=='None')
 
 
+def test_calibrationStore():
+    import DMCpy, pickle, tempfile
+
+    calibrationDict = {2021:{'limits':np.array([0,100]),'names':['None','deteff_21a.dat'],
+                             'None':None,'deteff_21a.dat':np.linspace(0.5,1.5,128*1152).reshape(128,1152)}}
+    
+    oldLocations = DMCpy.calibrationLocations
+    with tempfile.TemporaryDirectory() as folder:
+        calibrationFile = os.path.join(folder,'calibrationDict.dat')
+        with open(calibrationFile,'wb') as f:
+            pickle.dump(calibrationDict,f)
+        DMCpy.calibrationLocations = [calibrationFile]
+        try:
+            store = DataFile.CalibrationStore(folder=os.path.join(folder,'store'))
+            assert(store.limits(2018) is None)
+            assert(store.calibration(2021,'None') is None)
+
+            calibration = store.calibration(2021,'deteff_21a.dat')
+            assert(np.all(calibration == calibrationDict[2021]['deteff_21a.dat']))
+            assert(not calibration.flags.writeable)
+            assert(store.calibration(2021,'deteff_21a.dat') is calibration) # Shared between callers
+
+            # A new store reuses the converted calibrations
+            store2 = DataFile.CalibrationStore(folder=os.path.join(folder,'store'))
+            assert(np.all(store2.calibration(2021,'deteff_21a.dat') == calibration))
+            del calibration, store, store2
+        finally:
+            DMCpy.calibrationLocations = oldLocations
+
+
 def test_decoding():
     dataFile = os.path.join('data','dmc2021n{:06d}.hdf'.format(494))
 
@@ -194,6 +224,27 @@ def test_changeOfParameters():
     
 
 
+def test_iterChunks():
+    df = DataFile.loadDataFile(os.path.join('data','dmc2021n{:06d}.hdf'.format(565)))
+
+    blocks = list(df.iterChunks())
+    assert(len(blocks) == 1) # Powder files consist of a single step
+
+    sl,counts,background,monitor,mask = blocks[0]
+    assert(np.all(counts == df.counts[sl]))
+    assert(background is None)
+    assert(np.all(monitor == df.monitor))
+    assert(mask.shape == counts.shape)
+
+    # Slices of single crystal scan do not depend on counts being held in memory
+    df = DataFile.loadDataFile(os.path.join('data','dmc2021n{:06d}.hdf'.format(494)))
+    slices = df.chunkSlices()
+    assert(slices[0].start == 0 and slices[-1].stop == len(df))
+    df._counts = df.counts
+    assert(df.chunkSlices() == slices)
+    assert(df.chunkSlices(steps=10) == DataFile.loadDataFile(os.path.join('data','dmc2021n{:06d}.hdf'.format(494))).chunkSlices(steps=10))
+
+
 def test_shallow_read():
     parameters = ['startTime','twoThetaPosition','wavelength','sampleName']
 
@@ -213,3 +264,182 @@ def test_shallow_read():
         assert(d['sampleName'] == sampleNames[I])
         
 
+
+
+def test_readMetadata():
+    import h5py as hdf
+    from DMCpy import FileStructure
+    files = _tools.fileListGenerator('494,565',folder=r'data',year=2021)
+
+    for file in files:
+        with hdf.File(file,mode='r') as f:
+            metadata = FileStructure.readMetadata(f)
+        # Both files share layout and all positions are only resolved once
+        df = DataFile.loadDataFile(file)
+        for parameter in ['startTime','wavelength','A3','monitor','time']:
+            assert(parameter in metadata)
+        assert(np.isclose(metadata['wavelength'].mean(),df.wavelength))
+        assert(np.all(metadata['monitor'] == df.monitor))
+    assert(len(FileStructure._metadataLayouts)>0)
+
+
+def test_metadataIndex():
+    import tempfile
+    from DMCpy import FileStructure
+    parameters = ['startTime','twoThetaPosition','wavelength','sampleName','A3','name']
+
+    files = _tools.fileListGenerator('494,565',folder=r'data',year=2021)
+    direct = DataFile.shallowRead(files,parameters)
+
+    with tempfile.TemporaryDirectory() as folder:
+        index = FileStructure.MetadataIndex(folder=folder)
+        index.batchSize = 1 # Files are looked up in several queries
+        first = index.read(files) # Files are opened and indexed
+        second = index.read(files) # Files are looked up in the index
+        assert(len(os.listdir(folder)) == 1)
+        for f,s in zip(first,second):
+            assert(f.keys() == s.keys())
+            assert(np.all(f['A3'] == s['A3']))
+
+        oldIndex = FileStructure.metadataIndex
+        FileStructure.metadataIndex = index
+        try:
+            indexed = DataFile.shallowRead(files,parameters,useIndex=True)
+        finally:
+            FileStructure.metadataIndex = oldIndex
+
+    for d,i in zip(direct,indexed):
+        for p in parameters:
+            assert(np.all(d[p] == i[p]))
+
+
+def test_geometryCache():
+    df1 = DataFile.loadDataFile(os.path.join('data','dmc2021n000494.hdf'))
+    df2 = DataFile.loadDataFile(os.path.join('data','dmc2021n000494.hdf'))
+
+    # Same detector setup shares the geometry
+    assert(df1.pixelPosition is df2.pixelPosition)
+    assert(df1.kf is df2.kf)
+    assert(not df1.pixelPosition.flags.writeable)
+
+    Q = df1.Q.copy()
+    with df1.batchUpdate():
+        df1.wavelength = 2*df1.wavelength
+        assert(np.all(df1.Q == Q)) # Recalculation is deferred
+    assert(np.allclose(df1.Q,0.5*Q))
+    assert(not df1.kf is df2.kf)
+
+
+def test_perPixelAngles():
+    df = DataFile.loadDataFile(os.path.join('data','dmc2021n000494.hdf'))
+
+    full = df.q[None]
+    phi = np.rad2deg(np.arctan2(full[2],np.linalg.norm(full[:2],axis=0)))
+    assert(df.phi.shape == df.countShape)
+    assert(np.allclose(df.phi,phi))
+    assert(df.phi.strides[0] == 0) # broadcasted, not repeated for each A3 step
+
+    correctedTwoTheta = 2.0*np.rad2deg(np.arcsin(df.wavelength*np.linalg.norm(full,axis=0)/(4*np.pi)))
+    assert(np.allclose(df.correctedTwoTheta,correctedTwoTheta))
+    assert(df.correctedTwoTheta.strides[0] == 0)
+
+
+def test_lazyQ():
+    A3 = np.linspace(0,90,13)
+    zero,ones = np.zeros_like(A3),np.ones_like(A3)
+    rotMat = np.array([[np.cos(np.deg2rad(A3)),np.sin(np.deg2rad(A3)),zero],[-np.sin(np.deg2rad(A3)),np.cos(np.deg2rad(A3)),zero],[zero,zero,ones]])
+    q_temp = np.random.rand(3,4,5)
+
+    q = DataFile.lazyQ(rotMat,q_temp)
+    full = q[None]
+    assert(full.shape == (3,len(A3),4,5))
+    assert(q[None] is full) # Last evaluation is kept
+    assert(np.allclose(q[2:5],full[:,2:5]))
+
+    blocks = list(q.blocks(5))
+    assert([sl.stop-sl.start for sl,_ in blocks] == [5,5,3])
+    assert(np.allclose(np.concatenate([b for _,b in blocks],axis=1),full))
+
+    ROT = _tools.rotMatrix(np.array([1.0,0.2,0.3]),np.array(25.0))
+    assert(np.allclose(q.project(ROT,slice(3,7)),np.einsum('ij,j...->i...',ROT,full[:,3:7])))
+
+    q32 = DataFile.lazyQ(rotMat,q_temp,dtype=np.float32)
+    assert(q32[None].dtype == np.float32)
+    assert(np.allclose(q32[None],full,atol=1e-6))
+
+    maxBytes = DataFile.qCache.maxBytes
+    DataFile.qCache.maxBytes = full.nbytes-1 # Evaluated q is kept within the budget shared by all files
+    try:
+        DataFile.qCache.evict()
+        assert(DataFile.qCache.nbytes <= DataFile.qCache.maxBytes)
+        assert(not q[None] is q[None])
+    finally:
+        DataFile.qCache.maxBytes = maxBytes
+
+
+def test_qDtype():
+    df = DataFile.loadDataFile(os.path.join('data','dmc2021n000494.hdf'))
+    assert(df.qDtype is None and df.q[0].dtype == np.float64)
+
+    df.qDtype = np.float32 # Applied to already calculated q
+    assert(df.q.dtype == np.float32 and df.q[0].dtype == np.float32)
+
+    df32 = DataFile.loadDataFile(os.path.join('data','dmc2021n000494.hdf'),qDtype=np.float32) # Applied at load time
+    assert(df32.q[0].dtype == np.float32)
+
+
+def test_lazyQ_extremes():
+    A3 = np.concatenate([np.linspace(-170,-60,40),np.linspace(120,179,17)])
+    zero,ones = np.zeros_like(A3),np.ones_like(A3)
+    rotMat = np.array([[np.cos(np.deg2rad(A3)),np.sin(np.deg2rad(A3)),zero],[-np.sin(np.deg2rad(A3)),np.cos(np.deg2rad(A3)),zero],[zero,zero,ones]])
+    q_temp = np.random.normal(size=(3,16,20))
+    ROT = _tools.rotMatrix(np.array([1.0,0.2,0.3]),np.array(25.0))
+
+    for dtype in [None,np.float32]:
+        q = DataFile.lazyQ(rotMat,q_temp,dtype=dtype)
+        for sl in [None,slice(5,30)]:
+            full = q[sl].reshape(3,-1) # Identical, not only close
+            assert(np.array_equal(q.extremes(sl=sl),[np.min(full,axis=1),np.max(full,axis=1)]))
+            full = q.project(ROT,sl).reshape(3,-1)
+            assert(np.array_equal(q.extremes(ROT,sl=sl),[np.min(full,axis=1),np.max(full,axis=1)]))
+
+    tilted = DataFile.lazyQ(np.einsum('ij,jkn->ikn',ROT,rotMat),q_temp) # Not around vertical axis
+    full = tilted[None].reshape(3,-1)
+    assert(np.array_equal(tilted.extremes(steps=7),[np.min(full,axis=1),np.max(full,axis=1)]))
+
+
+def test_countsCache():
+    cache = DataFile.ArrayCache(maxBytes=3*800)
+
+    loads = []
+    def loader(value):
+        def load():
+            loads.append(value)
+            return np.full(100,value,dtype=float) # 800 bytes
+        return load
+
+    a = cache.get('fileA','counts',loader(1))
+    assert(cache.get('fileA','counts',loader(1)) is a) # second access is served from memory
+    assert(loads == [1])
+    assert(not a.flags.writeable)
+
+    cache.pin('fileA')
+    cache.get('fileB','counts',loader(2))
+    cache.get('fileC','counts',loader(3))
+    cache.get('fileD','counts',loader(4)) # Evicts least recently used unpinned entry, i.e. fileB
+    assert(('fileA','counts') in cache)
+    assert(not ('fileB','counts') in cache)
+    assert(cache.nbytes == 3*800)
+
+    cache.release('fileA')
+    cache.get('fileE','counts',loader(5)) # fileA is now the oldest entry
+    assert(not ('fileA','counts') in cache)
+
+    cache.invalidate('fileE')
+    assert(not ('fileE','counts') in cache)
+    assert(cache.nbytes == 2*800)
+
+    # Entries larger than the budget are returned but not stored
+    big = cache.insert('fileF','counts',np.zeros(1000))
+    assert(big.shape == (1000,))
+    assert(not ('fileF','counts') in cache)
@@ -60,6 +60,124 @@ def test_load():
     del ds[-1]
     assert(len(ds)==length+len(dataFiles)+1)
 
+def test_load_parallel():
+
+    fileNumbers = [494,494,494]
+    dataFiles = [os.path.join('data','dmc2021n{:06d}.hdf'.format(no)) for no in fileNumbers]
+
+    ds = DataSet.DataSet(dataFiles)
+    dsParallel = DataSet.DataSet(dataFiles,workers=2)
+
+    assert(len(dsParallel) == len(ds))
+    for df,dfParallel in zip(ds,dsParallel):
+        assert(df.fileName == dfParallel.fileName)
+        assert(np.all(df.counts == dfParallel.counts))
+        # Geometry is shared with the serially loaded files instead of transferred as copies
+        assert(dfParallel.pixelPosition is df.pixelPosition)
+        assert(dfParallel.Q.strides[0] == 0 and np.all(df.Q == dfParallel.Q))
+        assert(np.all(df.mask == dfParallel.mask))
+
+    # Errors are reported as for serial loading
+    try:
+        DataSet.DataSet(dataFiles+['wrongFile.hdf'],workers=2)
+        assert False
+    except FileNotFoundError:
+        assert True
+
+
+def test_binData3D_cache():
+    import tempfile
+    from DMCpy import _tools
+
+    dataFiles = [os.path.join('data','dmc2021n{:06d}.hdf'.format(no)) for no in [494]]
+    ds = DataSet.DataSet(dataFiles)
+
+    intensities,bins,errors = ds.binData3D(0.1,0.1,0.1,rlu=False)
+
+    with tempfile.TemporaryDirectory() as folder:
+        oldFolder = _tools.volumeStore.folder
+        _tools.volumeStore.folder = folder
+        try:
+            first = ds.binData3D(0.1,0.1,0.1,rlu=False,cache=True) # Binned and stored
+            assert(len(os.listdir(folder)) == 1)
+            second = ds.binData3D(0.1,0.1,0.1,rlu=False,cache=True) # Read from volume
+            assert(len(os.listdir(folder)) == 1)
+
+            ds[0].mask[0,0,0] = not ds[0].mask[0,0,0] # New mask gives new volume
+            ds.binData3D(0.1,0.1,0.1,rlu=False,cache=True)
+            assert(len(os.listdir(folder)) == 2)
+
+            with _tools.BinnedVolume(os.path.join(folder,os.listdir(folder)[0])) as volume:
+                assert(volume.names == ['intensity','error'])
+                assert(volume['error'][:,:,0].shape == volume.bins.shape[:2])
+            assert(isinstance(second[0],np.memmap)) # Not read into memory
+        finally:
+            _tools.volumeStore.folder = oldFolder
+
+    for result in [first,second]:
+        assert(result[1] == bins)
+        assert(np.array_equal(result[0],intensities,equal_nan=True))
+        assert(np.array_equal(result[2],errors,equal_nan=True))
+
+
+def test_binData3D_sparse():
+
+    dataFiles = [os.path.join('data','dmc2021n{:06d}.hdf'.format(no)) for no in [494]]
+    ds = DataSet.DataSet(dataFiles)
+
+    intensities,bins,errors = ds.binData3D(0.05,0.05,0.05,rlu=False)
+    sparseIntensities,sparseBins,sparseErrors = ds.binData3D(0.05,0.05,0.05,rlu=False,sparse=True)
+
+    assert(bins == sparseBins)
+    assert(np.array_equal(intensities,sparseIntensities.toDense(0,fillValue=np.nan),equal_nan=True))
+    assert(np.array_equal(errors,sparseErrors.toDense(0,fillValue=np.nan),equal_nan=True))
+
+    try:
+        ds.binData3D(0.05,0.05,0.05,rlu=False,sparse=True,cache=True)
+        assert False
+    except AttributeError:
+        assert True
+
+
+def test_binData3D_voxelIndexCache():
+
+    dataFiles = [os.path.join('data','dmc2021n{:06d}.hdf'.format(no)) for no in [494]]
+    ds = DataSet.DataSet(dataFiles)
+
+    DataSet.voxelIndexCache.clear()
+    intensities,bins,errors = ds.binData3D(0.05,0.05,0.05,rlu=False)
+    entries = len(DataSet.voxelIndexCache) # Only position extremes without cacheIndex
+    intensitiesIndex,binsIndex,errorsIndex = ds.binData3D(0.05,0.05,0.05,rlu=False,cacheIndex=True)
+    assert(len(DataSet.voxelIndexCache)>entries)
+    assert(np.array_equal(intensities,intensitiesIndex,equal_nan=True))
+
+    ds[0].mask[:,:,:10] = True # Index tables are independent of mask
+    intensitiesCached,binsCached,errorsCached = ds.binData3D(0.05,0.05,0.05,rlu=False,cacheIndex=True)
+    DataSet.voxelIndexCache.clear()
+    intensitiesNew,binsNew,errorsNew = ds.binData3D(0.05,0.05,0.05,rlu=False)
+
+    assert(bins == binsCached)
+    assert(np.array_equal(intensitiesCached,intensitiesNew,equal_nan=True))
+    assert(np.array_equal(errorsCached,errorsNew,equal_nan=True))
+
+
+def test_binData3D_parallel():
+
+    fileNumbers = [494,494]
+    dataFiles = [os.path.join('data','dmc2021n{:06d}.hdf'.format(no)) for no in fileNumbers]
+
+    ds = DataSet.DataSet(dataFiles)
+
+    intensities,bins,errors = ds.binData3D(0.1,0.1,0.1,rlu=False,steps=10)
+    intensitiesParallel,binsParallel,errorsParallel = ds.binData3D(0.1,0.1,0.1,rlu=False,steps=10,workers=2)
+    intensitiesThree,_,_ = ds.binData3D(0.1,0.1,0.1,rlu=False,steps=10,workers=3)
+
+    assert(bins == binsParallel)
+    assert(np.array_equal(intensities,intensitiesParallel,equal_nan=True)) # Identical, not only close
+    assert(np.array_equal(errors,errorsParallel,equal_nan=True))
+    assert(np.array_equal(intensities,intensitiesThree,equal_nan=True)) # Independent of number of workers
+
+
 def test_plot():
 
     fileNumbers = [565]
@@ -83,7 +201,51 @@ def test_plot():
     assert(np.all(np.isclose(intensity,intensity2,equal_nan=True)))
     assert(np.all(np.isclose(error,error2,equal_nan=True)))
     assert(np.all(np.isclose(monitor,monitor2)))
-    
+
+
+def test_sumDetector_blocks():
+    fileNumbers = [494,494]
+    dataFiles = [os.path.join('data','dmc2021n{:06d}.hdf'.format(no)) for no in fileNumbers]
+
+    ds = DataSet.DataSet(dataFiles)
+    ds.generateMask(maxAngle=3)
+    twoThetaBins = np.linspace(10,120,221)
+
+    bins, intensity, error, monitor = ds.sumDetector(twoThetaBins=twoThetaBins)
+
+    # Compare to binning of all pixels at once
+    notMasked = [np.logical_not(df.mask) for df in ds]
+    twoTheta = np.abs(np.concatenate([np.broadcast_to(df.correctedTwoTheta,df.countShape)[m] for df,m in zip(ds,notMasked)]))
+    counts = np.concatenate([df.counts[m] for df,m in zip(ds,notMasked)])
+    monitors = np.concatenate([(df.monitor.reshape(-1,1,1)*df.normalization)[m] for df,m in zip(ds,notMasked)])
+
+    summedCounts,_ = np.histogram(twoTheta,bins=twoThetaBins,weights=counts)
+    summedMonitor,_ = np.histogram(twoTheta,bins=twoThetaBins,weights=monitors)
+
+    assert(np.all(bins == twoThetaBins))
+    assert(np.allclose(monitor,summedMonitor))
+    assert(np.allclose(intensity,summedCounts/summedMonitor,equal_nan=True))
+
+
+def test_reduceSeries():
+    fileNumbers = [494,565]
+    dataFiles = [os.path.join('data','dmc2021n{:06d}.hdf'.format(no)) for no in fileNumbers]
+
+    bins,intensity,error,monitor,metadata = DataSet.reduceSeries(dataFiles,useMask=True)
+    assert(intensity.shape == (len(dataFiles),len(bins)-1))
+    assert(error.shape == intensity.shape and monitor.shape == intensity.shape)
+    assert(metadata['fileName'] == [os.path.split(f)[-1] for f in dataFiles])
+    assert(len(metadata['temperature']) == len(dataFiles))
+
+    # Each row is the reduction of the single file
+    ds = DataSet.DataSet(dataFiles[1])
+    _,singleIntensity,singleError,singleMonitor = ds.reducePowder(bins=bins,useMask=True)
+    assert(np.array_equal(intensity[1],singleIntensity,equal_nan=True))
+    assert(np.array_equal(monitor[1],singleMonitor))
+
+    parallel = DataSet.reduceSeries(dataFiles,useMask=True,workers=2)
+    assert(np.array_equal(parallel[1],intensity,equal_nan=True))
+
 
 def test_2d():
     fileNumbers = [494,494]
@@ -170,6 +332,127 @@ def test_export_xye_format(folder='data'):
 
 
 
+def test_exportPowder(folder='data'):
+    import tempfile
+    dataFiles = [os.path.join(folder,'dmc2021n{:06d}.hdf'.format(no)) for no in [565]]
+
+    with tempfile.TemporaryDirectory() as outFolder:
+        # Reference exported separately for each variant
+        ds = DataSet.DataSet(dataFiles)
+        for useMask in [False,True]:
+            for hourNormalization in [False,True]:
+                ds.export_PSI_format(addTitle="reference",outFolder=outFolder,useMask=useMask,hourNormalization=hourNormalization)
+                ds.export_xye_format(addTitle="reference",outFolder=outFolder,useMask=useMask,hourNormalization=hourNormalization)
+
+        ds = DataSet.DataSet(dataFiles)
+        ds.exportPowder(PSI=True,xye=True,onlyNorm=False,addTitle="combined",outFolder=outFolder)
+
+        for fileName in os.listdir(outFolder):
+            if not "reference" in fileName:
+                continue
+            with open(os.path.join(outFolder,fileName)) as f:
+                reference = f.read()
+            with open(os.path.join(outFolder,fileName.replace('reference','combined'))) as f:
+                assert(f.read() == reference)
+
+
+def test_formatLines():
+    values = np.concatenate([np.random.normal(0,1e4,size=95),[np.nan,-0.0,0.5,1.5,np.nan]])
+    lines = values.reshape(-1,10)
+
+    # Identical to formatting value by value
+    assert(DataSet._formatLines(values,'%6.0f.',10,prefix=' ') == '\n'.join([' '+' '.join(["{:6.0f}.".format(x) for x in line]) for line in lines]))
+    values = values[:-3] # Last line is shorter
+    assert(DataSet._formatLines(values,'%7.1f',10,prefix=' ') == '\n'.join([' '+' '.join(["{:7.1f}".format(x) for x in values[i:i+10]]) for i in range(0,len(values),10)]))
+
+    import io
+    data = np.random.normal(size=(7,3))
+    buffer = io.StringIO()
+    np.savetxt(buffer,data,delimiter='  ')
+    assert(DataSet._formatLines(data,'%.18e',3,separator='  ')+'\n' == buffer.getvalue())
+
+
+def test_readPSI():
+    import tempfile
+    # 12 points over two lines, last error digit and a nan error within the second line
+    intensity = np.arange(1,13,dtype=float)
+    err = np.array([1.1,2.2,3.3,4.4,5.5,6.6,7.7,8.8,9.9,12.3,4.0,np.nan])
+    lines = ['DMC, sample, title\n',"lambda=  2.45000, T=   1.500, dT=  0.000, Date='2021'\n",
+             '   0.000   0.500   5.500  100000., sample="sample"\n',
+             DataSet._formatLines(np.concatenate([intensity,8*[np.nan]]).reshape(-1,10),'%6.0f.',10,prefix=' ').replace('nan.','    ')+'\n',
+             DataSet._formatLines(np.concatenate([err,8*[np.nan]]).reshape(-1,10),'%7.1f',10,prefix=' ')+'\n',
+             "Filelist='dmc:2021:1'\n"]
+
+    with tempfile.TemporaryDirectory() as outFolder:
+        with open(os.path.join(outFolder,'first.dat'),'w') as f:
+            f.write(''.join(lines))
+        
+        info,readIntensity,readErr,paramLines = DataSet._readPSI(os.path.join(outFolder,'first.dat'))
+        assert(np.all(readIntensity == intensity))
+        assert(np.allclose(readErr,err,equal_nan=True))
+        assert(paramLines == lines[-1:])
+
+        DataSet.subtract_PSI('first','first',outFile='difference',folder=outFolder,outFolder=outFolder)
+        _,subtractedIntensity,subtractedErr,_ = DataSet._readPSI(os.path.join(outFolder,'difference.dat'))
+
+    assert(len(subtractedIntensity) == len(intensity))
+    assert(np.all(subtractedIntensity == 0))
+    assert(np.allclose(subtractedErr,np.sqrt(2)*err,atol=0.1,equal_nan=True))
+
+
+def test_subtract_PSI_difference(folder='data'):
+    import tempfile
+    dataFiles = [os.path.join(folder,'dmc2021n{:06d}.hdf'.format(no)) for no in [565]]
+
+    with tempfile.TemporaryDirectory() as outFolder:
+        ds = DataSet.DataSet(dataFiles)
+        ds.export_PSI_format(outFile='first',outFolder=outFolder)
+        ds.export_PSI_format(outFile='second',outFolder=outFolder)
+        DataSet.subtract_PSI('first','second',outFile='difference',folder=outFolder,outFolder=outFolder)
+
+        _,intensity,err,_ = DataSet._readPSI(os.path.join(outFolder,'first.dat'))
+        _,subtractedIntensity,subtractedErr,_ = DataSet._readPSI(os.path.join(outFolder,'difference.dat'))
+
+    assert(len(subtractedIntensity) == len(intensity))
+    assert(np.all(subtractedIntensity == 0))
+    assert(np.allclose(subtractedErr,np.sqrt(2)*err,atol=0.1,equal_nan=True)) # Last value of each line is kept
+
+def test_export_npz_format(folder='data'):
+    import tempfile
+    dataFiles = [os.path.join(folder,'dmc2021n{:06d}.hdf'.format(no)) for no in [565]]
+
+    with tempfile.TemporaryDirectory() as outFolder:
+        ds = DataSet.DataSet(dataFiles)
+        reduction = ds.reducePowder()
+        ds.export_npz_format(outFile='first',outFolder=outFolder,reduction=reduction)
+        ds.export_npz_format(outFile='second',outFolder=outFolder,hourNormalization=True)
+
+        bins,intensity,err,monitor,metadata = DataSet.loadReducedPowder('first.npz',folder=outFolder)
+
+        assert(np.all(bins == reduction[0]))
+        assert(np.allclose(intensity,reduction[1]*metadata['scale'],equal_nan=True))
+        assert(np.allclose(err,reduction[2]*metadata['scale'],equal_nan=True))
+        assert(np.all(monitor == reduction[3]))
+        assert(metadata['fileList'] == ['dmc2021n000565.hdf'])
+        assert(metadata['year'] == 2021 and metadata['fileNumbers'] == '565')
+        assert(metadata['useMask'] is False and np.isnan(metadata['maxAngle']))
+
+        DataSet.subtract('first','second',PSI=False,xye=False,npz=True,outFile='difference',folder=outFolder,outFolder=outFolder)
+        _,subtractedIntensity,subtractedErr,_,subtractedMetadata = DataSet.loadReducedPowder('difference',folder=outFolder)
+
+        bins,intensity,_,_,seriesMetadata = DataSet.loadReducedSeries(['first','second'],folder=outFolder)
+        _,_,_,_,reducedMetadata = DataSet.reduceSeries(dataFiles)
+
+    assert(np.allclose(np.nan_to_num(subtractedIntensity),0.0,atol=1e-6*np.nanmax(np.abs(intensity))))
+    assert(np.allclose(subtractedErr,np.sqrt(2)*err,equal_nan=True))
+    assert(subtractedMetadata['subtractedFileList'] == ['dmc2021n000565.hdf'])
+    assert(intensity.shape == (2,len(bins)-1))
+    assert(sorted(seriesMetadata.keys()) == sorted(reducedMetadata.keys())) # Same metadata as reduceSeries
+    assert(seriesMetadata['fileName'] == 2*reducedMetadata['fileName'])
+    for key in ['temperature','magneticField','electricField','time']:
+        assert(np.array_equal(seriesMetadata[key],np.repeat(reducedMetadata[key],2),equal_nan=True))
+
+
 def test_add():
     
     DataSet.add(565,566,outFile='test_add',folder='data')
@@ -270,6 +553,37 @@ def test_subtract():
     os.remove("test_subtract.dat")
     os.remove("test_subtract.xye")
 
+def test_exportWatcher():
+    import tempfile, shutil
+    with tempfile.TemporaryDirectory() as folder:
+        watcher = DataSet.ExportWatcher(folder,outFolder=folder)
+        assert(watcher.update() == [])
+
+        shutil.copy(os.path.join('data','dmc2021n000494.hdf'),folder)
+        assert(len(watcher.snapshot()) == 1)
+        assert(watcher.update() == []) # Sample name is empty and file is not exported
+        assert(len(watcher.files) == 1)
+
+        # Files outside of the file number range are ignored
+        watcher = DataSet.ExportWatcher(folder,start=495,outFolder=folder)
+        assert(len(watcher.snapshot()) == 0)
+
+
+def test_exportWatcher_failing():
+    import tempfile, warnings
+    with tempfile.TemporaryDirectory() as folder:
+        watcher = DataSet.ExportWatcher(folder,outFolder=folder)
+        # Missing title or sample name and a failing export do not stop the watcher
+        watcher.groups = {('sample',None):{os.path.join(folder,'dmc2021n000001.hdf')},('sample','title'):{os.path.join(folder,'dmc2021n000002.hdf')},
+                          (None,'title'):{os.path.join(folder,'dmc2021n000003.hdf')}}
+        watcher.failed = set(watcher.groups.keys())
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            assert(watcher.update() == [])
+        assert(len(caught) == 2)
+        assert(watcher.failed == set([('sample',None),('sample','title')])) # Retried at next update
+
+
 def test_updateDataFileParameters():
 
 
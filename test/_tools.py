@@ -33,4 +33,166 @@ def test_roundPower():
 
     assert(_tools.roundPower(10.09) == -1)
 
-    assert(_tools.roundPower(1.09) == 0)
\ No newline at end of file
+    assert(_tools.roundPower(1.09) == 0)
+
+def test_histogramdd():
+    rng = np.random.default_rng(10)
+    sample = rng.uniform(-1.2,1.2,size=(2000,3))
+    bins = [np.linspace(-1,1,11),np.linspace(-0.5,1.0,7),np.array([-1.0,-0.2,0.1,0.9])] # last is not equidistant
+    sample[:300,0] = rng.choice(bins[0],300) # points on the edges
+    sample[5,1] = np.nan
+    weights = [rng.uniform(0,1,2000),np.ones(2000,dtype=np.float32)]
+
+    assert(not _tools.uniformBins(bins[0]) is None)
+    assert(_tools.uniformBins(bins[2]) is None)
+
+    backends = ['numpy'] if _tools.fusedHistogramKernel() is None else ['numpy','numba']
+    for uniformBins in [bins[:2],bins]:
+        for backend in backends:
+            histograms = _tools.histogramdd(sample[:,:len(uniformBins)],bins=uniformBins,weights=weights,returnCounts=True,backend=backend)
+            reference = [np.histogramdd(sample[:,:len(uniformBins)],bins=uniformBins,weights=w)[0] for w in weights]+[np.histogramdd(sample[:,:len(uniformBins)],bins=uniformBins)[0]]
+            assert(histograms[1].dtype == np.float32)
+            assert(histograms[2].dtype == int)
+            for hist,ref in zip(histograms,reference):
+                assert(np.allclose(hist,ref))
+
+    try:
+        _tools.histogramdd(sample,bins=bins,weights=weights,backend='fortran')
+        assert False
+    except AttributeError:
+        assert True
+
+
+def test_regularGrid():
+    extremes = np.array([[-1.3,2.1],[0.2,3.3],[-0.1,0.12]])
+    grid = _tools.calculateBins(0.05,0.07,0.03,extremes)
+    assert(isinstance(grid,_tools.RegularGrid))
+
+    # Edges agree with the full 3D meshes
+    centers = [np.linspace(mi,ma,n) for (mi,ma),n in zip(extremes,grid.shape)]
+    meshes = _tools.calculateGrid3D(*np.meshgrid(*centers,indexing='ij'))
+    for mesh,gridMesh in zip(meshes,grid):
+        assert(gridMesh.shape == mesh.shape)
+        assert(np.allclose(gridMesh,mesh))
+        assert(gridMesh.strides.count(0) == 2) # Only a view of the 1D edges
+
+    for center,expected in zip(grid.centers,centers):
+        assert(np.allclose(center,expected))
+
+    # Binning with the grid equals binning with the meshes
+    pos = np.random.uniform(extremes[:,0],extremes[:,1],size=(1000,3)).T
+    data = np.random.rand(1000)
+    gridBinned,_ = _tools.binData3D(0.05,0.07,0.03,pos,data,bins=grid)
+    meshBinned,_ = _tools.binData3D(0.05,0.07,0.03,pos,data,bins=list(meshes))
+    for a,b in zip(gridBinned,meshBinned):
+        assert(np.allclose(a,b))
+
+
+def test_sparseHistogram():
+    rng = np.random.default_rng(11)
+    bins = [np.linspace(-1,1,21),np.linspace(-1,1,31),np.linspace(0,1,5)]
+    samples = [rng.normal(0,0.3,size=(500,3)) for _ in range(2)] # partly outside of bins
+    weights = [[rng.uniform(0,1,500),np.ones(500,dtype=np.float32)] for _ in range(2)]
+
+    dense = [_tools.histogramdd(s,bins=bins,weights=w,returnCounts=True) for s,w in zip(samples,weights)]
+    sparse = [_tools.histogramdd(s,bins=bins,weights=w,returnCounts=True,sparse=True) for s,w in zip(samples,weights)]
+
+    for d,s in zip(dense,sparse):
+        assert(s.shape == d[0].shape)
+        assert(s.occupied == np.sum(d[-1]>0))
+        for D,S in zip(d,s.toDense()):
+            assert(D.dtype == S.dtype)
+            assert(np.array_equal(D,S))
+
+    total = sparse[0]+sparse[1]
+    for D0,D1,S in zip(dense[0],dense[1],total.toDense()):
+        assert(np.array_equal(D0+D1,S))
+
+    filled = total.toDense(0,fillValue=np.nan)
+    assert(np.all(np.isnan(filled[dense[0][-1]+dense[1][-1]==0])))
+
+
+def test_voxelIndex():
+    rng = np.random.default_rng(13)
+    bins = [np.linspace(-1,1,21),np.array([-1.0,-0.5,0.0,0.1,0.7,1.0]),np.linspace(0,1,5)] # middle bins not equidistant
+    sample = rng.normal(0,0.4,size=(1000,3)) # partly outside of bins
+    sample[:5] = [b[-1] for b in bins] # Rightmost edges belong to last bin
+    weights = [rng.uniform(0,1,1000),np.ones(1000,dtype=np.float32)]
+
+    index = _tools.voxelIndex(sample,bins)
+    assert(index.dtype == np.int32)
+    assert(np.all(index[:5] == np.prod([len(b)-1 for b in bins])-1))
+
+    inside = np.all([np.logical_and(s>=b[0],s<=b[-1]) for s,b in zip(sample.T,bins)],axis=0)
+    assert(np.array_equal(index<0,np.logical_not(inside)))
+
+    dense = _tools.histogramdd(sample,bins=bins,weights=weights,returnCounts=True)
+    fromIndex = _tools.histogramIndex(index,[len(b)-1 for b in bins],weights=weights,returnCounts=True)
+    for D,I in zip(dense,fromIndex):
+        assert(D.dtype == I.dtype)
+        assert(np.array_equal(D,I))
+
+    sparse = _tools.histogramIndex(index,[len(b)-1 for b in bins],weights=weights,returnCounts=True,sparse=True)
+    for D,S in zip(dense,sparse.toDense()):
+        assert(np.array_equal(D,S))
+
+
+def test_integrationPlan():
+    rng = np.random.default_rng(17)
+    positions = rng.uniform(0,10,size=(4,50))
+    bins = np.linspace(1,9,33)
+    weights = [rng.uniform(0,1,size=(3,4,50)),np.ones((3,4,50))]
+    mask = rng.uniform(size=(3,4,50))<0.2
+
+    plan = _tools.IntegrationPlan(positions,bins)
+    histograms = plan.integrate(weights,mask=mask)
+    notMasked = np.logical_not(mask)
+    direct = _tools.histogramdd(np.broadcast_to(positions,mask.shape)[notMasked].reshape(-1,1),bins=[bins],weights=[w[notMasked] for w in weights])
+    for H,D in zip(histograms,direct):
+        assert(np.array_equal(H,D))
+
+    # Split pixels contribute by overlap with bins
+    single = _tools.IntegrationPlan(np.array([2.0]),bins,widths=np.array([0.6]))
+    assert(np.allclose(single.integrate([np.ones((1,1))])[0][2:6],[1/12,5/12,5/12,1/12]))
+
+    widths = np.full(positions.shape,0.3)
+    split = _tools.IntegrationPlan(positions,bins,widths=widths)
+    overlap = np.clip(np.minimum(positions+0.15,bins[-1])-np.maximum(positions-0.15,bins[0]),0,None)/0.3
+    assert(np.isclose(np.sum(split.integrate(weights)[1]),3*np.sum(overlap)))
+
+
+def test_volumeStore():
+    import tempfile
+
+    bins = _tools.RegularGrid(origin=np.zeros(3),step=np.ones(3),shape=(4,5,6))
+    grids = [np.random.rand(*bins.shape),np.arange(np.prod(bins.shape),dtype=float).reshape(bins.shape)]
+    calls = []
+    def loader():
+        calls.append(1)
+        return bins,grids
+
+    with tempfile.TemporaryDirectory() as folder:
+        store = _tools.VolumeStore(folder=folder)
+        store.get('first',['a','b'],loader) # Calculated and stored
+        storedBins,storedGrids = store.get('first',['a','b'],loader) # Mapped from the volume file
+
+        assert(len(calls) == 1)
+        assert(storedBins == bins)
+        assert(np.all([isinstance(grid,np.memmap) for grid in storedGrids]))
+        assert(np.all([np.array_equal(grid,stored) for grid,stored in zip(grids,storedGrids)]))
+
+        store.maxBytes = os.path.getsize(store.fileName('first'))
+        store.get('second',['a','b'],loader) # Least recently used volume is removed
+        assert(os.listdir(folder) == ['second.h5'])
+        assert(np.array_equal(storedGrids[1],grids[1])) # Mapped arrays stay valid
+
+        # Stored volume is used from a read-only store where the time of use cannot be updated
+        def utime(*args,**kwargs):
+            raise PermissionError('Read-only file system')
+        oldUtime = _tools.os.utime
+        _tools.os.utime = utime
+        try:
+            store.get('second',['a','b'],loader)
+        finally:
+            _tools.os.utime = oldUtime
+        assert(len(calls) == 2)